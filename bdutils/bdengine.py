@@ -9,46 +9,838 @@ import re
 import  os
 import sys
 import socket
+import selectors
+import codecs
+import json
+import fnmatch
 from datetime import datetime
+from collections import OrderedDict, deque
 import itertools
-from math import isnan
+import functools
+import threading
+import queue
+import signal
+from time import monotonic, time
+from urllib.parse import quote
+import asyncio
+from math import isnan, isfinite
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import urllib3
 import requests
+from requests.adapters import HTTPAdapter
 import ujson
 from requests_kerberos import HTTPKerberosAuth
 
 from bdutils.coreutils import gethbasedetails, gethdfsdetails, gethivedetails, getbdapplst, getlgr
 from bdutils.coreutils import BDMonException, getzkdetails, getyarndetails, getsparkdetails, getsecsettings
-from bdutils.dbops import DbOps
+from bdutils.coreutils import getenginedetails, getstoragedetails, getscheduledetails
+from bdutils.dbops import DbOps, RowBatch
+from bdutils.dbspool import DbSpool, SpoolReplayer
 
-__all__ = ['get_appmetrics']
+__all__ = ['get_appmetrics', 'run_appmetrics']
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-class _SocketConn():
-    """ Class to process jmx data for different applications """
-    def __init__(self, lgr, host, port):
-        self._host = host
-        self._port = port
+#JMX ObjectName patterns of the beans whose modelerType is a java class, not a metrics2 record name
+_JMX_CLASSES = {'sun.management.OperatingSystemImpl': ('java.lang:type=OperatingSystem',),
+                'com.sun.management.internal.OperatingSystemImpl': ('java.lang:type=OperatingSystem',),
+                'sun.management.GarbageCollectorImpl': ('java.lang:type=GarbageCollector,*',),
+                'com.sun.management.internal.GarbageCollectorExtImpl': ('java.lang:type=GarbageCollector,*',),
+                'sun.management.ThreadImpl': ('java.lang:type=Threading',),
+                'sun.management.MemoryImpl': ('java.lang:type=Memory',),
+                'sun.management.RuntimeImpl': ('java.lang:type=Runtime',),
+                'org.apache.hadoop.hdfs.server.namenode.FSNamesystem': ('Hadoop:name=FSNamesystemState,*',
+                                                                        'Hadoop:name=NameNodeInfo,*',
+                                                                        'Hadoop:name=ReplicatedBlocksState,*',
+                                                                        'Hadoop:name=ECBlockGroupsState,*'),
+                'com.codahale.metrics.JmxReporter$': ('metrics:*',)}
+_JMX_RCMP = re.compile(r'^[\w\-,=. ]*$') # characters allowed in the metrics2 record name patterns
+
+_JSON_TOKEN = re.compile(r'["{}\[\]]')
+_JSON_STREND = re.compile(r'\\.|"', re.S)
+_MTYPE_RCMP = re.compile(r'"modelerType"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_INFOADDR_RCMP = re.compile(r'"infoAddr"\s*:\s*"([^"]*)"')
+_NMADDR_RCMP = re.compile(r'"NodeHTTPAddress"\s*:\s*"([^"]*)"')
+
+def _iter_beans(chunks):
+    """Generator to split a streamed jmx response {"beans" : [{...}, {...}]} into the text of each bean
+    Only the text of the bean being read is buffered"""
+    buf = ''
+    pos = 0
+    start = -1 #start of the bean in buf
+    depth = 0
+    instr = False
+    opened = False
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            if instr: #skip to the end of the string, escaped characters included
+                mtch = _JSON_STREND.search(buf, pos)
+                if mtch is None:
+                    #an unread trailing backslash escapes the first character of the next chunk
+                    pos = len(buf) - 1 if pos < len(buf) and buf.endswith('\\') else len(buf)
+                    break
+                pos = mtch.end()
+                if mtch.group() == '"':
+                    instr = False
+                continue
+            mtch = _JSON_TOKEN.search(buf, pos)
+            if mtch is None:
+                pos = len(buf)
+                break
+            pos = mtch.end()
+            tok = mtch.group()
+            if tok == '"':
+                instr = True
+            elif tok in '{[':
+                opened = True
+                depth += 1
+                if depth == 3 and tok == '{':
+                    start = mtch.start()
+            else:
+                depth -= 1
+                if depth == 2 and tok == '}' and start >= 0:
+                    yield buf[start:pos]
+                    start = -1
+        #Drop the text already processed
+        if start >= 0:
+            buf = buf[start:]
+            pos -= start
+            start = 0
+        else:
+            buf = buf[pos:]
+            pos = 0
+    if not opened or depth or instr:
+        raise ValueError('Incomplete json response')
+
+def _jmx_query(mtype, mtypename=''):
+    """Function to translate a t_coll_metrics (modelerType, mtypename) prefix to JMX ObjectName patterns
+    Returns None if the bean cannot be selected with a pattern"""
+    if mtypename and ':' in mtypename:
+        #mtypename is an ObjectName prefix e.g. java.lang:type=GarbageCollector
+        return (mtypename + '*,*',)
+    if not mtype: #all the beans
+        return None
+    qrys = set()
+    for cls, pttrns in _JMX_CLASSES.items():
+        if cls.startswith(mtype) or mtype.startswith(cls):
+            qrys.update(pttrns)
+    if qrys:
+        return tuple(sorted(qrys))
+    if '.' in mtype or not _JMX_RCMP.match(mtype):
+        return None
+    #metrics2 record e.g. RegionServer,sub=Regions is Hadoop:service=HBase,name=RegionServer,sub=Regions
+    parts = mtype.split(',')
+    if [prt for prt in parts[1:-1] if '=' not in prt] or (parts[-1] and len(parts) > 1 and '=' not in parts[-1]):
+        return None
+    if parts[-1]: #prefix of the last key value
+        parts[-1] += '*'
+    else: #trailing comma, e.g. QueueMetrics,
+        parts.pop()
+    return ('Hadoop:name=' + ','.join(parts) + ',*',)
+
+class _MtrxMatcher():
+    """ Precompiled t_coll_metrics (modelerType, mtypename) entries of an app component
+    The entries are indexed by modelerType prefix, a bean modelerType is looked up once per prefix
+    length and the candidate entries are cached, beans of the same modelerType repeat on every node """
+    def __init__(self, entries=()):
+        self._entries = list(entries)
+        self._idx = {}
+        for pos, (mtype, _) in enumerate(self._entries):
+            self._idx.setdefault(mtype or '', []).append(pos)
+        self._lens = sorted(set(len(mtype) for mtype in self._idx))
+        self._cache = {}
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _candidates(self, mtype):
+        """Function to get the entries whose modelerType is a prefix of mtype, in t_coll_metrics order"""
+        try:
+            return self._cache[mtype]
+        except KeyError:
+            pass
+        poslst = []
+        for lng in self._lens:
+            if lng > len(mtype):
+                break
+            poslst.extend(self._idx.get(mtype[:lng], ()))
+        cands = tuple(self._entries[pos] for pos in sorted(poslst))
+        self._cache[mtype] = cands
+        return cands
+
+    def match(self, mtype, mname=None):
+        """Function to get the (modelerType, mtypename) entry matching a bean, None if not collected
+        Metrics can be a substring from the start, e.g. "sun.management.O" for "sun.management.OperatingSystemImpl"
+        If the bean name mname is given, the entry mtypename must be empty or a prefix of mname"""
+        for entry in self._candidates(mtype):
+            if mname is None or not entry[1] or mname.startswith(entry[1]):
+                return entry
+        return None
+
+def _compile_mtrx(dct):
+    """Function to compile {appname:{appcomponent:[(modelertype1, mtypename1),...]}} to
+    {appname:{appcomponent:_MtrxMatcher}}"""
+    return {app: {comp: _MtrxMatcher(mtrxlst) for comp, mtrxlst in comps.items()}
+            for app, comps in dct.items()}
+
+class _HostHealth():
+    """ Health of the metrics endpoints (host:port)
+    A failed endpoint is skipped (open circuit) for backoff seconds, doubled on each consecutive failure up
+    to maxbackoff, then a single request probes it. Connect and read timeouts are derived from the
+    latency percentiles of the endpoint, timeout is used until latencies are known
+    With a path, the failed endpoints are kept across the runs in a JSON file e.g. cron jobs """
+    def __init__(self, lgr, timeout=1.0, maxtimeout=5.0, backoff=30, maxbackoff=1800, path=None):
         self._lgr = lgr
-        self.skt = None
+        self._timeout = timeout
+        self._maxtimeout = maxtimeout
+        self._backoff = backoff
+        self._maxbackoff = maxbackoff
+        self._path = path
+        #host_port: [consecutive failures, circuit open until, probe in progress, latencies]
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.mtrx = {'hostsSkipped':0, 'hostsProbed':0}
+        if path is not None:
+            self._load()
+
+    def _load(self):
+        """Function to read the failed endpoints, {host_port: [consecutive failures, open until epoch]}"""
+        try:
+            with open(self._path) as fle:
+                hosts = json.load(fle)
+            now, mnow = time(), monotonic()
+            for host_port, (fails, until) in hosts.items():
+                self._hosts[host_port] = [int(fails), mnow + until - now, False, deque(maxlen=32)]
+            self._lgr.info('Loaded %s failed hosts from %s', len(hosts), self._path)
+        except FileNotFoundError:
+            self._lgr.info('No hosts health file %s', self._path)
+        except (OSError, ValueError, TypeError) as err:
+            self._lgr.warning('Unable to read the hosts health file %s: %s', self._path, err)
+
+    def _host(self, host_port):
+        """Function to get the health of an endpoint, creates one if required"""
+        try:
+            return self._hosts[host_port]
+        except KeyError:
+            return self._hosts.setdefault(host_port, [0, 0.0, False, deque(maxlen=32)])
+
+    def allow(self, host_port):
+        """Function to check if a request can be made, False if the endpoint is skipped"""
+        with self._lock:
+            hlth = self._host(host_port)
+            if not hlth[0]:
+                return True
+            if hlth[2] or monotonic() < hlth[1]:
+                self.mtrx['hostsSkipped'] += 1
+                return False
+            hlth[2] = True
+            self.mtrx['hostsProbed'] += 1
+            self._lgr.info('Probing %s after %s failures', host_port, hlth[0])
+            return True
+
+    def success(self, host_port, latency):
+        """Function to record the latency of a successful request, closes the circuit"""
+        with self._lock:
+            hlth = self._host(host_port)
+            if hlth[0]:
+                self._lgr.info('%s is reachable again', host_port)
+            hlth[0] = 0
+            hlth[2] = False
+            hlth[3].append(latency)
+
+    def failure(self, host_port):
+        """Function to record a connection failure or timeout, opens the circuit"""
+        with self._lock:
+            hlth = self._host(host_port)
+            hlth[0] += 1
+            hlth[2] = False
+            wait = min(self._backoff * 2 ** min(hlth[0] - 1, 32), self._maxbackoff)
+            hlth[1] = monotonic() + wait
+            self._lgr.warning('%s failed %s times, skipped for %ss', host_port, hlth[0], wait)
+
+    def release(self, host_port):
+        """Function to end a request, a probe ended without success or failure e.g. unexpected error
+        is made again once allowed"""
+        with self._lock:
+            self._host(host_port)[2] = False
+
+    def timeouts(self, host_port):
+        """Function to get the (connect, read) timeouts of an endpoint
+        connect: 3 x median latency, at most timeout; read: 4 x 99th percentile latency, up to maxtimeout"""
+        with self._lock:
+            ltncs = sorted(self._host(host_port)[3])
+        if not ltncs:
+            return (self._timeout, self._timeout)
+        pc50 = ltncs[(len(ltncs) - 1) // 2]
+        pc99 = ltncs[int(0.99 * (len(ltncs) - 1) + 0.5)]
+        return (min(max(3 * pc50, 0.1), self._timeout), min(max(4 * pc99, 0.5), self._maxtimeout))
+
+    def close(self):
+        """Function to save the failed endpoints, with a path"""
+        if self._path is None:
+            return
+        with self._lock:
+            now, mnow = time(), monotonic()
+            hosts = {host_port: [hlth[0], now + hlth[1] - mnow] for host_port, hlth in self._hosts.items()
+                     if hlth[0]}
+        tmpname = self._path + '.tmp'
+        try:
+            with open(tmpname, 'w') as fle:
+                json.dump(hosts, fle, separators=(',', ':'))
+            os.replace(tmpname, self._path)
+        except (OSError, ValueError) as err:
+            self._lgr.warning('Unable to save the hosts health file %s: %s', self._path, err)
+
+
+class _HTTPSessions():
+    """ Pool of keep-alive HTTP sessions, one session per host:port
+    The least recently used session is closed when more than poolhosts hosts are pooled """
+    def __init__(self, lgr, poolhosts=2048, poolmaxsize=4, health=None):
+        self._lgr = lgr
+        self._poolhosts = poolhosts
+        #Connections kept open per host, the limit of the concurrent GETs to a host
+        self.poolmaxsize = poolmaxsize
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        #Counters of the sessions closed so far
+        self._retired = {'httpRequests':0, 'httpConnections':0}
+        #The endpoints health is kept for the life of the pool, i.e. across runs when shared
+        self.health = health if health is not None else _HostHealth(lgr)
+
+    def _session(self, host_port):
+        """Function to get the session for host:port, creates one if required"""
+        with self._lock:
+            try:
+                sess = self._sessions[host_port]
+                self._sessions.move_to_end(host_port)
+            except KeyError:
+                sess = requests.Session()
+                adptr = HTTPAdapter(pool_connections=2, pool_maxsize=self.poolmaxsize)
+                sess.mount('http://', adptr)
+                sess.mount('https://', adptr)
+                self._sessions[host_port] = sess
+                self._lgr.debug('HTTP session created for %s', host_port)
+                while len(self._sessions) > self._poolhosts:
+                    _, old = self._sessions.popitem(last=False)
+                    self._retire(old)
+        return sess
+
+    def _counts(self, sess):
+        """Function to get the (requests, new connections) count of a session"""
+        nreq = ncon = 0
+        for adptr in set(sess.adapters.values()):
+            pools = adptr.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                nreq += pool.num_requests
+                ncon += pool.num_connections
+        return (nreq, ncon)
+
+    def _retire(self, sess):
+        """Function to close a session, keeps its counters"""
+        nreq, ncon = self._counts(sess)
+        self._retired['httpRequests'] += nreq
+        self._retired['httpConnections'] += ncon
+        sess.close()
+
+    def get(self, host_port, uri, **kwargs):
+        """Function to GET the uri on the pooled session of host:port"""
+        return self._session(host_port).get(uri, **kwargs)
+
+    def stats(self):
+        """Function to get the cumulative HTTP requests and new connections count"""
+        with self._lock:
+            stats = dict(self._retired)
+            for sess in self._sessions.values():
+                nreq, ncon = self._counts(sess)
+                stats['httpRequests'] += nreq
+                stats['httpConnections'] += ncon
+        stats.update(self.health.mtrx)
+        return stats
+
+    def close(self):
+        """Function to close all the pooled sessions, the endpoints health is saved"""
+        with self._lock:
+            while self._sessions:
+                _, sess = self._sessions.popitem()
+                self._retire(sess)
+        self.health.close()
+
+
+class _AppEnd():
+    """ End of an app queued to the writers, done(committed) is called once all the writers ended it """
+    def __init__(self, writers, done):
+        self._lock = threading.Lock()
+        self._left = writers
+        self._committed = True
+        self._done = done
+
+    def ended(self, committed):
+        """Function called by each writer, once the rows of the app are committed or discarded"""
+        with self._lock:
+            self._left -= 1
+            self._committed = self._committed and committed
+            if self._left:
+                return
+        self._done(self._committed)
+
+
+class _DbWriters():
+    """ Writer threads draining the insert batches queued by the collectors, each writer owns a DbOps
+    Batches are sharded by statement to a bounded queue per writer, a collector waits while the queue is full
+    With a spool, a batch waiting more than spoolwait seconds is spooled, pending until the app is committed:
+    replayed once the writers committed the app, deleted when they rolled it back
+    Statements other than the inserts are queued as calls fnc(dbo), run in the transaction of the writer
+    of a statement i.e. committed with its rows
+    App end/abort markers are queued to every writer, after the rows of the app
+    The end of an app calls back done(committed) once every writer committed or rolled back its rows """
+    _ROWS, _END, _ABORT, _STOP, _CALL = range(5)
+
+    def __init__(self, lgr, writers=1, queuesize=64, spool=None, spoolwait=30.0):
+        self._lgr = lgr
+        self._spool = spool
+        self._spoolwait = spoolwait
+        self._txn = 0 #app transaction, tag of the batches spooled
+        self._lock = threading.Lock()
+        self._queues = []
+        self._dbos = []
+        self._threads = []
+        self.mtrx = {'error':0, 'dbQueueDepthMax':0, 'dbWriterLagMax':0.0}
+        for wrtr in range(writers):
+            dbo = DbOps(self._lgr)
+            dbo.spool = spool
+            que = queue.Queue(queuesize)
+            thrd = threading.Thread(target=self._write, args=(dbo, que), name='bdmon-writer-%d' %wrtr)
+            thrd.daemon = True
+            thrd.start()
+            self._dbos.append(dbo)
+            self._queues.append(que)
+            self._threads.append(thrd)
+        self._lgr.info('DB writers:%s, queue size:%s', writers, queuesize)
+
+    def put(self, stmt, values):
+        """Function to queue the insert values of a statement, blocks while the writer queue is full"""
+        que = self._queue(stmt)
+        if self._spool is None:
+            que.put((self._ROWS, stmt, values, monotonic()))
+        else:
+            try:
+                que.put((self._ROWS, stmt, values, monotonic()), timeout=self._spoolwait)
+            except queue.Full:
+                #Writers lagging e.g. slow database
+                self._lgr.warning('DB writer queue full for %s seconds, %s rows spooled',
+                                  self._spoolwait, len(values))
+                nrows = self._spool.write({stmt: values}, str(self._txn))
+                with self._lock:
+                    self.mtrx['dbRowsSpooled'] = self.mtrx.get('dbRowsSpooled', 0) + nrows
+                return
+        depth = que.qsize()
+        if depth > self.mtrx['dbQueueDepthMax']:
+            self.mtrx['dbQueueDepthMax'] = depth
+
+    def _queue(self, stmt):
+        """Function to get the queue of the writer of a statement"""
+        return self._queues[hash(stmt) % len(self._queues)]
+
+    def call(self, stmt, fnc):
+        """Function to queue a call fnc(dbo) to the writer of a statement, e.g. an update committed with
+        the rows of the statement; skipped, as the rows, once a write of the app failed"""
+        self._queue(stmt).put((self._CALL, stmt, fnc, monotonic()))
+
+    def _broadcast(self, mrk, app='', end=None):
+        """Function to queue a marker to all the writers"""
+        for que in self._queues:
+            que.put((mrk, app, end, monotonic()))
+
+    def endapp(self, app, done=None):
+        """Function to commit the rows of an app once written
+        done(committed) is called by the last writer, committed False when any writer discarded rows"""
+        if self._spool is not None:
+            done = functools.partial(self._spooled, str(self._txn), done)
+            self._txn += 1
+        self._broadcast(self._END, app, None if done is None else _AppEnd(len(self._queues), done))
+
+    def abortapp(self, app):
+        """Function to rollback the rows of an app not yet committed"""
+        if self._spool is not None:
+            self._drop(str(self._txn))
+            self._txn += 1
+        self._broadcast(self._ABORT, app)
+
+    def _spooled(self, txn, done, committed):
+        """Function to publish the batches of an app spooled while the queues were full once the app is
+        committed, to delete them otherwise"""
+        if committed:
+            try:
+                self._spool.publish(txn)
+            except OSError as err:
+                self._lgr.error('BDM-WR-02: Spooled rows of the application not published: %s', err)
+                with self._lock:
+                    self.mtrx['error'] += 1
+        else:
+            self._drop(txn)
+        if done is not None:
+            done(committed)
+
+    def _drop(self, txn):
+        """Function to delete the batches of an app spooled, the app rolled back"""
+        try:
+            if self._spool.drop(txn):
+                self._lgr.warning('Spooled rows of the application rolled back are discarded')
+        except OSError as err:
+            self._lgr.error('BDM-WR-02: Spooled rows of the application not deleted: %s', err)
+            with self._lock:
+                self.mtrx['error'] += 1
+
+    def _write(self, dbo, que):
+        """Writer thread"""
+        failed = False #rows are dropped until the end of the app on a write error
+        while True:
+            mrk, key, values, qtime = que.get()
+            lag = monotonic() - qtime
+            with self._lock:
+                if lag > self.mtrx['dbWriterLagMax']:
+                    self.mtrx['dbWriterLagMax'] = lag
+            if mrk == self._STOP:
+                que.task_done()
+                break
+            try:
+                if mrk == self._ROWS:
+                    if not failed:
+                        dbo.stmt = key
+                        dbo.values = values
+                        dbo.bufferstmt()
+                elif mrk == self._CALL:
+                    if not failed:
+                        values(dbo)
+                elif mrk == self._END:
+                    committed = not failed and dbo.flush() is not False
+                    failed = False
+                    if values is not None:
+                        values.ended(committed)
+                else:
+                    dbo.rollback()
+                    failed = False
+            except BDMonException as err:
+                dbo.rollback()
+                failed = mrk in (self._ROWS, self._CALL)
+                self._lgr.error('BDM-WR-01: DB writer error, rows of the application are discarded: %s', err)
+                with self._lock:
+                    self.mtrx['error'] += 1
+                if mrk == self._END and values is not None:
+                    values.ended(False)
+            que.task_done()
+
+    def drain(self):
+        """Function to wait for the queued batches to be written, returns and resets the writer metrics"""
+        for que in self._queues:
+            que.join()
+        with self._lock:
+            mtrx = self.mtrx
+            self.mtrx = {'error':0, 'dbQueueDepthMax':0, 'dbWriterLagMax':0.0}
+        for dbo in self._dbos:
+            for key, val in dbo.stats.items():
+                mtrx[key] = mtrx.get(key, 0) + val
+                dbo.stats[key] = 0
+        self._lgr.info('DB writers drained, max queue depth:%s, max lag:%.3fs',
+                       mtrx['dbQueueDepthMax'], mtrx['dbWriterLagMax'])
+        return mtrx
+
+    def close(self):
+        """Function to stop the writers once the queued batches are written"""
+        self.drain()
+        if self._spool is not None:
+            #Rows spooled after the last app end are not committed
+            self._drop(str(self._txn))
+        self._broadcast(self._STOP)
+        for thrd in self._threads:
+            thrd.join()
+        for dbo in self._dbos:
+            dbo.close()
+
+
+def _bean_batch(shared, bean, cltime):
+    """Function to get the numeric attributes of a bean as a RowBatch
+    Rows: the shared columns e.g. host, modelerType, the attribute name, its value and cltime"""
+    batch = RowBatch(shared, cltime)
+    names, nums = batch.strs[0], batch.nums
+    for key, val in bean.items():
+        if hasattr(val, 'real') and isfinite(val):
+            names.append(sys.intern(key))
+            nums.append(val)
+    return batch
+
+def _snapshot(rows, mnameidx, validx):
+    """Function to merge the metric rows into one row per bean i.e. per the other columns
+    The metricname:numvalue pairs are appended as a JSON object, in place of the two columns
+    NaN and Infinity are not valid JSON for the databases, these values are dropped"""
+    beans = OrderedDict()
+    for row in rows:
+        key = tuple(val for idx, val in enumerate(row) if idx not in (mnameidx, validx))
+        value = row[validx]
+        if not isfinite(value):
+            continue
+        if isinstance(value, float) and value.is_integer(): #RowBatch values are floats
+            value = int(value)
+        beans.setdefault(key, {})[row[mnameidx]] = value
+    return [key + (json.dumps(mtrx, separators=(',', ':'), allow_nan=False),) for key, mtrx in beans.items()]
+
+
+class _IdCache():
+    """ Integer ids of the host and metric names for the normalized storage, t_hosts and t_metric_names
+    Each table is read once on first use, new names are inserted and committed on a DbOps of its own """
+    _DIMS = {'host':('select hostname, id from t_hosts',
+                     'insert into t_hosts (hostname) values(?)',
+                     'select id from t_hosts where hostname=?'),
+             'metric':('select modelerType, metricname, id from t_metric_names',
+                       'insert into t_metric_names (modelerType, metricname) values(?, ?)',
+                       'select id from t_metric_names where modelerType=? and metricname=?')}
+
+    def __init__(self, lgr):
+        self._lgr = lgr
+        self._dbo = DbOps(self._lgr)
+        self._lock = threading.Lock()
+        self._ids = {}
+        self.mtrx = {'dimIdsAdded':0}
+
+    def _load(self, dim):
+        """Function to read the ids of a dictionary table"""
+        self._dbo.stmt = self._DIMS[dim][0]
+        self._dbo.values = ''
+        self._dbo.execstmt()
+        ids = {}
+        for row in self._dbo.crsr.fetchall():
+            ids[row[0] if dim == 'host' else (row[0], row[1])] = row[-1]
+        self._lgr.info('Loaded %s %s ids', len(ids), dim)
+        self._ids[dim] = ids
+        return ids
+
+    def _add(self, dim, key):
+        """Function to insert a new name, returns its id"""
+        values = (key,) if dim == 'host' else key
+        self._dbo.stmt = self._DIMS[dim][1]
+        self._dbo.values = [values]
+        try:
+            self._dbo.execstmt()
+            self._dbo.commit()
+            self.mtrx['dimIdsAdded'] += 1
+        except BDMonException:
+            #Inserted meanwhile by another bdmon process
+            self._dbo.rollback()
+        self._dbo.stmt = self._DIMS[dim][2]
+        self._dbo.values = values
+        self._dbo.execstmt()
+        return self._dbo.crsr.fetchone()[0]
+
+    def _getid(self, dim, key):
+        """Function to get the id of a host name, or of a (modelerType, metricname) key"""
+        ids = self._ids.get(dim)
+        if ids is None:
+            ids = self._load(dim)
+        try:
+            return ids[key]
+        except KeyError:
+            ids[key] = self._add(dim, key)
+            return ids[key]
 
-    def __enter__(self):
-        if self.skt is not None:
-            raise BDMonException('BDM-SKT-01: Connection exists on %s:%s' %(self._host, self._port))
-        self._lgr.info('Connecting to ZK node :%s at port:%s', self._host, self._port)
-        self.skt = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.skt.settimeout(1.0)
-        hostip = socket.gethostbyname(self._host)
-        self._lgr.info("HOST IP to connect: %s", hostip)
-        self.skt.connect((hostip, self._port))
-        return self.skt
+    def encode(self, rows, hostidx, mtypeidx, mnameidx):
+        """Function to replace the host and metric names of the insert rows with their ids
+        The metric id takes the place of the metricname, the modelerType column is dropped"""
+        encoded = []
+        with self._lock:
+            for row in rows:
+                row = list(row)
+                mtype = '' if mtypeidx is None else row[mtypeidx]
+                row[mnameidx] = self._getid('metric', (mtype, row[mnameidx]))
+                row[hostidx] = self._getid('host', row[hostidx])
+                if mtypeidx is not None:
+                    del row[mtypeidx]
+                encoded.append(tuple(row))
+        return encoded
 
-    def __exit__(self, exp_type, exp_val, trcbk):
-        self.skt.shutdown(socket.SHUT_RDWR)
-        self.skt.close()
-        self.skt = None
+    def stats(self):
+        """Function to return and reset the count of names added"""
+        with self._lock:
+            mtrx = self.mtrx
+            self.mtrx = {'dimIdsAdded':0}
+        return mtrx
+
+    def close(self):
+        """Function to close the DB connection"""
+        self._dbo.close()
+
+
+class _LastValues():
+    """ Last values of the metrics, updated once the rows of the app are committed
+    The values are kept across the runs in a JSON file, by the list of apps collected """
+    _MTRX = {}
+
+    def __init__(self, lgr, path):
+        self._lgr = lgr
+        self._path = path
+        self._lock = threading.Lock()
+        #Key: statement name and the columns before numvalue
+        self._last = {}
+        #Values of the app being collected, kept once its rows are committed
+        self._pending = {}
+        self.mtrx = dict(self._MTRX)
+        try:
+            with open(self._path) as fle:
+                self._last = json.load(fle)
+            self._lgr.info('Loaded %s last values from %s', len(self._last), self._path)
+        except FileNotFoundError:
+            self._lgr.info('No last values file %s', self._path)
+        except (OSError, ValueError) as err:
+            self._lgr.warning('Unable to read the last values file %s: %s', self._path, err)
+
+    @staticmethod
+    def _key(name, row):
+        """Function to get the key of a metric row, rows end with numvalue, collection_ts"""
+        return '\t'.join((name,) + tuple(str(col) for col in row[:-2]))
+
+    def _get(self, key):
+        """Function to get the last value of a key, including the app being collected"""
+        return self._pending.get(key) or self._last.get(key)
+
+    def stage(self):
+        """Function to set aside the values of the app collected, until its rows are committed"""
+        with self._lock:
+            values = self._pending
+            self._pending = {}
+        return values
+
+    def commit(self, values=None):
+        """Function to keep the values of the rows committed, default the values pending"""
+        with self._lock:
+            if values is None:
+                values = self._pending
+                self._pending = {}
+            self._last.update(values)
+
+    def discard(self):
+        """Function to drop the values of the rows rolled back"""
+        with self._lock:
+            self._pending = {}
+
+    def stats(self):
+        """Function to return and reset the counts"""
+        with self._lock:
+            mtrx = self.mtrx
+            self.mtrx = dict(self._MTRX)
+        return mtrx
+
+    def close(self):
+        """Function to save the last values"""
+        tmpname = self._path + '.tmp'
+        try:
+            with open(tmpname, 'w') as fle:
+                json.dump(self._last, fle, separators=(',', ':'))
+            os.replace(tmpname, self._path)
+        except (OSError, ValueError) as err:
+            self._lgr.warning('Unable to save the last values file %s: %s', self._path, err)
+
+
+class _Deadband(_LastValues):
+    """ Change-only ingestion, a metric is written when its value moved beyond the tolerance since
+    the last value written, or as a heartbeat after heartbeat - 1 skipped collections """
+    _MTRX = {'deadbandRowsSkipped':0}
+
+    def __init__(self, lgr, path, tolerance=0.0, heartbeat=10):
+        super().__init__(lgr, path)
+        self._tolerance = tolerance
+        self._heartbeat = heartbeat
+
+    def filter(self, name, rows):
+        """Function to drop the rows whose value did not change, a RowBatch stays a RowBatch"""
+        kept = rows.empty() if isinstance(rows, RowBatch) else []
+        skipped = 0
+        with self._lock:
+            for row in rows:
+                key = self._key(name, row)
+                value = row[-2]
+                #[last value written, collections skipped]
+                last = self._get(key)
+                if (last is not None and last[1] + 1 < self._heartbeat and
+                        abs(value - last[0]) <= self._tolerance * abs(last[0])):
+                    self._pending[key] = [last[0], last[1] + 1]
+                    skipped += 1
+                else:
+                    self._pending[key] = [value, 0]
+                    kept.append(row)
+            self.mtrx['deadbandRowsSkipped'] += skipped
+        return kept
+
+
+class _CounterRates(_LastValues):
+    """ Per second rates of the counters of t_coll_metrics, against the previous sample of the counter
+    A counter lower than its previous sample was reset e.g. process restart, it is counted from 0
+    The rate rows are named <metricname>PerSec; the counter rows are kept or replaced (mode rate) """
+    _MTRX = {'counterResets':0}
+
+    def __init__(self, lgr, path, counters, mode='both'):
+        super().__init__(lgr, path)
+        #Dict {(appname, appcomponent):[(modelerType, compiled attribute patterns),...]}
+        self._counters = counters
+        self._keepraw = mode != 'rate'
+        self._iscounter = {}
+
+    def _match(self, appcomp, mtype, mname):
+        """Function to check if a metric is a counter, the modelerType entries match as prefixes"""
+        try:
+            return self._iscounter[(appcomp, mtype, mname)]
+        except KeyError:
+            pass
+        found = any(mtype.startswith(ctype) and cpat.match(mname)
+                    for ctype, cpat in self._counters.get(appcomp, ()))
+        self._iscounter[(appcomp, mtype, mname)] = found
+        return found
+
+    def rates(self, name, rows, appcomp, mtypeidx, mnameidx):
+        """Function to add the rate rows of the counters; appcomp None: (appname, appcomponent)
+        are the columns 1 and 2 of the rows; mtypeidx None: the OS bean metrics
+        A RowBatch stays a RowBatch"""
+        out = rows.empty() if isinstance(rows, RowBatch) else []
+        with self._lock:
+            for row in rows:
+                mtype = 'sun.management.OperatingSystemImpl' if mtypeidx is None else row[mtypeidx]
+                if not self._match(appcomp or (row[1], row[2]), str(mtype), row[mnameidx]):
+                    out.append(row)
+                    continue
+                if self._keepraw:
+                    out.append(row)
+                key = self._key(name, row)
+                value, tstamp = row[-2], row[-1].timestamp()
+                #[previous sample, its collection_ts]
+                last = self._get(key)
+                self._pending[key] = [value, tstamp]
+                if last is None or tstamp <= last[1]:
+                    continue
+                delta = value - last[0]
+                if delta < 0:
+                    self.mtrx['counterResets'] += 1
+                    delta = value
+                rate = list(row)
+                rate[mnameidx] = row[mnameidx] + 'PerSec'
+                rate[-2] = delta / (tstamp - last[1])
+                out.append(tuple(rate))
+        return out
+
+
+def _getsessions(lgr, applst=()):
+    """Function to get a keep-alive HTTP sessions pool, with the endpoints health tracker
+    The health of the endpoints of the applications is kept across the runs"""
+    eng = getenginedetails(lgr)
+    path = None
+    if applst:
+        path = os.path.join(getstoragedetails(lgr)["lastvaluesdir"],
+                            'hosthealth_%s.json' % '_'.join(sorted(applst)))
+    health = _HostHealth(lgr, eng["timeout"], eng["maxtimeout"], eng["backoff"], eng["maxbackoff"], path)
+    return _HTTPSessions(lgr, eng["poolhosts"], eng["poolmaxsize"], health)
 
 
 class _BDMProcess():
@@ -97,10 +889,95 @@ class _BDMProcess():
                                  '(app_id, stageid, metricname, numvalue, launch_ts) '
                                  'values(?, ?, ?, ?, ?)')
                  }
+    #Normalized storage statements, with the row positions of the host, modelerType and metricname
+    _dbo_nstmts = {'host_os':(('insert into t_node_metrics_norm '
+                               '(host_id, appname, appcomponent, metric_id, numvalue, collection_ts) '
+                               'values(?, ?, ?, ?, ?, ?)'), 0, None, 3),
+                   'hdfs_namenode':(('insert into t_hdfs_nn_metrics_norm '
+                                     '(host_id, is_active, metric_id, numvalue, collection_ts) '
+                                     'values(?, ?, ?, ?, ?)'), 0, 2, 3),
+                   'hdfs_datanode':(('insert into t_hdfs_dn_metrics_norm '
+                                     '(host_id, metric_id, numvalue, collection_ts) '
+                                     'values(?, ?, ?, ?)'), 0, 1, 2),
+                   'yarn_rm':(('insert into t_yarn_rm_metrics_norm '
+                               '(host_id, metric_id, numvalue, collection_ts) '
+                               'values(?, ?, ?, ?)'), 0, 1, 2),
+                   'yarn_nm':(('insert into t_yarn_nm_metrics_norm '
+                               '(host_id, metric_id, numvalue, collection_ts) '
+                               'values(?, ?, ?, ?)'), 0, 1, 2),
+                   'hbase_hmaster':(('insert into t_hmaster_metrics_norm '
+                                     '(host_id, is_active, metric_id, numvalue, collection_ts) '
+                                     'values(?, ?, ?, ?, ?)'), 0, 2, 3),
+                   'hbase_regionserver':(('insert into t_hbase_rs_metrics_norm '
+                                          '(host_id, metric_id, numvalue, collection_ts) '
+                                          'values(?, ?, ?, ?)'), 0, 1, 2),
+                   'hive_hs2':(('insert into t_hive_metrics_norm '
+                                '(host_id, metric_id, numvalue, collection_ts) '
+                                'values(?, ?, ?, ?)'), 0, 1, 2)
+                  }
+    #Bean snapshot storage statements, with the row positions of the metricname and numvalue
+    _dbo_sstmts = {'host_os':(('insert into t_node_metrics_snap '
+                               '(hostnode, appname, appcomponent, collection_ts, metrics) '
+                               'values(?, ?, ?, ?, ?)'), 3, 4),
+                   'hdfs_namenode':(('insert into t_hdfs_nn_metrics_snap '
+                                     '(namenode, is_active, modelerType, collection_ts, metrics) '
+                                     'values(?, ?, ?, ?, ?)'), 3, 4),
+                   'hdfs_datanode':(('insert into t_hdfs_dn_metrics_snap '
+                                     '(datanode, modelerType, collection_ts, metrics) '
+                                     'values(?, ?, ?, ?)'), 2, 3),
+                   'yarn_rm':(('insert into t_yarn_rm_metrics_snap '
+                               '(rmnode, modelerType, collection_ts, metrics) '
+                               'values(?, ?, ?, ?)'), 2, 3),
+                   'yarn_nm':(('insert into t_yarn_nm_metrics_snap '
+                               '(nmnode, modelerType, collection_ts, metrics) '
+                               'values(?, ?, ?, ?)'), 2, 3),
+                   'hbase_hmaster':(('insert into t_hmaster_metrics_snap '
+                                     '(masternode, is_active, modelerType, collection_ts, metrics) '
+                                     'values(?, ?, ?, ?, ?)'), 3, 4),
+                   'hbase_regionserver':(('insert into t_hbase_rs_metrics_snap '
+                                          '(rsnode, modelerType, collection_ts, metrics) '
+                                          'values(?, ?, ?, ?)'), 2, 3),
+                   'hive_hs2':(('insert into t_hive_metrics_snap '
+                                '(hs2node, modelerType, collection_ts, metrics) '
+                                'values(?, ?, ?, ?)'), 2, 3)
+                  }
+    #Statements of the counter rates, with the (appname, appcomponent) and the row positions of the
+    #modelerType and metricname; the node metrics rows hold the appname, appcomponent of the OS bean
+    _dbo_cstmts = {'host_os':(None, None, 3),
+                   'hdfs_namenode':(('hdfs', 'namenode'), 2, 3),
+                   'hdfs_datanode':(('hdfs', 'datanode'), 1, 2),
+                   'yarn_rm':(('yarn', 'rm'), 1, 2),
+                   'yarn_nm':(('yarn', 'nm'), 1, 2),
+                   'hbase_hmaster':(('hbase', 'hmaster'), 2, 3),
+                   'hbase_regionserver':(('hbase', 'regionserver'), 1, 2),
+                   'hive_hs2':(('hive', 'hs2'), 1, 2)
+                  }
 
-    def __init__(self, lgr, dbo, dct):
+    def __init__(self, lgr, dbo, dct, sessions=None, writers=None, dims=None, deadband=None, counters=None):
         self._lgr = lgr
         self._dbo = dbo
+        #Inserts are queued to the _DbWriters if any, else buffered on dbo
+        self._writers = writers
+        #Normalized storage, the names are replaced with the _IdCache ids
+        self._dims = dims
+        self._nstmts = {}
+        if dims is not None:
+            self._nstmts = {self._dbo_stmts[key]: val for key, val in self._dbo_nstmts.items()}
+        #Bean snapshot storage, the attribute rows of a bean are written as one JSON row
+        self._sstmts = {}
+        if getstoragedetails(self._lgr)["layout"] == 'snapshot':
+            self._sstmts = {self._dbo_stmts[key]: val for key, val in self._dbo_sstmts.items()}
+        #Change-only ingestion of the metrics statements, the spark ones are written once per app
+        self._deadband = deadband
+        self._dstmts = {}
+        if deadband is not None:
+            self._dstmts = {stmt: key for key, stmt in self._dbo_stmts.items() if not key.startswith('spark')}
+        #Counter rates, computed before the change-only filter
+        self._counters = counters
+        self._cstmts = {}
+        if counters is not None:
+            self._cstmts = {self._dbo_stmts[key]: (key,) + val for key, val in self._dbo_cstmts.items()}
+        #Dict {appname:{appcomponent:_MtrxMatcher}}, see _compile_mtrx
         self._appmtrx = dct
         self._host = ''
         self._proto = 'http'
@@ -112,13 +989,60 @@ class _BDMProcess():
         else:
             self._tlsverify = True
         self.mtrx = {'error':0, 'warning':0}
+        self._mtrxlock = threading.Lock()
+        #HTTP sessions are owned here unless shared by the caller (e.g. across runs)
+        self._ownsessions = sessions is None
+        if sessions is None:
+            sessions = _getsessions(self._lgr)
+        self._sessions = sessions
+        self._httpbase = sessions.stats()
+        eng = getenginedetails(self._lgr)
+        self._jmxqry = eng["jmxqry"] == 'y'
+        self._jsonstream = eng["jsonstream"] == 'y'
+        self._jmxqrys = {}
+
+    def _incr(self, key):
+        """Function to increment a collection metric, safe to call from the fetch threads"""
+        with self._mtrxlock:
+            self.mtrx[key] += 1
+
+    def close(self):
+        """Function to release the resources held by the collection engine
+        HTTP connection reuse of this run is added to the collection metrics"""
+        stats = self._sessions.stats()
+        for key, val in stats.items():
+            self.mtrx[key] = val - self._httpbase[key]
+        self.mtrx['httpConnectionsReused'] = self.mtrx['httpRequests'] - self.mtrx['httpConnections']
+        self._lgr.info('HTTP requests:%s, new connections:%s', self.mtrx['httpRequests'],
+                       self.mtrx['httpConnections'])
+        if self._ownsessions:
+            self._sessions.close()
+        if self._dims is not None:
+            self.mtrx.update(self._dims.stats())
+        if self._deadband is not None:
+            self.mtrx.update(self._deadband.stats())
+        if self._counters is not None:
+            self.mtrx.update(self._counters.stats())
 
     def _bulk_insdb(self):
-        """Function to perform bulk inserts"""
+        """Function to perform bulk inserts, rows are buffered and written in batches by DbOps"""
         self._lgr.info("Insert count:%d", len(self._dbo.values))
+        if self._dbo.values and self._dbo.stmt in self._cstmts:
+            name, appcomp, mtypeidx, mnameidx = self._cstmts[self._dbo.stmt]
+            self._dbo.values = self._counters.rates(name, self._dbo.values, appcomp, mtypeidx, mnameidx)
+        if self._dbo.values and self._dbo.stmt in self._dstmts:
+            self._dbo.values = self._deadband.filter(self._dstmts[self._dbo.stmt], self._dbo.values)
         if self._dbo.values:
-            self._dbo.execstmt()
-            self._dbo.commit()
+            if self._dbo.stmt in self._nstmts:
+                self._dbo.stmt, hostidx, mtypeidx, mnameidx = self._nstmts[self._dbo.stmt]
+                self._dbo.values = self._dims.encode(self._dbo.values, hostidx, mtypeidx, mnameidx)
+            elif self._dbo.stmt in self._sstmts:
+                self._dbo.stmt, mnameidx, validx = self._sstmts[self._dbo.stmt]
+                self._dbo.values = _snapshot(self._dbo.values, mnameidx, validx)
+            if self._writers is None:
+                self._dbo.bufferstmt()
+            else:
+                self._writers.put(self._dbo.stmt, self._dbo.values)
         else:
             self._lgr.info("No insert for statement: %s", self._dbo.stmt)
         self._dbo.stmt = ''
@@ -127,8 +1051,7 @@ class _BDMProcess():
     def _ins_osdata(self, osdata, app, comp, cltime):
         """Function to insert node OS metrics"""
         self._lgr.debug("Processing the following OS info: %s", osdata)
-        self._dbo.values = [(self._host, app, comp, key, val, cltime) \
-                  for key, val in osdata.items() if hasattr(val, 'real') and not isnan(val)]
+        self._dbo.values = _bean_batch((self._host, app, comp), osdata, cltime)
         self._dbo.stmt = self._dbo_stmts["host_os"]
         self._bulk_insdb()
 
@@ -143,15 +1066,19 @@ class _BDMProcess():
         # Kerberos config specific to component
         old_kerb = self._kerb
         self._kerb = hdfs["kerberos"]
-        for node in nnodes:
-            try:
-                jdata = self._get_metrics(node)
-                self._host = node.split(':')[0]
-            except BDMonException as err:
+        #HA state and the datanodes list are required even if these beans are not collected
+        extra = ('Hadoop:service=NameNode,name=FSNamesystem',)
+        if not hdfs["datanodes"]:
+            extra += ('Hadoop:service=NameNode,name=NameNodeInfo::LiveNodes',)
+        qrys = self._jmx_queries('hdfs', 'namenode', extra)
+        keep = self._bean_filter('hdfs', 'namenode', ('"tag.HAState"', '"LiveNodes"'))
+        for node, host, jdata, err in self._fetch_masters(nnodes, qrys, keep):
+            if err is not None:
                 self._lgr.warning("Unable to get namenode metrics, ignoring Node:%s", node)
                 self._lgr.warning("Received namenode error:%s", err)
                 self.mtrx['warning'] += 1
                 continue
+            self._host = host
             is_active = 'N'
             cltime = datetime.now()
             for mtrx in jdata["beans"]:
@@ -163,30 +1090,28 @@ class _BDMProcess():
                         dnodes = hdfs["datanodes"].replace(' ', '').split(',')
                         self._lgr.info("Restricted dataNodes: %s, Total:%s", dnodes, len(dnodes))
                     else: #Get the list of all datanodes
-                        lnodes = ujson.loads(mtrx["LiveNodes"])
-                        self._lgr.info("DataNodes to process: %s", lnodes.keys())
-                        dnodes = [lnodes[dna]["infoAddr"] for dna in lnodes]
+                        #Only infoAddr is required, the nested LiveNodes json is not decoded
+                        dnodes = _INFOADDR_RCMP.findall(mtrx["LiveNodes"])
+                        self._lgr.info("DataNodes to process: %s", dnodes)
             for mtrx in jdata["beans"]:
                 mtype = mtrx["modelerType"]
                 self._lgr.debug("NameNode:%s ; Check metrics:%s", self._host, mtype)
                 #Metrics can be a substring from the start, hence the startswith
                 #comes in handy with a lot metrics of the similar modelerType
                 #e.g. instead of "sun.management.OperatingSystemImpl", it can be "sun.management.O"
-                #self._appmtrx: Dict {appname:{appcomponent:[(modelertype1, mtypename1),...]}}
-                if [mx for mx in self._appmtrx['hdfs']['namenode'] if mtype.startswith(mx[0])]:
+                if self._matcher('hdfs', 'namenode').match(mtype):
                     self._lgr.info("NameNode:%s ; Process metrics:%s", self._host, mtype)
                     if mtype == "sun.management.OperatingSystemImpl":
                         self._ins_osdata(mtrx, 'hdfs', 'namenode', cltime)
                     else:
-                        self._dbo.values = [(self._host, is_active, mtype, key, val, cltime) \
-                                            for key, val in mtrx.items()
-                                            if hasattr(val, 'real') and not isnan(val)]
+                        self._dbo.values = _bean_batch((self._host, is_active, mtype), mtrx, cltime)
                         self._dbo.stmt = self._dbo_stmts["hdfs_namenode"]
                         self._bulk_insdb()
         #Namenodes complete, now process datanodes
         try:
             self._lgr.info("Datanodes list: %s", dnodes)
-            self._get_metrics_workers(dnodes, hdfs["dnport"], 'hdfs', 'datanode')
+            self._get_metrics_workers(dnodes, hdfs["dnport"], 'hdfs', 'datanode',
+                                      hdfs["dnworkers"])
         except UnboundLocalError as err:
             errmsg = "BDM-HD-00: Looks like we don't have an active Namenode"
             self._lgr.error(errmsg)
@@ -196,29 +1121,127 @@ class _BDMProcess():
         # Reset kerberos config
         self._kerb = old_kerb
 
-    def _get_metrics_workers(self, wnodes, cnfgport, app, appcomp):
-        """Function to process HDFS datanodes, HBase regionservers jmx data"""
+    def _matcher(self, app, comp):
+        """Function to get the precompiled metrics matcher of an app component"""
+        try:
+            return self._appmtrx[app][comp]
+        except KeyError: #no active metrics of the app component
+            return _MtrxMatcher()
+
+    def _jmx_queries(self, app, comp, extra=()):
+        """Function to get the JMX servlet queries for the beans to collect of an app component
+        extra: ObjectName patterns (qry) or ObjectName::attribute (get) required by the collector
+        Returns None if the whole jmx data has to be fetched"""
+        if not self._jmxqry:
+            return None
+        try:
+            return self._jmxqrys[(app, comp, extra)]
+        except KeyError:
+            pass
+        qrys = set()
+        for mtype, mtypename in self._matcher(app, comp):
+            pttrns = _jmx_query(mtype, mtypename)
+            if pttrns is None:
+                self._lgr.warning('No JMX query for %s:%s %s, fetching all beans', app, comp, mtype)
+                qrys = None
+                break
+            qrys.update(pttrns)
+        if qrys is not None:
+            qrys = [self._uripath + ('?get=' if '::' in qry else '?qry=') + quote(qry, safe=':=,*')
+                    for qry in sorted(qrys.union(extra))]
+            self._lgr.info('JMX queries for %s:%s %s', app, comp, qrys)
+        self._jmxqrys[(app, comp, extra)] = qrys
+        return qrys
+
+    def _bean_filter(self, app, comp, keys=()):
+        """Function to get the bean filter of an app component for the streaming jmx parser
+        Beans having any of the keys attributes are kept too e.g. '"LiveNodes"'
+        Returns None if the jmx responses are not parsed as a stream"""
+        if not self._jsonstream:
+            return None
+        mtchr = self._matcher(app, comp)
+        def keep(mtype, raw):
+            """Bean filter"""
+            return mtchr.match(mtype) is not None or any(key in raw for key in keys)
+        return keep
+
+    def _get_beans(self, app_host_port, qrys=None, keep=None):
+        """Function to GET the beans of a node, merged from the JMX servlet queries"""
+        if qrys is None:
+            return self._get_metrics(app_host_port, None, keep)
+        beans = OrderedDict()
+        for uripath in qrys:
+            for bean in self._get_metrics(app_host_port, uripath, keep).get("beans", []):
+                try:
+                    beans[bean["name"]].update(bean)
+                except KeyError:
+                    beans[bean["name"]] = bean
+        return {"beans": list(beans.values())}
+
+    def _fetch(self, key, app_host_port, uripath=None, qrys=None, keep=None):
+        """Function to GET jmx/json data; returns (key, data, error)"""
+        try:
+            if qrys is None and keep is None:
+                return (key, self._get_metrics(app_host_port, uripath), None)
+            return (key, self._get_beans(app_host_port, qrys, keep), None)
+        except BDMonException as err:
+            return (key, None, err)
+
+    def _fetch_many(self, reqs, workers=1):
+        """Generator to GET a list of (key, host:port, uripath) requests, at most workers at a time
+        (key, data, error) results are yielded as and when the nodes respond"""
+        reqs = list(reqs)
+        if workers > 1 and len(reqs) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(reqs))) as pool:
+                futs = [pool.submit(self._fetch, *req) for req in reqs]
+                try:
+                    for fut in as_completed(futs):
+                        yield fut.result()
+                finally:
+                    #Consumer stopped early, cancel the requests not started; shutdown waits for the rest
+                    for fut in futs:
+                        fut.cancel()
+        else:
+            for req in reqs:
+                yield self._fetch(*req)
+
+    def _fetch_workers(self, wnodes, cnfgport, workers=1, qrys=None, keep=None):
+        """Generator to GET jmx data of the worker nodes; yields (node, host, jdata, error)"""
+        reqs = []
         for node in wnodes:
             #if datanodes, rs, nm port not specified then use port from config file
-            try:
-                if ':' in node:
-                    jdata = self._get_metrics(node)
-                    self._host = node.split(':')[0]
-                else:
-                    self._lgr.info("Defaulting port for %s:", node)
-                    self._host = node
-                    jdata = self._get_metrics(node + ":" + cnfgport)
-            except BDMonException as err:
+            if ':' in node:
+                reqs.append(((node, node.split(':')[0]), node, None, qrys, keep))
+            else:
+                self._lgr.info("Defaulting port for %s:", node)
+                reqs.append(((node, node), node + ":" + cnfgport, None, qrys, keep))
+        for (node, host), jdata, err in self._fetch_many(reqs, workers):
+            yield (node, host, jdata, err)
+
+    def _fetch_masters(self, mnodes, qrys=None, keep=None):
+        """Generator to GET jmx data of the master nodes; yields (node, host, jdata, error)"""
+        for node, jdata, err in self._fetch_many((node, node, None, qrys, keep) for node in mnodes):
+            yield (node, node.split(':')[0], jdata, err)
+
+    def _get_metrics_workers(self, wnodes, cnfgport, app, appcomp, workers=1):
+        """Function to process HDFS datanodes, HBase regionservers jmx data"""
+        self._lgr.info("%s: Worker nodes:%s, Concurrent workers:%s", appcomp, len(wnodes), workers)
+        qrys = self._jmx_queries(app, appcomp)
+        keep = self._bean_filter(app, appcomp)
+        mtchr = self._matcher(app, appcomp)
+        for node, host, jdata, err in self._fetch_workers(wnodes, cnfgport, workers, qrys, keep):
+            if err is not None:
                 self._lgr.warning("Unable to get worker node metrics, ignoring Node:%s", node)
                 self._lgr.warning("Received node error:%s", err)
                 self.mtrx['warning'] += 1
                 continue
+            self._host = host
             cltime = datetime.now()
             for mtrx in jdata["beans"]:
                 #Process only the required metrics on datanodes/regionservers
                 mtype = mtrx["modelerType"]
                 self._lgr.debug("%s:%s ; Check metrics:%s", appcomp, self._host, mtype)
-                if [mx for mx in self._appmtrx[app][appcomp] if mtype.startswith(mx[0])]:
+                if mtchr.match(mtype):
                     self._lgr.info("%s:%s ; Process metrics:%s", appcomp, self._host, mtype)
                     if mtype == "sun.management.OperatingSystemImpl":
                         self._ins_osdata(mtrx, app, appcomp, cltime)
@@ -240,9 +1263,7 @@ class _BDMProcess():
                         self._dbo.stmt = self._dbo_stmts["hbase_table"]
                         self._bulk_insdb()
                     else:
-                        self._dbo.values = [(self._host, mtype, key, val, cltime) \
-                                            for key, val in mtrx.items()
-                                            if hasattr(val, 'real') and not isnan(val)]
+                        self._dbo.values = _bean_batch((self._host, mtype), mtrx, cltime)
                         self._dbo.stmt = self._dbo_stmts[app + "_" + appcomp]
                         self._bulk_insdb()
 
@@ -256,15 +1277,16 @@ class _BDMProcess():
         # Kerberos config specific to component
         old_kerb = self._kerb
         self._kerb = hbase["kerberos"]
-        for node in hbnodes:
-            try:
-                jdata = self._get_metrics(node)
-                self._host = node.split(':')[0]
-            except BDMonException as err:
+        #Active master and the regionservers list are required even if the bean is not collected
+        qrys = self._jmx_queries('hbase', 'hmaster', ('Hadoop:service=HBase,name=Master,sub=Server',))
+        keep = self._bean_filter('hbase', 'hmaster', ('"tag.isActiveMaster"',))
+        for node, host, jdata, err in self._fetch_masters(hbnodes, qrys, keep):
+            if err is not None:
                 self._lgr.warning("Unable to get HMaster metrics, ignoring Node:%s", node)
                 self._lgr.warning("Received Hmaster error:%s", err)
                 self.mtrx['warning'] += 1
                 continue
+            self._host = host
             is_active = 'N'
             cltime = datetime.now()
             for mtrx in jdata["beans"]:
@@ -283,21 +1305,19 @@ class _BDMProcess():
             for mtrx in jdata["beans"]:
                 mtype = mtrx["modelerType"]
                 self._lgr.debug("HMaster:%s ; Check metrics:%s", self._host, mtype)
-                #self._appmtrx: Dict {appname:{appcomponent:[(modelertype1, mtypename1),...]}}
-                if [mx for mx in self._appmtrx['hbase']['hmaster'] if mtype.startswith(mx[0])]:
+                if self._matcher('hbase', 'hmaster').match(mtype):
                     self._lgr.info("HMaster:%s ; Process metrics:%s", self._host, mtype)
                     if mtype == "sun.management.OperatingSystemImpl":
                         self._ins_osdata(mtrx, 'hbase', 'hmaster', cltime)
                     else:
-                        self._dbo.values = [(self._host, is_active, mtype, key, val, cltime) \
-                                            for key, val in mtrx.items()
-                                            if hasattr(val, 'real') and not isnan(val)]
+                        self._dbo.values = _bean_batch((self._host, is_active, mtype), mtrx, cltime)
                         self._dbo.stmt = self._dbo_stmts["hbase_hmaster"]
                         self._bulk_insdb()
         #Hmasters complete, now process regionservers
         try:
             self._lgr.info("RegionServer list: %s", rsrvrs)
-            self._get_metrics_workers(rsrvrs, hbase["rsport"], 'hbase', 'regionserver')
+            self._get_metrics_workers(rsrvrs, hbase["rsport"], 'hbase', 'regionserver',
+                                      hbase["rsworkers"])
         except UnboundLocalError as err:
             errmsg = "BDM-HB-00: Looks like we don't have an active HMaster, unable to get regionservers"
             self._lgr.error(errmsg)
@@ -315,53 +1335,45 @@ class _BDMProcess():
         hs2nodes = hive["hs2"].replace(' ', '').split(',')
         self._lgr.debug("Received HIVE config info:%s", hive)
         rcmp = re.compile(r"Count|Valid|Value") # ignore these metricnames
+        mtchr = self._matcher('hive', 'hs2')
         # Kerberos config specific to component
         old_kerb = self._kerb
         self._kerb = hive["kerberos"]
-        for node in hs2nodes:
-            try:
-                jdata = self._get_metrics(node)
-                self._host = node.split(':')[0]
-            except BDMonException as err:
+        for node, host, jdata, err in self._fetch_masters(hs2nodes, self._jmx_queries('hive', 'hs2'),
+                                                          self._bean_filter('hive', 'hs2')):
+            if err is not None:
                 self._lgr.warning("Unable to get HS2 metrics, ignoring Node:%s", node)
                 self._lgr.warning("Received HS2 error:%s", err)
                 self.mtrx['warning'] += 1
                 continue
-            insvals = []
+            self._host = host
             cltime = datetime.now()
+            #hs2node, modelerType, metricname, numvalue, collection_ts
+            batch = RowBatch((self._host,), cltime, 2)
             for mtrx in jdata["beans"]:
                 mtype = mtrx["modelerType"]
                 mname = mtrx["name"]
                 self._lgr.debug("HS2:%s ; Check metrics:%s - %s", self._host, mtype, mname)
-                #self._appmtrx: Dict {appname:{appcomponent:[(modelertype1, mtypename1),...]}}
-                ylst = [mtype.startswith(mx[0]) for mx in self._appmtrx['hive']['hs2']]
-                if any(ylst):
+                #The matching entry mtypename is either null or a prefix of mname
+                melem = mtchr.match(mtype, mname)
+                if melem is not None:
                     self._lgr.info("HS2:%s ; Process metrics:%s - %s", self._host, mtype, mname)
+                    self._lgr.debug("mType, mName: %s", melem)
                     if mtype == "sun.management.OperatingSystemImpl":
                         self._ins_osdata(mtrx, 'hive', 'hs2', cltime)
                     else:
-                        #Get the index of the mtype(True) value
-                        yindx = list(itertools.compress(range(len(ylst)), ylst))
-                        self._lgr.debug("Found mType index: %s", yindx)
-                        # For the mtype index (should be only one), check if mname is not null
-                        # Or, if mname starts with the modelerName
-                        melem = self._appmtrx['hive']['hs2'][yindx[0]]
-                        self._lgr.debug("mType, mName: %s", melem)
-                        if not melem[1] or mname.startswith(melem[1]):
-                            self._lgr.info("HS2: About to insert:%s", mtype)
-                            #hs2node, modelerType, metricname, numvalue, collection_ts
-                            #metricname is combination of modelerName + MetricName
-                            #e.g.java.lang:type=GarbageCollector,name=G1 Young Generation
-                            # and CollectionCount becomes "G1YoungGeneration-CollectionCount"
-                            #Also replace $ from modelerType, $ can cause problems in reporting
-                            insvals.append([(self._host, mtype.replace('$', ''),
-                                             str.rstrip(mname.split('=')[-1].replace(' ', '') + \
-                                              '-' + rcmp.sub('', key), '-'), val, cltime) \
-                                            for key, val in mtrx.items()
-                                            if hasattr(val, 'real') and not isnan(val)])
+                        self._lgr.info("HS2: About to insert:%s", mtype)
+                        #hs2node, modelerType, metricname, numvalue, collection_ts
+                        #metricname is combination of modelerName + MetricName
+                        #e.g.java.lang:type=GarbageCollector,name=G1 Young Generation
+                        # and CollectionCount becomes "G1YoungGeneration-Collection"
+                        #Also replace $ from modelerType, $ can cause problems in reporting
+                        prefix = mname.split('=')[-1].replace(' ', '') + '-'
+                        for key, val in mtrx.items():
+                            if hasattr(val, 'real') and not isnan(val):
+                                batch.add(mtype.replace('$', ''), (prefix + rcmp.sub('', key)).rstrip('-'), val)
             self._dbo.stmt = self._dbo_stmts["hive_hs2"]
-            #Expand the list of lists to list of insert values
-            self._dbo.values = list(itertools.chain(*insvals))
+            self._dbo.values = batch
             self._bulk_insdb()
         # Reset kerberos config
         self._kerb = old_kerb
@@ -376,94 +1388,172 @@ class _BDMProcess():
         # Kerberos config specific to component
         old_kerb = self._kerb
         self._kerb = sprk["kerberos"]
+        #Apps of this run, History Servers may list the same apps; their rows are not committed yet
+        seen = set()
         for node in shsnodes:
             self._host = node.split(':')[0]
-            #First, get the last run timestamp
-            #Get the list of applications since last run
-            self._dbo.stmt = ('select start_ts_str from t_spark_apps a, '
-                              '(select max(start_ts) as mxts from t_spark_apps where shshost=?) b '
-                              'where a.start_ts=b.mxts and a.shshost=?')
-            self._dbo.values = (self._host, self._host)
-            self._dbo.execstmt()
-            last_ts = self._dbo.crsr.fetchone()
+            uripath = sprk["uripath"] + '/applications'
+            #Get the list of applications since the last run
+            last_ts = self._get_spark_watermark()
             if last_ts:
-                self._lgr.info("Collect Spark metrics after:%s", last_ts[0])
-                self._uripath += '?minDate=' + last_ts[0]
+                self._lgr.info("Collect Spark metrics after:%s", last_ts)
+                uripath += '?minDate=' + last_ts
             elif sprk["mtrxdate"]:
                 self._lgr.info("From config-Collect Spark metrics after:%s", sprk["mtrxdate"])
-                self._uripath += '?minDate=' + sprk["mtrxdate"]
+                uripath += '?minDate=' + sprk["mtrxdate"]
             try:
-                jadata = self._get_metrics(node)
+                jadata = self._get_metrics(node, uripath)
             except BDMonException as err:
                 self._lgr.warning("Unable to get Spark History Server metrics, Node:%s", node)
                 self._lgr.warning("Received Spark History Server error:%s", err)
                 self.mtrx['warning'] += 1
                 continue
-            for app in jadata: # each element in json response is an application
-                self._dbo.stmt = self._dbo_stmts["spark_app"]
-                appid = app["id"]
-                self._lgr.info("Spark App:%s", appid)
-                attempt = app["attempts"][0]
-                #shshost, app_id, appname, start_ts, start_ts_str,sparkuser, time_taken
-                self._dbo.values = [(self._host, appid, app["name"], attempt["startTime"],
-                                     attempt["startTime"], attempt["sparkUser"],
-                                     attempt["duration"])]
-                try:
-                    self._dbo.execstmt()
-                except BDMonException as err:
-                    if "duplicate key value" in str(err):
-                        #application information has already been captured
-                        self._lgr.warning("Spark App already captured:%s", appid)
-                        self.mtrx['warning'] += 1
-                    else:
-                        self._lgr.error("DB error on Spark App:%s", appid)
-                        self.mtrx['error'] += 1
-                else:
-                    #For each application gather the executor metrics
-                    try:
-                        self._uripath = sprk["uripath"] + '/applications/' + appid + '/executors'
-                        jedata = self._get_metrics(node)
-                    except BDMonException as err:
-                        self._lgr.warning("Unable to get executor metrics for:%s", self._uripath)
-                        self._lgr.warning("Received node error:%s", err)
-                        self.mtrx['warning'] += 1
-                    else:
-                        emtrx = jedata[0]
-                        sprkhost = emtrx["hostPort"].split(":")[0] # ignore the port
-                        exectime = emtrx["addTime"]
-                        #app_id, sprkhost, metricname, numvalue, execution_ts
-                        self._dbo.values = [(appid, sprkhost, key, val, exectime) \
-                                            for key, val in \
-                                            itertools.chain(emtrx.items(),
-                                                            emtrx["memoryMetrics"].items())
-                                            if hasattr(val, 'real') and not isnan(val)]
-                        self._dbo.stmt = self._dbo_stmts["spark_exec"]
-                        self._bulk_insdb()
-                    #For each application gather the stage metrics
-                    try:
-                        self._uripath = sprk["uripath"] + '/applications/' + appid + '/stages'
-                        jsdata = self._get_metrics(node)
-                    except BDMonException as err:
-                        self._lgr.warning("Unable to get Stage metrics for:%s", self._uripath)
-                        self._lgr.warning("Received node error:%s", err)
-                        self.mtrx['warning'] += 1
-                    else:
-                        for stg in jsdata:
-                            #app_id, stageid, metricname, numvalue, launch_ts
-                            try:
-                                sst = stg["submissionTime"]
-                            except KeyError:
-                                self._lgr.info("Stage Status: SKIPPED, stageid:%s", stg["stageId"])
-                            else:
-                                self._dbo.values = [(appid, stg["stageId"], key, val, sst) \
-                                                    for key, val in stg.items()
-                                                    if hasattr(val, 'real') and not isnan(val) and \
-                                                       key not in ('stageId', 'attemptId')]
-                                self._dbo.stmt = self._dbo_stmts["spark_stgs"]
-                                self._bulk_insdb()
+            if not jadata:
+                continue
+            #Oldest applications first, so a capped run resumes from where it stopped
+            jadata = sorted(jadata, key=lambda app: app["attempts"][0]["startTime"])
+            #minDate is inclusive, applications already captured are skipped
+            known = self._get_spark_knownapps([app["id"] for app in jadata])
+            newapps = [app for app in jadata if app["id"] not in known and app["id"] not in seen]
+            self._lgr.info("Spark Apps received:%d, already captured:%d", len(jadata),
+                           len(jadata) - len(newapps))
+            wmark = jadata[-1]["attempts"][0]["startTime"]
+            if sprk["maxapps"] and len(newapps) > sprk["maxapps"]:
+                self._lgr.info("Spark Apps deferred to the next run:%s", len(newapps) - sprk["maxapps"])
+                self.mtrx['sparkAppsDeferred'] = self.mtrx.get('sparkAppsDeferred', 0) + \
+                                                 len(newapps) - sprk["maxapps"]
+                newapps = newapps[:sprk["maxapps"]]
+                wmark = newapps[-1]["attempts"][0]["startTime"]
+            seen.update(app["id"] for app in newapps)
+            #shshost, app_id, appname, start_ts, start_ts_str,sparkuser, time_taken
+            self._dbo.values = [(self._host, app["id"], app["name"], app["attempts"][0]["startTime"],
+                                 app["attempts"][0]["startTime"], app["attempts"][0]["sparkUser"],
+                                 app["attempts"][0]["duration"]) for app in newapps]
+            self._dbo.stmt = self._dbo_stmts["spark_app"]
+            self._bulk_insdb()
+            if self._writers is None:
+                self._set_spark_watermark(self._dbo, self._host, wmark)
+            else:
+                #Written by the writer of the application rows, in the same transaction
+                self._writers.call(self._dbo_stmts["spark_app"],
+                                   functools.partial(self._set_spark_watermark, shshost=self._host,
+                                                     last_ts=wmark))
+            self._get_spark_appdetails(node, sprk, [app["id"] for app in newapps])
         # Reset kerberos config
         self._kerb = old_kerb
 
+    def _get_spark_watermark(self):
+        """Function to get the start time of the last application captured from the History Server"""
+        self._dbo.stmt = 'select last_start_ts_str from t_spark_watermark where shshost=?'
+        self._dbo.values = (self._host,)
+        self._dbo.execstmt()
+        last_ts = self._dbo.crsr.fetchone()
+        if last_ts:
+            return last_ts[0]
+        #No watermark yet e.g. upgraded install, start from the applications captured
+        self._dbo.stmt = ('select start_ts_str from t_spark_apps a, '
+                          '(select max(start_ts) as mxts from t_spark_apps where shshost=?) b '
+                          'where a.start_ts=b.mxts and a.shshost=?')
+        self._dbo.values = (self._host, self._host)
+        self._dbo.execstmt()
+        last_ts = self._dbo.crsr.fetchone()
+        return last_ts[0] if last_ts else ''
+
+    @staticmethod
+    def _set_spark_watermark(dbo, shshost, last_ts):
+        """Function to save the start time of the last application captured from the History Server
+        dbo is the connection of the application rows, the watermark is committed with them"""
+        dbo.stmt = ('update t_spark_watermark set last_start_ts=?, last_start_ts_str=?, '
+                    'updated_ts=? where shshost=?')
+        dbo.values = (last_ts, last_ts, datetime.now(), shshost)
+        dbo.execstmt()
+        if dbo.crsr.rowcount < 1:
+            dbo.stmt = ('insert into t_spark_watermark '
+                        '(shshost, last_start_ts, last_start_ts_str, updated_ts) '
+                        'values(?, ?, ?, ?)')
+            dbo.values = [(shshost, last_ts, last_ts, datetime.now())]
+            dbo.execstmt()
+        dbo.stmt = ''
+        dbo.values = ''
+
+    def _get_spark_knownapps(self, appids, chunk=500):
+        """Function to get the set of app_ids already captured, out of the given app_ids"""
+        known = set()
+        for idx in range(0, len(appids), chunk):
+            ids = appids[idx:idx + chunk]
+            self._dbo.stmt = ('select app_id from t_spark_apps where app_id in (%s)'
+                              % ', '.join('?' * len(ids)))
+            self._dbo.values = ids
+            self._dbo.execstmt()
+            known.update(row[0] for row in self._dbo.crsr.fetchall())
+        self._dbo.stmt = ''
+        self._dbo.values = ''
+        return known
+
+    def _get_spark_appdetails(self, node, sprk, appids):
+        """Function to gather the executor and stage metrics of the applications
+        Up to appworkers applications are fetched at a time, each application is written as one batch
+        The GETs to the History Server are limited to the connections pooled per host"""
+        workers = sprk["appworkers"] * 2
+        if workers > self._sessions.poolmaxsize:
+            self._lgr.info('Spark GETs limited to %s at a time, raise poolmaxsize for appworkers:%s',
+                           self._sessions.poolmaxsize, sprk["appworkers"])
+            workers = self._sessions.poolmaxsize
+        reqs = []
+        for appid in appids:
+            for sres in ('executors', 'stages'):
+                reqs.append(((appid, sres), node,
+                             sprk["uripath"] + '/applications/' + appid + '/' + sres))
+        #Both sub-resources of an application are kept until the application is complete
+        pending = {}
+        for (appid, sres), jdata, err in self._fetch_many(reqs, workers):
+            if err is not None:
+                self._lgr.warning("Unable to get %s metrics for:%s", sres, appid)
+                self._lgr.warning("Received node error:%s", err)
+                self.mtrx['warning'] += 1
+            appdata = pending.setdefault(appid, {})
+            appdata[sres] = jdata
+            if len(appdata) < 2:
+                continue
+            del pending[appid]
+            if appdata['executors'] is not None:
+                self._ins_spark_executors(appid, appdata['executors'])
+            if appdata['stages'] is not None:
+                self._ins_spark_stages(appid, appdata['stages'])
+
+    def _ins_spark_executors(self, appid, jedata):
+        """Function to insert spark application executor metrics"""
+        emtrx = jedata[0]
+        sprkhost = emtrx["hostPort"].split(":")[0] # ignore the port
+        exectime = emtrx["addTime"]
+        #app_id, sprkhost, metricname, numvalue, execution_ts
+        self._dbo.values = [(appid, sprkhost, key, val, exectime) \
+                            for key, val in \
+                            itertools.chain(emtrx.items(),
+                                            emtrx["memoryMetrics"].items())
+                            if hasattr(val, 'real') and not isnan(val)]
+        self._dbo.stmt = self._dbo_stmts["spark_exec"]
+        self._bulk_insdb()
+
+    def _ins_spark_stages(self, appid, jsdata):
+        """Function to insert spark application stage metrics"""
+        values = []
+        for stg in jsdata:
+            #app_id, stageid, metricname, numvalue, launch_ts
+            try:
+                sst = stg["submissionTime"]
+            except KeyError:
+                self._lgr.info("Stage Status: SKIPPED, stageid:%s", stg["stageId"])
+            else:
+                values.extend((appid, stg["stageId"], key, val, sst) \
+                              for key, val in stg.items()
+                              if hasattr(val, 'real') and not isnan(val) and \
+                                 key not in ('stageId', 'attemptId'))
+        #All the stages of an application are written as one batch
+        self._dbo.values = values
+        self._dbo.stmt = self._dbo_stmts["spark_stgs"]
+        self._bulk_insdb()
+
     def get_metrics_yarn(self):
         """Function to process YARN active/standby jmx data"""
         ## Get the resourcemanager nodes, uri protocol, uri_path
@@ -475,9 +1565,15 @@ class _BDMProcess():
         # Kerberos config specific to component
         old_kerb = self._kerb
         self._kerb = yarn["kerberos"]
+        #nodemanagers list is required even if the bean is not collected
+        extra = ()
+        if not yarn["nmnodes"]:
+            extra = ('Hadoop:service=ResourceManager,name=RMNMInfo::LiveNodeManagers',)
+        qrys = self._jmx_queries('yarn', 'rm', extra)
+        keep = self._bean_filter('yarn', 'rm', ('"LiveNodeManagers"',))
         for node in rmnodes:
             try:
-                jdata = self._get_metrics(node)
+                jdata = self._get_beans(node, qrys, keep)
                 self._host = node.split(':')[0]
             except BDMonException as err:
                 self._lgr.warning("Unable to get RM metrics, ignoring Node:%s", node)
@@ -492,22 +1588,18 @@ class _BDMProcess():
                         rmnodes = yarn["nmnodes"].replace(' ', '').split(',')
                         self._lgr.info("Restricted RMNodes: %s, Total:%s", rmnodes, len(rmnodes))
                     else: #Get the list of all rmnodes
-                        lnodes = ujson.loads(mtrx["LiveNodeManagers"])
-                        self._lgr.info("Total RMNodes to process: %s", len(lnodes))
-                        rmnodes = [rmn["NodeHTTPAddress"] for rmn in lnodes]
+                        rmnodes = _NMADDR_RCMP.findall(mtrx["LiveNodeManagers"])
+                        self._lgr.info("Total RMNodes to process: %s", len(rmnodes))
                     break
             for mtrx in jdata["beans"]:
                 mtype = mtrx["modelerType"]
                 self._lgr.debug("RMNode:%s ; Check metrics:%s", self._host, mtype)
-                #self._appmtrx: Dict {appname:{appcomponent:[(modelertype1, mtypename1),...]}}
-                if [mx for mx in self._appmtrx['yarn']['rm'] if mtype.startswith(mx[0])]:
+                if self._matcher('yarn', 'rm').match(mtype):
                     self._lgr.info("RMNode:%s ; Process metrics:%s", self._host, mtype)
                     if mtype == "sun.management.OperatingSystemImpl":
                         self._ins_osdata(mtrx, 'yarn', 'rm', cltime)
                     else:
-                        self._dbo.values = [(self._host, mtype, key, val, cltime) \
-                                            for key, val in mtrx.items()
-                                            if hasattr(val, 'real') and not isnan(val)]
+                        self._dbo.values = _bean_batch((self._host, mtype), mtrx, cltime)
                         self._dbo.stmt = self._dbo_stmts["yarn_rm"]
                         self._bulk_insdb()
             #Yarn RMs can be in Active-StandBy mode,
@@ -516,7 +1608,7 @@ class _BDMProcess():
         #RMnodes complete, now process NMnodes
         try:
             self._lgr.info("NMnodes list: %s", rmnodes)
-            self._get_metrics_workers(rmnodes, yarn["nmport"], 'yarn', 'nm')
+            self._get_metrics_workers(rmnodes, yarn["nmport"], 'yarn', 'nm', yarn["nmworkers"])
         except UnboundLocalError as err:
             errmsg = "BDM-YN-00: Looks like we don't have an active ResourceManager"
             self._lgr.error(errmsg)
@@ -526,149 +1618,340 @@ class _BDMProcess():
         # Reset kerberos config
         self._kerb = old_kerb
 
+    def _fetch_zk(self, zknodes, cmds=('stat',)):
+        """Generator to send the four letter words cmds to all the ZK quorum nodes concurrently, over
+        non-blocking sockets; yields (node, cmd, response, error)
+        A ZK node closes the connection once the response is sent, timeout is 1.0s of inactivity"""
+        sel = selectors.DefaultSelector()
+        results = []
+        try:
+            for node in zknodes:
+                for cmd in cmds:
+                    skt = None
+                    try:
+                        host, port = node.split(':')
+                        self._lgr.info('Connecting to ZK node :%s at port:%s', host, port)
+                        hostip = socket.gethostbyname(host)
+                        skt = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                        skt.setblocking(False)
+                        skt.connect_ex((hostip, int(port)))
+                    except (socket.gaierror, ValueError, socket.error) as err:
+                        if skt is not None:
+                            skt.close()
+                        results.append((node, cmd, None, err))
+                        continue
+                    #[node, cmd, bytes to send, response chunks, last activity]
+                    sel.register(skt, selectors.EVENT_WRITE, [node, cmd, str.encode(cmd), [], monotonic()])
+            while sel.get_map():
+                for key, _ in sel.select(0.1):
+                    node, cmd, out, msgs, _ = key.data
+                    key.data[4] = monotonic()
+                    try:
+                        if out:
+                            err = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                            if err:
+                                raise socket.error(err, os.strerror(err))
+                            key.data[2] = out[key.fileobj.send(out):]
+                            if not key.data[2]:
+                                sel.modify(key.fileobj, selectors.EVENT_READ, key.data)
+                            continue
+                        resp = key.fileobj.recv(4096)
+                        if resp:
+                            msgs.append(resp)
+                            continue
+                        resp = b''.join(msgs).decode()
+                        self._lgr.debug('ZK data: %s', resp)
+                        results.append((node, cmd, resp, None))
+                    except (socket.error, UnicodeDecodeError) as err:
+                        results.append((node, cmd, None, err))
+                    sel.unregister(key.fileobj)
+                    key.fileobj.close()
+                now = monotonic()
+                for key in list(sel.get_map().values()):
+                    if now - key.data[4] > 1.0:
+                        results.append((key.data[0], key.data[1], None, socket.timeout('timed out')))
+                        sel.unregister(key.fileobj)
+                        key.fileobj.close()
+        finally:
+            for key in list(sel.get_map().values()):
+                key.fileobj.close()
+            sel.close()
+        return iter(results)
+
     def get_metrics_zookeeper(self):
         """Function to process zookeeper quorum metrics"""
         zkq = getzkdetails(self._lgr)
         #e.g. namenode:2181,snode:2181,datanode1:2181
-        zknodes = zkq.replace(' ', '').split(',')
+        zknodes = zkq["quorum"].replace(' ', '').split(',')
+        #mntr has no client connections, cons lists them
+        cmds = ('mntr', 'cons') if zkq["cmd"] == 'mntr' else ('stat',)
         errmsg = ''
-        for node in zknodes:
-            self._host, port = node.split(':')
-            try:
-                conn = _SocketConn(self._lgr, self._host, int(port))
-                # Using a context manager to work with sockets
-                with conn as zks:
-                    msgs = []
-                    snt = zks.send(str.encode('stat'))
-                    #Sent message length should match
-                    if snt != 4:
-                        errmsg = 'BDM-SK-03: Cannot send stat to ZK node %s:%s' %(self._host, port)
-                        self._lgr.error(errmsg)
-                        self.mtrx['error'] += 1
-                        raise BDMonException(errmsg)
-                    while True:
-                        resp = zks.recv(4096)
-                        if resp:
-                            msg = resp.decode()
-                            self._lgr.debug('ZK data: %s', msg)
-                            msgs.append(msg)
-                        else:
-                            break
-            except (socket.gaierror, ValueError, socket.error, BDMonException) as err:
-                errmsg = 'BDM-SK-00: Connection error to ZK node %s:%s' %(self._host, port)
+        for node, cmd, resp, err in self._fetch_zk(zknodes, cmds):
+            self._host = node.split(':')[0]
+            if err is not None:
+                errmsg = 'BDM-SK-00: Connection error to ZK node %s' %node
                 self._lgr.warning(errmsg)
-                self._lgr.warning("Unable to get zookeeper metrics, Node:%s", node)
+                self._lgr.warning("Unable to get zookeeper %s metrics, Node:%s", cmd, node)
                 self._lgr.warning("Received ZK Server error:%s", err)
                 self.mtrx['warning'] += 1
-            else:
-                if msgs:
-                    cltime = datetime.now()
-                    resp = ''.join(msgs)
-                    self._lgr.info('Response Length:%s', len(resp))
-                    zk_mtrx = []
-                    zk_mode = resp.split('\nMode: ')[1][0]  #l-leader, f-follower, s-standalone
-                    for stat in resp.split('\n'):
-                        self._lgr.debug('ZK status item:%s', stat)
-                        zkrow = stat.split(':')
-                        if stat.startswith('Latency'):
-                            # e.g. Latency min/avg/max: 0/0/16
-                            for ltype, lval in zip(zkrow[0].strip('Latency ').split('/'),
-                                                   zkrow[1].strip().split('/')):
-                                #hostnode, zk_mode, metricname, numvalue, collection_ts
-                                try:
-                                    zk_mtrx.append((self._host, zk_mode, ltype + '_latency',
-                                                    float(lval), cltime))
-                                except ValueError:
-                                    self._lgr.warning('Ignore zk Latency key %s', ltype)
-                                    self.mtrx['warning'] += 1
-                        elif "](queued=" in stat:
-                            self._lgr.info('ZK client: %s', stat)
-                            #e.g. /x.x.x.x:xxxx[0](queued=0,recved=1,sent=0)
-                            clnt_host = stat.split(':')[0].replace('/', '')
-                            clnt_mtrx = []
-                            for clval in stat.split('](')[1].replace(')', '').split(','):
-                                mname, nval = clval.split('=')
-                                self._lgr.info('ZK client mname:%s, val=%s', mname, nval)
-                                #zk_hostnode, client_hostnode, metricname, numvalue, collection_ts
-                                try:
-                                    clnt_mtrx.append((self._host, clnt_host, mname,
-                                                      float(nval), cltime))
-                                except ValueError:
-                                    self._lgr.warning('Ignore zk client %s', clval)
-                                    self.mtrx['warning'] += 1
-                            self._dbo.values = clnt_mtrx
-                            self._dbo.stmt = self._dbo_stmts["zk_conn_mtrx"]
-                            self._bulk_insdb()
-                        elif len(zkrow) == 2 and zkrow[0] and zkrow[1]:
-                            self._lgr.info('ZK Key: %s ; Val:%s', zkrow[0], zkrow[1])
-                            #hostnode, zk_mode, metricname, numvalue, collection_ts
-                            try:
-                                zk_mtrx.append((self._host, zk_mode, zkrow[0],
-                                                float(zkrow[1]), cltime))
-                            except ValueError:
-                                self._lgr.warning('Ignore zk key %s', zkrow[0])
-                                self.mtrx['warning'] += 1
-                    self._dbo.values = zk_mtrx
-                    self._dbo.stmt = self._dbo_stmts["zk_mtrx"]
-                    self._bulk_insdb()
-                else:  #We received no response from ZK server within the timeout period
-                    errmsg = 'BDM-SK-05: No response from ZK node %s:%s' %(self._host, port)
-                    self._lgr.warning(errmsg)
-                    self._lgr.warning("Unable to get zookeeper metrics, Node:%s", node)
-                    self.mtrx['warning'] += 1
+            elif resp:
+                self._lgr.info('Response Length:%s', len(resp))
+                if cmd == 'mntr':
+                    self._ins_zk_mntr(resp, datetime.now())
+                else:
+                    self._ins_zk_stat(resp, datetime.now(), zkq["aggclients"] == 'y')
+            else:  #We received no response from ZK server within the timeout period
+                errmsg = 'BDM-SK-05: No response from ZK node %s' %node
+                self._lgr.warning(errmsg)
+                self._lgr.warning("Unable to get zookeeper %s metrics, Node:%s", cmd, node)
+                self.mtrx['warning'] += 1
         if errmsg: # there were errors when capturing ZK metrics on one or more nodes
             raise BDMonException(errmsg)
 
-    def _get_metrics(self, app_host_port):
-        """ GET JMX data from URIs"""
-        app_uri = self._proto + "://" + app_host_port + self._uripath
+    def _ins_zk_mntr(self, resp, cltime):
+        """Function to insert the zk server metrics of a mntr response, a tab separated name, value per line"""
+        zk_mtrx = []
+        stats = [stat.split('\t', 1) for stat in resp.splitlines() if '\t' in stat]
+        #l-leader, f-follower, s-standalone, o-observer
+        zk_mode = ''.join(val for key, val in stats if key == 'zk_server_state')[:1] or 's'
+        for key, val in stats:
+            #hostnode, zk_mode, metricname, numvalue, collection_ts
+            try:
+                zk_mtrx.append((self._host, zk_mode, key, float(val), cltime))
+            except ValueError: #e.g. zk_version
+                self._lgr.debug('Ignore zk key %s', key)
+        self._dbo.values = zk_mtrx
+        self._dbo.stmt = self._dbo_stmts["zk_mtrx"]
+        self._bulk_insdb()
+
+    def _ins_zk_stat(self, resp, cltime, aggclients=False):
+        """Function to insert the zk server and client metrics of a stat response
+        A cons response has the client lines only. The client metrics of the node are written as one batch,
+        summed per client host with aggclients"""
+        zk_mtrx = []
+        conn_mtrx = []
+        #(client_hostnode, metricname): numvalue summed over the client sockets of the host
+        conn_agg = OrderedDict()
+        zk_mode = ''
+        if '\nMode: ' in resp:
+            zk_mode = resp.split('\nMode: ')[1][0]  #l-leader, f-follower, s-standalone
+        for stat in resp.split('\n'):
+            self._lgr.debug('ZK status item:%s', stat)
+            zkrow = stat.split(':')
+            if stat.startswith('Latency'):
+                # e.g. Latency min/avg/max: 0/0/16
+                for ltype, lval in zip(zkrow[0].strip('Latency ').split('/'),
+                                       zkrow[1].strip().split('/')):
+                    #hostnode, zk_mode, metricname, numvalue, collection_ts
+                    try:
+                        zk_mtrx.append((self._host, zk_mode, ltype + '_latency',
+                                        float(lval), cltime))
+                    except ValueError:
+                        self._lgr.warning('Ignore zk Latency key %s', ltype)
+                        self.mtrx['warning'] += 1
+            elif "](queued=" in stat:
+                self._lgr.info('ZK client: %s', stat)
+                #e.g. /x.x.x.x:xxxx[0](queued=0,recved=1,sent=0), the port dropped, IPv6 addresses too
+                clnt_host = stat.split('[')[0].strip().lstrip('/').rsplit(':', 1)[0]
+                if aggclients:
+                    conn_agg[(clnt_host, 'connections')] = conn_agg.get((clnt_host, 'connections'), 0.0) + 1
+                for clval in stat.split('](')[1].replace(')', '').split(','):
+                    mname, _, nval = clval.partition('=')
+                    self._lgr.debug('ZK client mname:%s, val=%s', mname, nval)
+                    try:
+                        nval = float(nval)
+                    except ValueError: #e.g. cons sid=0x16b, lop=PING
+                        self._lgr.debug('Ignore zk client %s', clval)
+                        continue
+                    if aggclients:
+                        conn_agg[(clnt_host, mname)] = conn_agg.get((clnt_host, mname), 0.0) + nval
+                    else:
+                        #zk_hostnode, client_hostnode, metricname, numvalue, collection_ts
+                        conn_mtrx.append((self._host, clnt_host, mname, nval, cltime))
+            elif len(zkrow) == 2 and zkrow[0] and zkrow[1]:
+                self._lgr.info('ZK Key: %s ; Val:%s', zkrow[0], zkrow[1])
+                #hostnode, zk_mode, metricname, numvalue, collection_ts
+                try:
+                    zk_mtrx.append((self._host, zk_mode, zkrow[0],
+                                    float(zkrow[1]), cltime))
+                except ValueError:
+                    self._lgr.warning('Ignore zk key %s', zkrow[0])
+                    self.mtrx['warning'] += 1
+        if zk_mtrx:
+            self._dbo.values = zk_mtrx
+            self._dbo.stmt = self._dbo_stmts["zk_mtrx"]
+            self._bulk_insdb()
+        conn_mtrx.extend((self._host, clnt_host, mname, nval, cltime)
+                         for (clnt_host, mname), nval in conn_agg.items())
+        if conn_mtrx:
+            self._lgr.info('ZK client metrics:%s', len(conn_mtrx))
+            self._dbo.values = conn_mtrx
+            self._dbo.stmt = self._dbo_stmts["zk_conn_mtrx"]
+            self._bulk_insdb()
+
+    def _read_beans(self, res, keep):
+        """Function to read a jmx response one bean at a time
+        Beans are decoded only if keep(modelerType, bean text) is True"""
+        decoder = codecs.getincrementaldecoder(res.encoding or 'utf-8')()
+        beans = []
+        for raw in _iter_beans(decoder.decode(chunk) for chunk in res.iter_content(65536)):
+            mtch = _MTYPE_RCMP.search(raw)
+            mtype = mtch.group(1) if mtch else ''
+            if '\\' in mtype:
+                mtype = json.loads('"' + mtype + '"')
+            if keep(mtype, raw):
+                try:
+                    beans.append(ujson.loads(raw))
+                except ValueError: #NaN, Infinity are not supported by older ujson
+                    beans.append(json.loads(raw))
+        return {"beans": beans}
+
+    def _get_metrics(self, app_host_port, uripath=None, keep=None):
+        """ GET JMX data from URIs
+        keep: bean filter, if set the jmx response is parsed as a stream and only the beans to keep
+        are returned"""
+        if uripath is None:
+            uripath = self._uripath
+        app_uri = self._proto + "://" + app_host_port + uripath
+        stream = keep is not None
         self._lgr.info('Invoking:%s', app_uri)
         self._lgr.info('Kerberos setting:%s', self._kerb)
         self._lgr.info('VerifyTLS setting:%s', self._tlsverify)
+        health = self._sessions.health
+        if not health.allow(app_host_port):
+            errmsg = 'BDM-URI-07: Skipping unreachable host until its backoff expires:%s' %app_host_port
+            self._lgr.info(errmsg)
+            raise BDMonException(errmsg)
+        timeout = health.timeouts(app_host_port)
         try:
             if self._kerb == 'y':
-                res = requests.get(app_uri, timeout=1.0, verify=self._tlsverify, auth=HTTPKerberosAuth())
+                res = self._sessions.get(app_host_port, app_uri, timeout=timeout, verify=self._tlsverify,
+                                         auth=HTTPKerberosAuth(), stream=stream)
             else:
-                res = requests.get(app_uri, timeout=1.0, verify=self._tlsverify)
+                res = self._sessions.get(app_host_port, app_uri, timeout=timeout, verify=self._tlsverify,
+                                         stream=stream)
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+            health.failure(app_host_port)
             errmsg = 'BDM-URI-00: Connection error to metrics URI:%s' %app_uri
             self._lgr.error(errmsg)
             self._lgr.error(err)
-            self.mtrx['error'] += 1
+            self._incr('error')
             raise BDMonException(err)
-        if res.status_code == 200:
-            try:
-                dct = res.json()
-            except ValueError as err:
-                errmsg = 'BDM-URI-03: FAILED to get a valid json response'
+        finally:
+            #A probe is never left in progress
+            health.release(app_host_port)
+        health.success(app_host_port, res.elapsed.total_seconds())
+        try:
+            if res.status_code == 200:
+                try:
+                    if stream:
+                        dct = self._read_beans(res, keep)
+                    else:
+                        dct = res.json()
+                except (ValueError, requests.exceptions.RequestException) as err:
+                    if isinstance(err, requests.exceptions.ConnectionError): #e.g. read timeout
+                        health.failure(app_host_port)
+                    errmsg = 'BDM-URI-03: FAILED to get a valid json response'
+                    self._lgr.error(errmsg)
+                    self._lgr.error(err)
+                    self._incr('error')
+                    raise BDMonException(err)
+                self._lgr.debug('GET results:%s', dct)
+            else:
+                errmsg = 'BDM-URI-05: Application metrics collection error %s'  %res.status_code
                 self._lgr.error(errmsg)
-                self._lgr.error(err)
-                self.mtrx['error'] += 1
-                raise BDMonException(err)
-            self._lgr.debug('GET results:%s' %dct)
-        else:
-            errmsg = 'BDM-URI-05: Application metrics collection error %s'  %res.status_code
-            self._lgr.error(errmsg)
-            self.mtrx['error'] += 1
-            raise BDMonException(errmsg)
+                self._incr('error')
+                raise BDMonException(errmsg)
+        finally:
+            res.close()
         return dct
 
+class _BDMAsyncProcess(_BDMProcess):
+    """ asyncio collection engine; the GETs and ZooKeeper commands of an app are issued as coroutines
+    Responses are processed and stored exactly as in _BDMProcess, on the calling thread """
+    def __init__(self, lgr, dbo, dct, inflight=32, sessions=None, writers=None, dims=None, deadband=None,
+                 counters=None):
+        super().__init__(lgr, dbo, dct, sessions, writers, dims, deadband, counters)
+        #The loop is not set as the current event loop of the thread, it is run only by this engine
+        self._loop = asyncio.new_event_loop()
+        #Global limit of requests in flight, across all nodes and apps
+        self._inflight = self._semaphore(inflight)
+        #requests/requests_kerberos are blocking, HTTP GETs are awaited on an executor
+        self._pool = ThreadPoolExecutor(max_workers=inflight)
 
-def _process_metrics(lgr, applst):
-    """Function to process BD metrics data"""
+    def close(self):
+        """Function to release the event loop and the executor threads"""
+        super().close()
+        self._pool.shutdown(wait=True)
+        self._loop.close()
+
+    def _semaphore(self, value):
+        """Function to get a semaphore of the event loop, created on the loop as it binds to the current
+        event loop on python < 3.10"""
+        async def _new():
+            return asyncio.Semaphore(value)
+        return self._loop.run_until_complete(_new())
+
+    def _as_completed(self, coros):
+        """Generator to run the coroutines on the event loop, yields the results as they complete"""
+        pending = {self._loop.create_task(coro) for coro in coros}
+        try:
+            while pending:
+                done, pending = self._loop.run_until_complete(
+                    asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+                for tsk in done:
+                    yield tsk.result()
+        finally:
+            #Consumer stopped early, cancel the rest
+            for tsk in pending:
+                tsk.cancel()
+            if pending:
+                self._loop.run_until_complete(asyncio.wait(pending))
+
+    async def _afetch(self, workers, key, app_host_port, uripath=None, qrys=None, keep=None):
+        """Coroutine to GET jmx/json data, at most workers at a time; returns (key, data, error)"""
+        async with workers:
+            async with self._inflight:
+                return await self._loop.run_in_executor(self._pool, self._fetch, key,
+                                                        app_host_port, uripath, qrys, keep)
+
+    def _fetch_many(self, reqs, workers=1):
+        """Generator to GET a list of (key, host:port, uripath) requests concurrently
+        At most workers at a time, also bounded by the global inflight limit"""
+        sem = self._semaphore(workers)
+        return self._as_completed(self._afetch(sem, *req) for req in reqs)
+
+    async def _azk_cmd(self, node, cmd='stat'):
+        """Coroutine to send a four letter word to a ZK node; returns (node, cmd, response, error)"""
+        async with self._inflight:
+            try:
+                host, port = node.split(':')
+                self._lgr.info('Connecting to ZK node :%s at port:%s', host, port)
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), 1.0)
+                try:
+                    writer.write(str.encode(cmd))
+                    await writer.drain()
+                    #ZK closes the connection once the response is sent
+                    resp = await asyncio.wait_for(reader.read(), 1.0)
+                finally:
+                    writer.close()
+            except (OSError, ValueError, asyncio.TimeoutError) as err:
+                return (node, cmd, None, err)
+        self._lgr.debug('ZK data: %s', resp)
+        return (node, cmd, resp.decode(), None)
+
+    def _fetch_zk(self, zknodes, cmds=('stat',)):
+        """Generator to send the cmds to all the ZK quorum nodes concurrently"""
+        return self._as_completed(self._azk_cmd(node, cmd) for node in zknodes for cmd in cmds)
+
+
+def _load_mtrx(lgr, dbo, applst):
+    """Function to get the compiled list of the metrics to collect of the applications"""
     # Get the list of applications, components and metrics to collect
     dct = {}
     for app in applst:
         dct[app] = {}
     lgr.info("List of applications initialized: %s", dct)
-    try:
-        dbo = DbOps(lgr)
-        lgr.info('DB Connection ready')
-    except BDMonException as err:
-        errmsg = 'BDM-PM-00: Unable to create database connection'
-        lgr.error(errmsg)
-        lgr.error(err)
-        raise BDMonException(err)
     dbo.stmt = "select appname, appcomponent, modelertype, mtypename from t_coll_metrics where \
                 appname in (" + ",".join(("'" + x + "'" for x in applst)) + ") and is_active='Y'"
     dbo.execstmt()
@@ -682,16 +1965,135 @@ def _process_metrics(lgr, applst):
     dbo.stmt = ''
     lgr.info("List of application metrics to collect confirmed")
     lgr.debug("List of application metrics: %s", dct)
+    return _compile_mtrx(dct)
+
+def _getdbo(lgr):
+    """Function to get a database connection"""
+    try:
+        dbo = DbOps(lgr)
+        lgr.info('DB Connection ready')
+    except BDMonException as err:
+        errmsg = 'BDM-PM-00: Unable to create database connection'
+        lgr.error(errmsg)
+        lgr.error(err)
+        raise BDMonException(err)
+    return dbo
+
+def _getwriters(lgr, dbo, spool=None):
+    """Function to get the DB writer threads, None if inserts are written by the collectors"""
+    strg = getstoragedetails(lgr)
+    if strg["writers"] > 1 and dbo.dbtype.lower() == '{sqlite}':
+        #SQLite allows a single writer, more writers would only wait on the write lock
+        lgr.info('SQLite database, DB writers:%s reduced to 1', strg["writers"])
+        strg["writers"] = 1
+    if strg["writers"]:
+        return _DbWriters(lgr, strg["writers"], strg["queuesize"], spool, strg["spoolwait"])
+    return None
+
+def _getspool(lgr, dbo):
+    """Function to get the spool of the inserts and its replay thread, (None, None) unless spool is set
+    The inserts of dbo are spooled while the database is unavailable"""
+    strg = getstoragedetails(lgr)
+    if strg["spool"] != 'y':
+        return None, None
+    try:
+        spool = DbSpool(lgr, strg["spooldir"], strg["spoolmaxmb"])
+    except OSError as err:
+        lgr.error('BDM-SP-00: Unable to create the spool directory %s: %s', strg["spooldir"], err)
+        return None, None
+    dbo.spool = spool
+    return spool, SpoolReplayer(lgr, spool, strg["spoolretry"])
+
+def _getdims(lgr):
+    """Function to get the host and metric ids cache, None unless the storage layout is normalized"""
+    if getstoragedetails(lgr)["layout"] == 'normalized':
+        lgr.info('Normalized storage layout')
+        return _IdCache(lgr)
+    return None
+
+def _getdeadband(lgr, applst):
+    """Function to get the last values cache, None unless the change-only ingestion is enabled"""
+    strg = getstoragedetails(lgr)
+    if strg["deadband"] == 'y':
+        lgr.info('Change-only ingestion, tolerance:%s, heartbeat:%s', strg["deadbandtol"], strg["heartbeat"])
+        path = os.path.join(strg["lastvaluesdir"], 'deadband_%s.json' % '_'.join(sorted(applst)))
+        return _Deadband(lgr, path, strg["deadbandtol"], strg["heartbeat"])
+    return None
+
+def _counterpattern(counters):
+    """Function to compile the counters column, comma separated metric names with * wildcards
+    e.g. *NumOps; hive metric names are <bean name>-<attribute without Count|Valid|Value>"""
+    pats = [pat for pat in counters.replace(' ', '').split(',') if pat]
+    if not pats:
+        return None
+    return re.compile('|'.join(fnmatch.translate(pat) for pat in pats))
+
+def _getcounters(lgr, dbo, applst):
+    """Function to get the counter rates, None unless counters are set in t_coll_metrics"""
+    counters = {}
+    dbo.stmt = 'select * from t_coll_metrics where 1=0'
+    dbo.values = ''
+    dbo.execstmt()
+    if 'counters' not in [col[0].lower() for col in dbo.crsr.description]:
+        #t_coll_metrics created before the counters column
+        lgr.info('No counters column in t_coll_metrics, counter rates disabled')
+        dbo.stmt = ''
+        return None
+    dbo.stmt = ("select appname, appcomponent, modelertype, counters from t_coll_metrics where "
+                "appname in (" + ",".join(("'" + x + "'" for x in applst)) + ") and is_active='Y' "
+                "and counters is not null")
+    dbo.execstmt()
+    rows = dbo.crsr.fetchall()
+    dbo.stmt = ''
+    for row in rows:
+        cpat = _counterpattern(row[3])
+        if cpat is not None:
+            counters.setdefault((row[0], row[1]), []).append((row[2], cpat))
+    if not counters:
+        return None
+    strg = getstoragedetails(lgr)
+    lgr.info('Counter rates of %s, mode:%s', list(counters), strg["counterrates"])
+    path = os.path.join(strg["lastvaluesdir"], 'counters_%s.json' % '_'.join(sorted(applst)))
+    return _CounterRates(lgr, path, counters, strg["counterrates"])
+
+def _getengine(lgr, dbo, dct, engine='', sessions=None, writers=None, dims=None, deadband=None, counters=None):
+    """Function to get the collection engine"""
+    eng = getenginedetails(lgr)
+    if not engine:
+        engine = eng["mode"]
+    lgr.info('Collection engine: %s', engine)
+    if engine == 'async':
+        return _BDMAsyncProcess(lgr, dbo, dct, eng["inflight"], sessions, writers, dims, deadband, counters)
+    return _BDMProcess(lgr, dbo, dct, sessions, writers, dims, deadband, counters)
+
+def _keep_lastvals(staged, *committed):
+    """Function to keep the staged last values, [(_LastValues, values),...], when all the rows are committed"""
+    if all(committed):
+        for lvals, values in staged:
+            lvals.commit(values)
+
+def _collect_apps(lgr, dbo, getmtrx, applst, writers=None, lastvals=()):
+    """Function to collect the metrics of the applications, in order
+    The last values (_LastValues) of an app are kept once its rows are committed
+    The collection performance is inserted to t_bdmon_metrics"""
     appstime = datetime.now()
+    etime = appstime
     lgr.info('Start processing of apps at %s ', appstime)
     #Invoke the processing method for each of the app
-    getmtrx = _BDMProcess(lgr, dbo, dct)
     for app in applst:
         stime = datetime.now()
         lgr.info('Start App processing: %s at %s', app, stime)
         try:
             fnc = 'get_metrics_' + app
             getattr(getmtrx, fnc)()
+            #Write the rows still buffered, an app is never committed partly with the next one
+            flushed = dbo.flush()
+            #The last values are kept once the rows of the app are committed
+            staged = [(lvals, lvals.stage()) for lvals in lastvals]
+            if writers is not None:
+                writers.endapp(app, functools.partial(_keep_lastvals, staged, flushed))
+            else:
+                _keep_lastvals(staged, flushed, True)
         except AttributeError as err:
             errmsg = 'BDM-APP-01: Invalid application name: %s ; Check config' %app
             lgr.error(errmsg)
@@ -699,10 +2101,21 @@ def _process_metrics(lgr, applst):
             getmtrx.mtrx['error'] += 1
         except BDMonException as err:
             dbo.rollback()
+            if writers is not None:
+                writers.abortapp(app)
+            for lvals in lastvals:
+                lvals.discard()
             lgr.error('BDM-APP-03: Error while processing application: %s', app)
         etime = datetime.now()
         getmtrx.mtrx[app + "CollectionTime"] = (etime - stime).total_seconds()
         lgr.info('End App processing: %s at %s; Total time:%s', app, etime, etime - stime)
+    getmtrx.close()
+    for key, val in dbo.stats.items():
+        getmtrx.mtrx[key] = val
+    if writers is not None:
+        #Wait for the queued inserts to be written
+        for key, val in writers.drain().items():
+            getmtrx.mtrx[key] = getmtrx.mtrx.get(key, 0) + val
     #BDMonhost, metricname, numvalue, collection_ts
     getmtrx.mtrx["totalCollectionTime"] = (etime - appstime).total_seconds()
     lgr.info('Total processing:- Begin time: %s; End time:%s; Total time:%s',
@@ -712,10 +2125,130 @@ def _process_metrics(lgr, applst):
     dbo.stmt = ('insert into t_bdmon_metrics '
                 '(bdmonhost, metricname, numvalue, collection_ts) '
                 'values(?, ?, ?, ?)')
-    dbo.execstmt()
-    dbo.commitclose()
+    #Spooled with the metrics if the database is unavailable
+    dbo.bufferstmt()
+    dbo.flush()
+    for key in dbo.stats:
+        dbo.stats[key] = 0
+
+def _process_metrics(lgr, applst, engine=''):
+    """Function to process BD metrics data"""
+    dbo = _getdbo(lgr)
+    dct = _load_mtrx(lgr, dbo, applst)
+    spool, replayer = _getspool(lgr, dbo)
+    writers = _getwriters(lgr, dbo, spool)
+    dims = _getdims(lgr)
+    deadband = _getdeadband(lgr, applst)
+    counters = _getcounters(lgr, dbo, applst)
+    lastvals = [lvals for lvals in (counters, deadband) if lvals is not None]
+    sessions = _getsessions(lgr, applst)
+    getmtrx = _getengine(lgr, dbo, dct, engine, sessions, writers, dims, deadband, counters)
+    _collect_apps(lgr, dbo, getmtrx, applst, writers, lastvals)
+    sessions.close()
+    if writers is not None:
+        writers.close()
+    if replayer is not None:
+        replayer.stop()
+    if dims is not None:
+        dims.close()
+    for lvals in lastvals:
+        lvals.close()
+    dbo.close()
+
+def _stopper(lgr):
+    """Function to get the stop event of the daemon, set by SIGTERM e.g. systemctl stop
+    The run in progress is completed, a second SIGTERM interrupts it as Ctrl-C does
+    Returns the event and the previous SIGTERM handler, None if not installed i.e. not the main thread"""
+    stop = threading.Event()
+    if threading.current_thread() is not threading.main_thread():
+        return stop, None
+    def _stop(signum, _):
+        """SIGTERM handler"""
+        if stop.is_set():
+            raise KeyboardInterrupt
+        lgr.warning('BDM-MN-05: Signal %s received, stopping once the current run is complete', signum)
+        stop.set()
+    return stop, signal.signal(signal.SIGTERM, _stop)
+
+def _schedule_metrics(lgr, applst, engine=''):
+    """Function to collect BD metrics data, each application at its own interval, until interrupted
+    or stopped by SIGTERM; the DB connections, HTTP sessions and metrics list are kept across the runs"""
+    sched = getscheduledetails(lgr)
+    intervals = OrderedDict((app, sched.get(app, sched["interval"])) for app in applst)
+    lgr.info('Collection intervals in seconds: %s', dict(intervals))
+    dbo = _getdbo(lgr)
+    dct = _load_mtrx(lgr, dbo, applst)
+    spool, replayer = _getspool(lgr, dbo)
+    writers = _getwriters(lgr, dbo, spool)
+    dims = _getdims(lgr)
+    deadband = _getdeadband(lgr, applst)
+    counters = _getcounters(lgr, dbo, applst)
+    lastvals = [lvals for lvals in (counters, deadband) if lvals is not None]
+    sessions = _getsessions(lgr, applst)
+    #Runs are kept on the schedule grid, a run taking longer than the interval skips the missed runs
+    nextrun = dict.fromkeys(applst, monotonic())
+    stop, sigterm = _stopper(lgr)
+    try:
+        while not stop.is_set():
+            now = monotonic()
+            due = [app for app in applst if nextrun[app] <= now]
+            if not due:
+                stop.wait(min(nextrun.values()) - now)
+                continue
+            getmtrx = _getengine(lgr, dbo, dct, engine, sessions, writers, dims, deadband, counters)
+            for app in due:
+                drift = now - nextrun[app]
+                missed = int(drift // intervals[app])
+                if missed:
+                    lgr.warning('%s: %s scheduled runs missed, the previous runs took too long', app, missed)
+                getmtrx.mtrx[app + "ScheduleDrift"] = drift
+                getmtrx.mtrx[app + "MissedRuns"] = missed
+                nextrun[app] += (missed + 1) * intervals[app]
+            try:
+                _collect_apps(lgr, dbo, getmtrx, due, writers, lastvals)
+            except BDMonException as err:
+                #The DB connection is renewed on the next run
+                lgr.error('BDM-DM-01: Unable to complete the scheduled run of: %s', due)
+                lgr.error(err)
+                dbo.close()
+                dbo = _getdbo(lgr)
+                dbo.spool = spool
+    finally:
+        if sigterm is not None:
+            signal.signal(signal.SIGTERM, sigterm)
+        sessions.close()
+        if writers is not None:
+            writers.close()
+        if replayer is not None:
+            replayer.stop()
+        if dims is not None:
+            dims.close()
+        for lvals in lastvals:
+            lvals.close()
+        dbo.close()
+
+def _getlgr_applst(applst='', logidentifier='', logmode=30):
+    """Function to get the logger and the list of applications, exits on an invalid list"""
+    if logmode not in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
+        logmode = 'INFO'
+    lgr = getlgr(logmode, str(logidentifier))  #In case numeric identifiers are specified
+    if not applst:
+        try:
+            applst = getbdapplst(lgr)
+        except BDMonException as err:
+            errmsg = 'BDM-MN-00: Unable to list of applications'
+            lgr.error(errmsg)
+            lgr.error(err)
+            sys.exit(1)
+    elif isinstance(applst, (list, tuple)):
+        lgr.info('Begin: App list: %s', applst)
+    else:
+        errmsg = 'BDM-MN-01: Application list expected. Received: %s type' %type(applst).__name__
+        lgr.error(errmsg)
+        sys.exit(1)
+    return (lgr, applst)
 
-def get_appmetrics(applst='', logidentifier='', logmode=30):
+def get_appmetrics(applst='', logidentifier='', logmode=30, engine=''):
     """ Get application metrics, parse and store in DB
     Parameters
     -----------
@@ -723,6 +2256,7 @@ def get_appmetrics(applst='', logidentifier='', logmode=30):
         List of applications to capture metrics (default: ALL applications defined in config file)
     logidentifier : Unique log file name during multi process launch (default: '')
     logmode : str: DEBUG, INFO, WARNING, ERROR, CRITICAL (default: INFO)
+    engine : str: sync, async (default: mode defined in config file, else sync)
 
     Raises
     -------
@@ -745,31 +2279,54 @@ def get_appmetrics(applst='', logidentifier='', logmode=30):
     To change the logfile name and loglevel to debug
         e.g. get_appmetrics('', 'hdfs', 'DEBUG')
         logfilename will be of the form <DEFAULTLOGFILE>_hdfs.log
+    To capture metrics with the asyncio collection engine
+        e.g. get_appmetrics(('hdfs',), '', 'INFO', 'async')
     """
 
-    if logmode not in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
-        logmode = 'INFO'
-    lgr = getlgr(logmode, str(logidentifier))  #In case numeric identifiers are specified
-    if not applst:
-        try:
-            applst = getbdapplst(lgr)
-        except BDMonException as err:
-            errmsg = 'BDM-MN-00: Unable to list of applications'
-            lgr.error(errmsg)
-            lgr.error(err)
-            sys.exit(1)
-    elif isinstance(applst, (list, tuple)):
-        lgr.info('Begin: App list: %s', applst)
-    else:
-        errmsg = 'BDM-MN-01: Application list expected. Received: %s type' %type(applst).__name__
+    lgr, applst = _getlgr_applst(applst, logidentifier, logmode)
+    try:
+        _process_metrics(lgr, applst, engine)
+    except BDMonException as err:
+        errmsg = 'BDM-MN-03: Unable to extract and process metrics data'
         lgr.error(errmsg)
+        lgr.error(err)
         sys.exit(1)
+    sys.exit(0)
+
+def run_appmetrics(applst='', logidentifier='', logmode=30, engine=''):
+    """ Run as a daemon, get application metrics, parse and store in DB, each application at the
+    interval defined in the [SCHEDULE] config section
+    Parameters
+    -----------
+    applst : tuple or list
+        List of applications to capture metrics (default: ALL applications defined in config file)
+    logidentifier : Unique log file name during multi process launch (default: '')
+    logmode : str: DEBUG, INFO, WARNING, ERROR, CRITICAL (default: INFO)
+    engine : str: sync, async (default: mode defined in config file, else sync)
+
+    Returns
+    -------
+    Exit code : integer
+        0: Interrupted e.g. Ctrl-C, or stopped by SIGTERM
+        1: Error when processing
 
+    Usage
+    -------
+    To capture metrics for all apps specified in config file, until interrupted
+        e.g. run_appmetrics()
+    To capture metrics for specific app(s) invoke
+        e.g. run_appmetrics(('hdfs', 'zookeeper'))
+    Changes to the metrics to collect (t_coll_metrics) require a restart
+    On SIGTERM e.g. systemctl stop, the run in progress is completed and the queued inserts are written
+    """
+    lgr, applst = _getlgr_applst(applst, logidentifier, logmode)
     try:
-        _process_metrics(lgr, applst)
+        _schedule_metrics(lgr, applst, engine)
     except BDMonException as err:
         errmsg = 'BDM-MN-03: Unable to extract and process metrics data'
         lgr.error(errmsg)
         lgr.error(err)
         sys.exit(1)
+    except KeyboardInterrupt:
+        lgr.warning('BDM-MN-04: Interrupted, stopping the metrics collection')
     sys.exit(0)
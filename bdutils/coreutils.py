@@ -9,6 +9,8 @@ Provides common utilities for all modules
 """
 import os
 import logging
+import threading
+from functools import lru_cache
 from logging.handlers import RotatingFileHandler
 import pwd
 import base64
@@ -22,16 +24,63 @@ from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
 
 __all__ = ['BDMonException', 'getlgr', 'getdbdetails', 'gethbasedetails', 'gethivedetails', 'getsecsettings',
-           'gethdfsdetails', 'getyarndetails', 'getzkdetails', 'getbdapplst', 'getsparkdetails']
+           'gethdfsdetails', 'getyarndetails', 'getzkdetails', 'getbdapplst', 'getsparkdetails',
+           'getenginedetails', 'getstoragedetails', 'getscheduledetails', 'getretentiondetails',
+           'getrollupdetails']
 
 _FLPATH = os.path.dirname(os.path.realpath(__file__))
 _CONFIGFL = _FLPATH + '/../config/bdmon.ini'
-_CFG = ConfigParser()
 
 class BDMonException(Exception):
     """ Exception class for the  monitoring tool """
 
 
+class _ConfigSnapshot():
+    """ Config file parsed once, and parsed again only when the file modification time changes
+    Values derived from the config are memoized until the file changes """
+    def __init__(self, cfgfl):
+        self._cfgfl = cfgfl
+        self._mtime = None
+        self._cfg = ConfigParser()
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def _snapshot(self):
+        """Function to get the parsed config, re-read if the file changed"""
+        try:
+            mtime = os.stat(self._cfgfl).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                cfg = ConfigParser()
+                cfg.read(self._cfgfl)
+                self._cfg = cfg
+                self._memo = {}
+                self._mtime = mtime
+            return self._cfg
+
+    def items(self, section):
+        """Function to get the (name, value) list of a section"""
+        return self._snapshot().items(section)
+
+    def get(self, section, option):
+        """Function to get an option value"""
+        return self._snapshot().get(section, option)
+
+    def getmemo(self, key):
+        """Function to get a memoized value, None if missing or the file changed"""
+        self._snapshot()
+        return self._memo.get(key)
+
+    def setmemo(self, key, value):
+        """Function to memoize a value derived from the config"""
+        with self._lock:
+            self._memo[key] = value
+
+_CFG = _ConfigSnapshot(_CONFIGFL)
+
+
 def getlgr(loglevel=logging.WARNING, logidentifier=''):
     """ Function provides a logger
     Parameters
@@ -51,7 +100,6 @@ def getlgr(loglevel=logging.WARNING, logidentifier=''):
     fappend = '_'.join((appname, os.uname()[1], logidentifier)).rstrip('_') + '.log'
     fmtstr = "%(levelname)1.1s %(asctime)s %(filename)s %(funcName)s %(lineno)d %(message)s"
     try:
-        _CFG.read(_CONFIGFL)
         logfname = _FLPATH + _CFG.get('LOGS', 'LOCATION') + fappend
     except (NameError, NoSectionError, NoOptionError):
         logfname = _FLPATH + '/../logs/' + fappend
@@ -65,27 +113,34 @@ def getlgr(loglevel=logging.WARNING, logidentifier=''):
         lgr.propagate = False
     return lgr
 
+@lru_cache(maxsize=1)
+def _getfernet():
+    """ Function provides the DB password cipher, the key derivation is done once per process"""
+    psswd = pwd.getpwuid(os.getuid())[0] + os.uname()[1] + os.uname()[4]
+    psswd = psswd.encode()
+    salt = ''.join(sorted(each for each in os.confstr_names if 'LDFLAG' in each))
+    salt = salt.encode()
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt,
+                     iterations=100000, backend=default_backend()
+                    )
+    key = base64.urlsafe_b64encode(kdf.derive(psswd))
+    return Fernet(key)
+
 def getdbdetails(lgr=''):
-    """ Function provides DB connection string"""
+    """ Function provides DB connection string, memoized until the config file changes"""
     if not lgr:
         lgr = getlgr()
+    dbdetails = _CFG.getmemo('ODBC')
+    if dbdetails is not None:
+        return dbdetails
     try:
-        _CFG.read(_CONFIGFL)
         dbdetail = ''
         rcnt = 3
         rsleep = 2
         dbtype = 'ODBC'
         for name, value in _CFG.items(dbtype):
             if name == 'pwd':
-                psswd = pwd.getpwuid(os.getuid())[0] + os.uname()[1] + os.uname()[4]
-                psswd = psswd.encode()
-                salt = ''.join(sorted(each for each in os.confstr_names if 'LDFLAG' in each))
-                salt = salt.encode()
-                kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt,
-                                 iterations=100000, backend=default_backend()
-                                )
-                key = base64.urlsafe_b64encode(kdf.derive(psswd))
-                frnt = Fernet(key)
+                frnt = _getfernet()
                 try:
                     value = frnt.decrypt(value.encode())
                 except InvalidToken:
@@ -105,16 +160,24 @@ def getdbdetails(lgr=''):
         raise BDMonException(err)
     else:
         lgr.debug('Returing DB details, Retry count:%s, Sleep time:%s', rcnt, rsleep)
+        _CFG.setmemo('ODBC', (dbdetail, rcnt, rsleep))
         return (dbdetail, rcnt, rsleep)
 
+def _cfgnum(lgr, sect, name, value, default, minval, conv=int):
+    """ Function to parse a numeric config option, an invalid value is logged and the default returned"""
+    try:
+        return max(conv(value), minval)
+    except ValueError:
+        lgr.warning('Invalid %s config %s = %s; assuming %s', sect, name, value, default)
+        return default
+
 def gethdfsdetails(lgr=''):
     """ Function provides HDFS jmx config"""
     if not lgr:
         lgr = getlgr()
     try:
-        _CFG.read(_CONFIGFL)
         hdfs = {'namenode':"localhost:50070", 'dnport': '50075', 'datanodes':'',
-                'proto':'http', 'uripath':'/jmx', 'kerberos':'y'}
+                'proto':'http', 'uripath':'/jmx', 'kerberos':'y', 'dnworkers':1}
         for name, value in _CFG.items('HDFS'):
             lgr.debug("HDFS Name:%s, Value:%s", name, value)
             if name == 'namenode':
@@ -129,6 +192,8 @@ def gethdfsdetails(lgr=''):
                 hdfs["uripath"] = value
             elif name == 'kerberos':
                 hdfs["kerberos"] = value
+            elif name == 'dnworkers':
+                hdfs["dnworkers"] = _cfgnum(lgr, 'HDFS', name, value, 1, 1)
     except (NameError, NoSectionError, NoOptionError) as err:
         lgr.warning('HDFS config missing; assuming standalone local hdfs')
         lgr.warning('HDFS config error: %s', err)
@@ -139,9 +204,8 @@ def gethbasedetails(lgr=''):
     if not lgr:
         lgr = getlgr()
     try:
-        _CFG.read(_CONFIGFL)
         hbase = {'hmaster':"localhost:16010", 'rsport': '16030', 'regionservers':'',
-                 'proto':'http', 'uripath':'/jmx', 'kerberos':'y'}
+                 'proto':'http', 'uripath':'/jmx', 'kerberos':'y', 'rsworkers':1}
         for name, value in _CFG.items('HBASE'):
             lgr.debug("HBase Name:%s, Value:%s", name, value)
             if name == 'hmaster':
@@ -156,6 +220,8 @@ def gethbasedetails(lgr=''):
                 hbase["uripath"] = value
             elif name == 'kerberos':
                 hbase["kerberos"] = value
+            elif name == 'rsworkers':
+                hbase["rsworkers"] = _cfgnum(lgr, 'HBASE', name, value, 1, 1)
     except (NameError, NoSectionError, NoOptionError) as err:
         lgr.warning('HBASE config missing; assuming standalone local hbase')
         lgr.warning('HBASE config error: %s', err)
@@ -166,7 +232,6 @@ def gethivedetails(lgr=''):
     if not lgr:
         lgr = getlgr()
     try:
-        _CFG.read(_CONFIGFL)
         hive = {'hs2':"localhost:10002", 'proto':'http', 'uripath':'/jmx', 'kerberos':'y'}
         for name, value in _CFG.items('HIVE'):
             lgr.debug("Hive Name:%s, Value:%s", name, value)
@@ -188,9 +253,8 @@ def getyarndetails(lgr=''):
     if not lgr:
         lgr = getlgr()
     try:
-        _CFG.read(_CONFIGFL)
         yarn = {'rm':"localhost:8088", 'nmport': '8042', 'nmnodes':'',
-                'proto':'http', 'uripath':'/jmx', 'kerberos':'y'}
+                'proto':'http', 'uripath':'/jmx', 'kerberos':'y', 'nmworkers':1}
         for name, value in _CFG.items('YARN'):
             lgr.debug("yarn Name:%s, Value:%s", name, value)
             if name == 'rm':
@@ -205,6 +269,8 @@ def getyarndetails(lgr=''):
                 yarn["nmport"] = value
             elif name == 'kerberos':
                 yarn["kerberos"] = value
+            elif name == 'nmworkers':
+                yarn["nmworkers"] = _cfgnum(lgr, 'YARN', name, value, 1, 1)
     except (NameError, NoSectionError, NoOptionError) as err:
         lgr.warning('YARN Server config missing; assuming standalone local yarn')
         lgr.warning('yarn config error: %s', err)
@@ -214,11 +280,15 @@ def getzkdetails(lgr=''):
     """ Function provides ZOOKEEPER quorum config"""
     if not lgr:
         lgr = getlgr()
+    zkq = {'quorum':"localhost:2181", 'cmd':'stat', 'aggclients':'n'}
     try:
-        _CFG.read(_CONFIGFL)
-        zkq = "localhost:2181"
-        for _, value in _CFG.items('ZOOKEEPER'):
-            zkq = value
+        for name, value in _CFG.items('ZOOKEEPER'):
+            if name == 'quorum':
+                zkq["quorum"] = value
+            elif name == 'cmd' and value == 'mntr':
+                zkq["cmd"] = value
+            elif name == 'aggclients' and value == 'y':
+                zkq["aggclients"] = value
     except (NameError, NoSectionError, NoOptionError) as err:
         lgr.warning('ZOOKEEPER Server config missing; assuming standalone local ZK')
         lgr.warning('ZK config error: %s', err)
@@ -229,9 +299,8 @@ def getsparkdetails(lgr=''):
     if not lgr:
         lgr = getlgr()
     try:
-        _CFG.read(_CONFIGFL)
         spk = {'histsrvr':"localhost:18080", 'proto':'http', 'uripath':'/api/v1',
-               'mtrxdate':'', 'kerberos':'y'}
+               'mtrxdate':'', 'kerberos':'y', 'appworkers':1, 'maxapps':0}
         for name, value in _CFG.items('SPARK'):
             if name == 'histsrvr':
                 spk["histsrvr"] = value
@@ -243,6 +312,10 @@ def getsparkdetails(lgr=''):
                 spk["mtrxdate"] = value
             elif name == 'kerberos':
                 spk["kerberos"] = value
+            elif name == 'appworkers':
+                spk["appworkers"] = _cfgnum(lgr, 'SPARK', name, value, 1, 1)
+            elif name == 'maxapps':
+                spk["maxapps"] = _cfgnum(lgr, 'SPARK', name, value, 0, 0)
     except (NameError, NoSectionError, NoOptionError) as err:
         lgr.warning('Spark Server config missing; assuming standalone local spark')
         lgr.warning('Spark config error: %s', err)
@@ -253,7 +326,6 @@ def getbdapplst(lgr=''):
     if not lgr:
         lgr = getlgr()
     try:
-        _CFG.read(_CONFIGFL)
         applst = ['hdfs']
         for _, value in _CFG.items('BDAPPS'):
             applst = value.replace(' ', '').lower().split(',')
@@ -266,7 +338,6 @@ def getsecsettings(lgr=''):
     if not lgr:
         lgr = getlgr()
     try:
-        _CFG.read(_CONFIGFL)
         sec = {'tlsverify':'y', 'kerberos':'n'}
         for name, value in _CFG.items('SECURITY'):
             if name == 'tlsverify' and value == 'n':
@@ -277,3 +348,165 @@ def getsecsettings(lgr=''):
         lgr.warning('Security Server config missing; assuming verify TLS certificate, no Kerberos')
         lgr.warning('Security config error: %s', err)
     return sec
+
+def _seconds(value):
+    """ Function to convert an interval e.g. 90, 90s, 5m, 1h to seconds"""
+    unit = {'s':1, 'm':60, 'h':3600}.get(value[-1:].lower())
+    if unit:
+        value = value[:-1]
+    return max(int(value) * (unit or 1), 1)
+
+def getenginedetails(lgr=''):
+    """ Function for collection engine config"""
+    if not lgr:
+        lgr = getlgr()
+    try:
+        eng = {'mode':'sync', 'inflight':32, 'poolhosts':2048, 'poolmaxsize':4, 'jmxqry':'y',
+               'jsonstream':'y', 'timeout':1.0, 'maxtimeout':5.0, 'backoff':30, 'maxbackoff':1800}
+        for name, value in _CFG.items('ENGINE'):
+            if name == 'mode' and value in ('sync', 'async'):
+                eng["mode"] = value
+            elif name == 'inflight':
+                eng["inflight"] = _cfgnum(lgr, 'ENGINE', name, value, 32, 1)
+            elif name == 'poolhosts':
+                eng["poolhosts"] = _cfgnum(lgr, 'ENGINE', name, value, 2048, 1)
+            elif name == 'poolmaxsize':
+                eng["poolmaxsize"] = _cfgnum(lgr, 'ENGINE', name, value, 4, 1)
+            elif name == 'jmxqry' and value == 'n':
+                eng["jmxqry"] = value
+            elif name == 'jsonstream' and value == 'n':
+                eng["jsonstream"] = value
+            elif name == 'timeout':
+                eng["timeout"] = _cfgnum(lgr, 'ENGINE', name, value, 1.0, 0.1, float)
+            elif name == 'maxtimeout':
+                eng["maxtimeout"] = _cfgnum(lgr, 'ENGINE', name, value, 5.0, 0.1, float)
+            elif name == 'backoff':
+                eng["backoff"] = _cfgnum(lgr, 'ENGINE', name, value, 30, 1, _seconds)
+            elif name == 'maxbackoff':
+                eng["maxbackoff"] = _cfgnum(lgr, 'ENGINE', name, value, 1800, 1, _seconds)
+    except (NameError, NoSectionError, NoOptionError) as err:
+        lgr.info('Engine config missing; assuming sync engine')
+        lgr.info('Engine config error: %s', err)
+    return eng
+
+def getstoragedetails(lgr=''):
+    """ Function for metrics storage config"""
+    if not lgr:
+        lgr = getlgr()
+    try:
+        strg = {'batchrows':5000, 'batchbytes':4194304, 'writers':0, 'queuesize':64,
+                'bulkload':'auto', 'sqlitewal':'y', 'sqlitecache':65536, 'sqlitebusy':30.0,
+                'layout':'wide', 'deadband':'n', 'deadbandtol':0.0, 'heartbeat':10, 'counterrates':'both',
+                'lastvaluesdir':'', 'spool':'n', 'spooldir':'', 'spoolretry':60, 'spoolwait':30.0,
+                'spoolmaxmb':1024}
+        for name, value in _CFG.items('STORAGE'):
+            if name == 'batchrows':
+                strg["batchrows"] = _cfgnum(lgr, 'STORAGE', name, value, 5000, 1)
+            elif name == 'batchbytes':
+                strg["batchbytes"] = _cfgnum(lgr, 'STORAGE', name, value, 4194304, 1)
+            elif name == 'writers':
+                strg["writers"] = _cfgnum(lgr, 'STORAGE', name, value, 0, 0)
+            elif name == 'queuesize':
+                strg["queuesize"] = _cfgnum(lgr, 'STORAGE', name, value, 64, 1)
+            elif name == 'bulkload' and value in ('auto', 'values', 'executemany'):
+                strg["bulkload"] = value
+            elif name == 'sqlitewal':
+                strg["sqlitewal"] = value
+            elif name == 'sqlitecache':
+                strg["sqlitecache"] = _cfgnum(lgr, 'STORAGE', name, value, 65536, 0)
+            elif name == 'sqlitebusy':
+                strg["sqlitebusy"] = _cfgnum(lgr, 'STORAGE', name, value, 30.0, 0.0, float)
+            elif name == 'layout' and value in ('wide', 'normalized', 'snapshot'):
+                strg["layout"] = value
+            elif name == 'deadband':
+                strg["deadband"] = value
+            elif name == 'deadbandtol':
+                strg["deadbandtol"] = _cfgnum(lgr, 'STORAGE', name, value, 0.0, 0.0, float)
+            elif name == 'heartbeat':
+                strg["heartbeat"] = _cfgnum(lgr, 'STORAGE', name, value, 10, 1)
+            elif name == 'counterrates' and value in ('both', 'rate'):
+                strg["counterrates"] = value
+            elif name == 'lastvaluesdir':
+                strg["lastvaluesdir"] = value
+            elif name == 'spool':
+                strg["spool"] = value
+            elif name == 'spooldir':
+                strg["spooldir"] = value
+            elif name == 'spoolretry':
+                strg["spoolretry"] = _cfgnum(lgr, 'STORAGE', name, value, 60, 1, _seconds)
+            elif name == 'spoolwait':
+                strg["spoolwait"] = _cfgnum(lgr, 'STORAGE', name, value, 30.0, 0.0, float)
+            elif name == 'spoolmaxmb':
+                strg["spoolmaxmb"] = _cfgnum(lgr, 'STORAGE', name, value, 1024, 1)
+    except (NameError, NoSectionError, NoOptionError) as err:
+        lgr.info('Storage config missing; assuming default batch sizes')
+        lgr.info('Storage config error: %s', err)
+    if not strg["lastvaluesdir"]:
+        #The last values are kept with the log files
+        try:
+            strg["lastvaluesdir"] = _FLPATH + _CFG.get('LOGS', 'LOCATION')
+        except (NameError, NoSectionError, NoOptionError):
+            strg["lastvaluesdir"] = _FLPATH + '/../logs/'
+    if not strg["spooldir"]:
+        strg["spooldir"] = os.path.join(strg["lastvaluesdir"], 'spool')
+    return strg
+
+def getretentiondetails(lgr=''):
+    """ Function for metrics retention and partitions config, days kept of each table"""
+    if not lgr:
+        lgr = getlgr()
+    rtn = {'default':0, 'period':'day', 'ahead':3, 'sqliteparts':'n', 'tables':{}}
+    try:
+        items = _CFG.items('RETENTION')
+        for name, value in items:
+            if name == 'default':
+                rtn["default"] = _cfgnum(lgr, 'RETENTION', name, value, 0, 0)
+            elif name == 'period' and value in ('day', 'month'):
+                rtn["period"] = value
+            elif name == 'ahead':
+                rtn["ahead"] = _cfgnum(lgr, 'RETENTION', name, value, 3, 1)
+            elif name == 'sqliteparts':
+                rtn["sqliteparts"] = value
+        #An invalid table retention is the default retention
+        for name, value in items:
+            if name.startswith('t_'):
+                rtn["tables"][name] = _cfgnum(lgr, 'RETENTION', name, value, rtn["default"], 0)
+    except (NameError, NoSectionError, NoOptionError) as err:
+        lgr.info('Retention config missing; assuming metrics are kept forever')
+        lgr.info('Retention config error: %s', err)
+    return rtn
+
+def getrollupdetails(lgr=''):
+    """ Function for metrics rollup config, the tables aggregated and the lag of the last bucket"""
+    if not lgr:
+        lgr = getlgr()
+    rlp = {'lag':120, 'tables':[]}
+    try:
+        for name, value in _CFG.items('ROLLUP'):
+            if name == 'lag':
+                rlp["lag"] = _cfgnum(lgr, 'ROLLUP', name, value, 120, 1, _seconds)
+            elif name == 'tables':
+                rlp["tables"] = [tbl for tbl in value.replace(' ', '').split(',') if tbl]
+    except (NameError, NoSectionError, NoOptionError) as err:
+        lgr.info('Rollup config missing; assuming all the tables with a lag of %ss', rlp["lag"])
+        lgr.info('Rollup config error: %s', err)
+    return rlp
+
+def getscheduledetails(lgr=''):
+    """ Function for daemon mode config, collection interval in seconds of each app"""
+    if not lgr:
+        lgr = getlgr()
+    sched = {'interval':60}
+    try:
+        items = _CFG.items('SCHEDULE')
+        for name, value in items:
+            if name == 'interval':
+                sched["interval"] = _cfgnum(lgr, 'SCHEDULE', name, value, 60, 1, _seconds)
+        #An invalid app interval is the interval of the other apps
+        for name, value in items:
+            if name != 'interval':
+                sched[name] = _cfgnum(lgr, 'SCHEDULE', name, value, sched["interval"], 1, _seconds)
+    except (NameError, NoSectionError, NoOptionError) as err:
+        lgr.info('Schedule config missing; assuming %ss interval for the other apps', sched["interval"])
+        lgr.info('Schedule config error: %s', err)
+    return sched
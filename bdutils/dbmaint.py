@@ -0,0 +1,378 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" dbmaint module
+Metrics retention: creates the upcoming partitions of the partitioned metrics tables,
+drops the expired ones and deletes the expired rows of the tables not partitioned
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+from bdutils.coreutils import BDMonException, getlgr, getretentiondetails, getstoragedetails
+from bdutils.dbops import DbOps
+
+__all__ = ['maintain_db']
+
+#Metrics tables with a collection_ts, the first ones are stored differently per storage layout
+_LAYOUTTBLS = ('t_node_metrics', 't_hdfs_nn_metrics', 't_hdfs_dn_metrics', 't_yarn_rm_metrics',
+               't_yarn_nm_metrics', 't_hmaster_metrics', 't_hbase_rs_metrics', 't_hive_metrics')
+_METRICTBLS = ('t_hbase_tbl_metrics', 't_zk_conn_metrics', 't_zk_metrics', 't_bdmon_metrics')
+_LAYOUTSFX = {'wide':'', 'normalized':'_norm', 'snapshot':'_snap'}
+#Rows deleted per transaction, for the tables not partitioned
+_PURGEROWS = 10000
+
+
+def _period_start(tstamp, period):
+    """Function to get the start of the period, day or month, of a timestamp"""
+    if period == 'month':
+        return datetime(tstamp.year, tstamp.month, 1)
+    return datetime(tstamp.year, tstamp.month, tstamp.day)
+
+def _period_end(start, period):
+    """Function to get the start of the next period"""
+    if period == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+def _period_name(start, period):
+    """Function to get the partition name suffix of a period e.g. p20190116, p201901"""
+    return start.strftime('p%Y%m' if period == 'month' else 'p%Y%m%d')
+
+def _period_parse(name, period):
+    """Function to get the start of a period from a partition name suffix, None if not a period name"""
+    try:
+        return datetime.strptime(name, 'p%Y%m' if period == 'month' else 'p%Y%m%d')
+    except ValueError:
+        return None
+
+
+class _DbMaint():
+    """ Retention of the metrics tables not partitioned, expired rows are deleted in chunks
+    The subclasses list the partitions of each database and set its partition statements """
+    _purgestmt = 'delete from %(tbl)s where collection_ts < ?'
+    #Statements creating and dropping the partition of a period: tbl, name, start and end
+    _createstmt = ''
+    _dropstmt = ''
+    #Partition of the rows outside the periods, purged once the expired partitions are dropped
+    _default = ''
+
+    def __init__(self, lgr, dbo, rtn):
+        self._lgr = lgr
+        self._dbo = dbo
+        self._period = rtn["period"]
+        self._ahead = rtn["ahead"]
+        self.mtrx = {'error':0, 'warning':0, 'partitionsCreated':0, 'partitionsDropped':0, 'rowsPurged':0}
+
+    def _query(self, stmt, values=''):
+        """Function to run a query, returns all the rows"""
+        self._dbo.stmt = stmt
+        self._dbo.values = values
+        self._dbo.execstmt()
+        return self._dbo.crsr.fetchall()
+
+    def _ddl(self, stmt):
+        """Function to run and commit a statement"""
+        self._dbo.stmt = stmt
+        self._dbo.values = ''
+        self._dbo.execstmt()
+        self._dbo.commit()
+
+    def _starts(self, names, prefix=''):
+        """Function to get the period starts of the partition names, others e.g. the default are ignored"""
+        starts = [_period_parse(name[len(prefix):], self._period) for name in names]
+        return [start for start in starts if start is not None]
+
+    def partitions(self, tbl):
+        """Function to list the start of the period partitions, None if the table is not partitioned"""
+        return None
+
+    def create(self, tbl, start, end):
+        """Function to create the partition of a period"""
+        self._ddl(self._createstmt % {'tbl':tbl, 'name':_period_name(start, self._period),
+                                      'start':start, 'end':end})
+
+    def expire(self, tbl, starts, cutoff):
+        """Function to drop the partitions ending before the cutoff, returns the number dropped"""
+        dropped = 0
+        for start in starts:
+            if _period_end(start, self._period) <= cutoff:
+                name = _period_name(start, self._period)
+                self._lgr.info('Drop partition %s of %s', name, tbl)
+                self._ddl(self._dropstmt % {'tbl':tbl, 'name':name})
+                dropped += 1
+        self.mtrx['partitionsDropped'] += dropped
+        if self._default:
+            self.purge(self._default % {'tbl':tbl}, cutoff)
+        return dropped
+
+    def purge(self, tbl, cutoff):
+        """Function to delete the rows collected before the cutoff, a transaction per chunk"""
+        while True:
+            self._dbo.stmt = self._purgestmt % {'tbl':tbl}
+            self._dbo.values = (cutoff,)
+            self._dbo.execstmt()
+            rows = self._dbo.crsr.rowcount
+            self._dbo.commit()
+            if rows > 0:
+                self.mtrx['rowsPurged'] += rows
+            if rows < _PURGEROWS:
+                break
+
+    def maintain(self, tbl, days):
+        """Function to apply the retention of a table"""
+        now = datetime.now()
+        cutoff = now - timedelta(days=days) if days else None
+        starts = self.partitions(tbl)
+        if starts is None:
+            if cutoff is not None:
+                self._lgr.info('Delete %s rows collected before %s', tbl, cutoff)
+                self.purge(tbl, cutoff)
+            return
+        start = _period_start(now, self._period)
+        for _ in range(self._ahead + 1):
+            end = _period_end(start, self._period)
+            if start not in starts:
+                self._lgr.info('Create partition %s_%s', tbl, _period_name(start, self._period))
+                try:
+                    self.create(tbl, start, end)
+                except BDMonException as err:
+                    #e.g. rows of the period were already written to the default partition
+                    self._dbo.rollback()
+                    self._lgr.warning('Unable to create partition %s_%s: %s', tbl,
+                                      _period_name(start, self._period), err)
+                    self.mtrx['warning'] += 1
+                else:
+                    starts.append(start)
+                    self.mtrx['partitionsCreated'] += 1
+            start = end
+        if cutoff is not None:
+            self.expire(tbl, sorted(starts), cutoff)
+
+
+class _PgMaint(_DbMaint):
+    """ PostgreSQL declarative partitioning, a table per period and the <table>_pdefault partition """
+    _purgestmt = ('delete from %%(tbl)s where ctid in '
+                  '(select ctid from %%(tbl)s where collection_ts < ? limit %d)' % _PURGEROWS)
+    _createstmt = ("create table %(tbl)s_%(name)s partition of %(tbl)s "
+                   "for values from ('%(start)s') to ('%(end)s')")
+    _dropstmt = 'drop table %(tbl)s_%(name)s'
+    _default = '%(tbl)s_pdefault'
+
+    def partitions(self, tbl):
+        rows = self._query('select relkind from pg_class where relname = ?', (tbl,))
+        if not rows or rows[0][0] != 'p':
+            return None
+        rows = self._query('select c.relname from pg_inherits i join pg_class c on c.oid = i.inhrelid '
+                           'join pg_class p on p.oid = i.inhparent where p.relname = ?', (tbl,))
+        return self._starts([row[0] for row in rows], tbl + '_')
+
+
+class _MyMaint(_DbMaint):
+    """ MySQL range partitioning, the pmax partition holds the rows after the last period """
+    _purgestmt = 'delete from %%(tbl)s where collection_ts < ? limit %d' % _PURGEROWS
+    _createstmt = ("alter table %(tbl)s reorganize partition pmax into (partition %(name)s "
+                   "values less than ('%(end)s'), partition pmax values less than (MAXVALUE))")
+    #The first partition holds all the rows before its period end
+    _dropstmt = 'alter table %(tbl)s drop partition %(name)s'
+
+    def partitions(self, tbl):
+        rows = self._query('select partition_name from information_schema.partitions '
+                           'where table_schema = database() and table_name = ? '
+                           'and partition_name is not null', (tbl,))
+        if not rows:
+            return None
+        return self._starts([row[0] for row in rows])
+
+
+class _MsMaint(_DbMaint):
+    """ SQL Server partition function pf_<table> and scheme ps_<table>, a RANGE RIGHT boundary per period """
+    _purgestmt = 'delete top (%d) from %%(tbl)s where collection_ts < ?' % _PURGEROWS
+
+    def partitions(self, tbl):
+        if not self._query('select function_id from sys.partition_functions where name = ?', ('pf_' + tbl,)):
+            return None
+        #A period partition starts at a boundary and ends at the next one
+        return self._boundaries(tbl)[:-1]
+
+    def _boundaries(self, tbl):
+        """Function to list the boundaries of the partition function"""
+        return [row[0] for row in
+                self._query('select cast(prv.value as datetime) from sys.partition_functions pf '
+                            'join sys.partition_range_values prv on prv.function_id = pf.function_id '
+                            'where pf.name = ? order by prv.boundary_id', ('pf_' + tbl,))]
+
+    def create(self, tbl, start, end):
+        bounds = self._boundaries(tbl)
+        for bound in (start, end):
+            if bound not in bounds:
+                self._ddl('alter partition scheme ps_%s next used [PRIMARY]' % tbl)
+                self._ddl("alter partition function pf_%s() split range ('%s')"
+                          % (tbl, bound.strftime('%Y-%m-%d')))
+
+    def expire(self, tbl, starts, cutoff):
+        #The rows before the first boundary are in partition 1, truncated then merged with the next one
+        dropped = 0
+        for bound in self._boundaries(tbl):
+            if bound > cutoff:
+                break
+            self._lgr.info('Drop partition of %s before %s', tbl, bound)
+            self._ddl('truncate table %s with (partitions (1))' % tbl)
+            self._ddl("alter partition function pf_%s() merge range ('%s')"
+                      % (tbl, bound.strftime('%Y-%m-%d')))
+            dropped += 1
+        self.mtrx['partitionsDropped'] += dropped
+        return dropped
+
+
+class _LiteMaint(_DbMaint):
+    """ SQLite table per period; <table> is a view over the period tables and <table>_pdefault,
+    inserts are routed to the period tables by INSTEAD OF triggers """
+    _purgestmt = ('delete from %%(tbl)s where rowid in '
+                  '(select rowid from %%(tbl)s where collection_ts < ? limit %d)' % _PURGEROWS)
+    _createstmt = 'create table %(tbl)s_%(name)s as select * from %(tbl)s_pdefault where 0'
+    _dropstmt = 'drop table %(tbl)s_%(name)s'
+    _default = '%(tbl)s_pdefault'
+
+    def __init__(self, lgr, dbo, rtn):
+        super().__init__(lgr, dbo, rtn)
+        self._parts = rtn["sqliteparts"] == 'y'
+
+    def _tables(self, tbl):
+        """Function to list the period table names of a table"""
+        rows = self._query("select name from sqlite_master where type = 'table' and name like ? escape '!'",
+                           (tbl + '!_p%',))
+        return [row[0] for row in rows if _period_parse(row[0][len(tbl) + 1:], self._period)]
+
+    def partitions(self, tbl):
+        if not self._parts:
+            return None
+        if self._query("select name from sqlite_master where type = 'table' and name = ?", (tbl,)):
+            #First run, the table becomes the default partition
+            self._lgr.info('Convert %s to a table per period', tbl)
+            self._ddl('alter table %s rename to %s_pdefault' % (tbl, tbl))
+            self._view(tbl)
+        return self._starts(self._tables(tbl), tbl + '_')
+
+    def _view(self, tbl):
+        """Function to recreate the view of the period tables and the insert triggers"""
+        cols = [row[1] for row in self._query('pragma table_info(%s_pdefault)' % tbl)]
+        names = sorted(self._tables(tbl))
+        self._dbo.stmt = 'drop view if exists %s' % tbl
+        self._dbo.values = ''
+        self._dbo.execstmt()
+        self._dbo.stmt = ('create view %s as ' % tbl +
+                          ' union all '.join('select * from %s' % name for name in [tbl + '_pdefault'] + names))
+        self._dbo.execstmt()
+        ins = '(%s) values(%s)' % (', '.join(cols), ', '.join('new.' + col for col in cols))
+        bounds = []
+        for name in names:
+            start = _period_parse(name[len(tbl) + 1:], self._period)
+            cond = "new.collection_ts >= '%s' and new.collection_ts < '%s'" % (
+                start, _period_end(start, self._period))
+            bounds.append(cond)
+            self._dbo.stmt = ('create trigger %s_ins instead of insert on %s when %s begin '
+                              'insert into %s %s; end' % (name, tbl, cond, name, ins))
+            self._dbo.execstmt()
+        cond = 'not (%s)' % ' or '.join(bounds) if bounds else '1'
+        self._dbo.stmt = ('create trigger %s_pdefault_ins instead of insert on %s when %s begin '
+                          'insert into %s_pdefault %s; end' % (tbl, tbl, cond, tbl, ins))
+        self._dbo.execstmt()
+        self._dbo.commit()
+
+    def create(self, tbl, start, end):
+        super().create(tbl, start, end)
+        name = '%s_%s' % (tbl, _period_name(start, self._period))
+        self._ddl('create index ind_%s_ts on %s(collection_ts)' % (name, name))
+        self._view(tbl)
+
+    def expire(self, tbl, starts, cutoff):
+        dropped = super().expire(tbl, starts, cutoff)
+        if dropped:
+            self._view(tbl)
+        return dropped
+
+
+def _getmaint(lgr, dbo, rtn):
+    """Function to get the maintenance of the database type"""
+    dbtype = dbo.dbtype.lower()
+    if 'postgresql' in dbtype:
+        return _PgMaint(lgr, dbo, rtn)
+    if 'mysql' in dbtype:
+        return _MyMaint(lgr, dbo, rtn)
+    if 'sql server' in dbtype:
+        return _MsMaint(lgr, dbo, rtn)
+    if dbtype == '{sqlite}':
+        return _LiteMaint(lgr, dbo, rtn)
+    return _DbMaint(lgr, dbo, rtn)
+
+def _maintain(lgr, tables=None):
+    """Function to apply the retention of the metrics tables"""
+    rtn = getretentiondetails(lgr)
+    sfx = _LAYOUTSFX[getstoragedetails(lgr)["layout"]]
+    days = dict.fromkeys([tbl + sfx for tbl in _LAYOUTTBLS] + list(_METRICTBLS), rtn["default"])
+    days.update(rtn["tables"])
+    if tables:
+        days = {tbl: days.get(tbl, rtn["default"]) for tbl in tables}
+    stime = datetime.now()
+    dbo = DbOps(lgr)
+    try:
+        maint = _getmaint(lgr, dbo, rtn)
+        for tbl, tdays in days.items():
+            try:
+                maint.maintain(tbl, tdays)
+            except BDMonException as err:
+                lgr.error('BDM-MT-01: Unable to apply the retention of table: %s', tbl)
+                lgr.error(err)
+                dbo.rollback()
+                maint.mtrx['error'] += 1
+        etime = datetime.now()
+        maint.mtrx['maintenanceTime'] = (etime - stime).total_seconds()
+        lgr.info('Retention applied:%s', maint.mtrx)
+        #BDMonhost, metricname, numvalue, collection_ts
+        dbo.values = [(os.uname()[1], key, val, etime) for key, val in maint.mtrx.items()]
+        dbo.stmt = ('insert into t_bdmon_metrics '
+                    '(bdmonhost, metricname, numvalue, collection_ts) '
+                    'values(?, ?, ?, ?)')
+        dbo.execstmt()
+        dbo.commit()
+    finally:
+        dbo.close()
+    return maint.mtrx['error']
+
+def maintain_db(tables=None, logidentifier='', logmode=30):
+    """ Apply the metrics retention of [RETENTION] config section
+    Parameters
+    -----------
+    tables : tuple or list
+        List of tables (default: all metrics tables)
+    logidentifier : Unique log file name (default: '')
+    logmode : Log level(default: 30) i.e. WARNING
+        Valid values: DEBUG, INFO, WARNING, ERROR, CRITICAL
+
+    Returns
+    -------
+    Exit code : integer
+        0: Retention applied to all the tables
+        1: Error when processing
+
+    Usage
+    -------
+    To create the upcoming partitions and drop the expired ones e.g. from a daily cron job
+        e.g. maintain_db()
+    To apply the retention of specific tables
+        e.g. maintain_db(('t_zk_conn_metrics',))
+    """
+    if logmode not in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
+        logmode = 'INFO'
+    lgr = getlgr(logmode, str(logidentifier))
+    try:
+        errors = _maintain(lgr, tables)
+    except BDMonException as err:
+        lgr.error('BDM-MT-00: Unable to apply the metrics retention')
+        lgr.error(err)
+        sys.exit(1)
+    sys.exit(1 if errors else 0)
@@ -7,14 +7,110 @@
 """ dbops module
 Supports db operations on postgres/mysql/ms sql server database
 """
-from time import sleep
+import sys
+from array import array
+from time import sleep, monotonic
+from itertools import chain
 import sqlite3
 
 import pyodbc
 
-from bdutils.coreutils import BDMonException, getdbdetails
+from bdutils.coreutils import BDMonException, getdbdetails, getstoragedetails
 
-__all__ = ['DbOps']
+__all__ = ['DbOps', 'RowBatch', 'isdbdown']
+
+#Multi-row VALUES inserts are split to stay below the drivers bind parameter limits
+#SQL Server: 1000 rows and 2100 parameters, SQLite: 999 parameters before 3.32
+_VALUESROWS = 1000
+_VALUESPARAMS = 30000
+_DBVALUESPARAMS = {'sql server': 2099,
+                   'sqlite': 999 if sqlite3.sqlite_version_info < (3, 32, 0) else 32766}
+
+#Errors of a multi-row insert too large for the database or driver, other errors are data errors
+#e.g. too many SQL variables/parameters/placeholders, maximum allowed number of 1000 row values
+_TOOLARGE = ('too many', 'maximum allowed', 'maximum of', 'max_allowed_packet', 'too big',
+             'parameter markers', 'stack depth')
+#Databases aborting the transaction on a failed statement, multi-row inserts are run in a savepoint
+_SAVEPOINTDBS = ('postgresql',)
+
+#SQLite errors of a database file busy or not reachable, other errors are query errors
+_SQLITEDOWN = ('locked', 'busy', 'unable to open', 'disk i/o')
+
+def isdbdown(err):
+    """Function to tell the errors of a database unavailable e.g. connection lost, from the query errors
+    err: the BDMonException of execstmt/commit or the driver error"""
+    if isinstance(err, BDMonException) and err.args:
+        err = err.args[0]
+    if isinstance(err, (pyodbc.OperationalError, pyodbc.InterfaceError)):
+        return True
+    if isinstance(err, pyodbc.Error):
+        #SQLSTATE 08xxx: connection exception, HYTxx: timeout
+        return bool(err.args) and str(err.args[0]).startswith(('08', 'HYT'))
+    if isinstance(err, sqlite3.OperationalError):
+        return any(msg in str(err).lower() for msg in _SQLITEDOWN)
+    return False
+
+def _toolarge(err):
+    """Function to tell the errors of a statement too large e.g. bind parameter limit, from the data errors"""
+    return any(msg in str(err).lower() for msg in _TOOLARGE)
+
+def _rowsize(row):
+    """Approximate size in bytes of an insert row, numbers and timestamps count as 8 bytes"""
+    return sum(len(val) if isinstance(val, str) else 8 for val in row)
+
+def _flat(columns):
+    """Function to get the parameters of equal length columns, row after row"""
+    width = len(columns)
+    params = [None] * (width * len(columns[0]))
+    for pos, col in enumerate(columns):
+        params[pos::width] = col
+    return params
+
+
+class RowBatch():
+    """ Columnar insert rows of a statement e.g. the metrics of a bean, in the statement parameters order:
+    the values shared by all the rows (host, modelerType...), the string columns of interned values,
+    the numeric values in an array('d') and the timestamp shared by all the rows
+    Iterating a batch yields the row tuples, for the drivers and the processing working on rows """
+    __slots__ = ('shared', 'strs', 'nums', 'tstamp')
+
+    def __init__(self, shared, tstamp, nstrs=1):
+        self.shared = tuple(shared)
+        self.tstamp = tstamp
+        self.strs = tuple([] for _ in range(nstrs))
+        self.nums = array('d')
+
+    def add(self, *vals):
+        """Function to add a row, the string columns values then the numeric value"""
+        for col, val in zip(self.strs, vals):
+            col.append(sys.intern(val))
+        self.nums.append(vals[-1])
+
+    def append(self, row):
+        """Function to add a row tuple, its shared values and timestamp are those of the batch"""
+        self.add(*row[len(self.shared):-1])
+
+    def empty(self):
+        """Function to get a batch without rows, with the same shared values and timestamp"""
+        return RowBatch(self.shared, self.tstamp, len(self.strs))
+
+    def __len__(self):
+        return len(self.nums)
+
+    def __iter__(self):
+        for vals in zip(*self.strs, self.nums):
+            yield self.shared + vals + (self.tstamp,)
+
+    def columns(self):
+        """Function to get the columns, the shared values repeated"""
+        nrows = len(self.nums)
+        return ([[val] * nrows for val in self.shared] + list(self.strs) + [self.nums] +
+                [[self.tstamp] * nrows])
+
+    def nbytes(self):
+        """Approximate size in bytes of the rows, as _rowsize"""
+        return (len(self.nums) * (_rowsize(self.shared) + 16) +
+                sum(len(val) for col in self.strs for val in col))
 
 
 class DbOps():
@@ -23,10 +119,24 @@ class DbOps():
         self._lgr = logger
         self.stmt = ''
         self.values = ''
+        #A connection string given is tried once
+        rcnt, stime = 1, 0
         if not dbdetail:
             dbdetail, rcnt, stime = getdbdetails(self._lgr)
-        errmsg = ''
+        #Insert rows buffered per statement until a batch threshold is reached
+        strg = getstoragedetails(self._lgr)
+        self._batchrows = strg["batchrows"]
+        self._batchbytes = strg["batchbytes"]
+        self._buf = {}
+        self._bufrows = 0
+        self._bufbytes = 0
+        self.stats = {'dbFlushes':0, 'dbRowsWritten':0}
+        self._bulkload = strg["bulkload"]
+        self._valuestmts = {}
+        #Statements whose multi-row inserts failed, inserted with executemany
+        self._valuesfail = set()
 
+        dbsrvr = dbport = ''
         for each in dbdetail.split(';'):
             if each.startswith('server'):
                 dbsrvr = each.split('=')[1]
@@ -34,10 +144,32 @@ class DbOps():
                 dbport = each.split('=')[1]
             elif each.startswith('driver'):
                 dbtype = each.split('=')[1]
+        self.dbtype = dbtype
+        self._valuesparams = min([_VALUESPARAMS] + [cnt for name, cnt in _DBVALUESPARAMS.items()
+                                                     if name in dbtype.lower()])
+        self._savepoint = any(name in dbtype.lower() for name in _SAVEPOINTDBS)
+        self._dbsrvr = dbsrvr
+        self._dbport = dbport
+        self._dbdetail = dbdetail
+        self._strg = strg
+        #Inserts are spooled to the DbSpool, if any, while the database is unavailable
+        self.spool = None
+        self._downsince = None
+        self._connect(rcnt, stime)
+
+    def _connect(self, rcnt, stime):
+        """ Connect to the database, rcnt attempts"""
+        dbdetail, dbtype, strg = self._dbdetail, self.dbtype, self._strg
+        dbsrvr, dbport = self._dbsrvr, self._dbport
+        errmsg = ''
         for rtry in range(rcnt):
             try:
                 if dbtype.lower() == '{sqlite}':
-                    self._dbcn = sqlite3.connect(dbsrvr)
+                    #The connection may be handed over to a writer thread
+                    #Wait for the write lock of the other collector processes, e.g. cron jobs
+                    self._dbcn = sqlite3.connect(dbsrvr, timeout=strg["sqlitebusy"],
+                                                 check_same_thread=False)
+                    self._sqlitetune(strg)
                 else:
                     self._dbcn = pyodbc.connect(dbdetail)
             except (pyodbc.OperationalError, pyodbc.Error) as err:
@@ -64,17 +196,39 @@ class DbOps():
                 elif "PostgreSQL" in dbtype:
                     self._dbcn.setdecoding(pyodbc.SQL_WCHAR, encoding='utf-8')
                     self._dbcn.setencoding(encoding='utf-8')
+                if self._bulkload == 'auto':
+                    #executemany is a round-trip per row on psqlODBC and MySQL ODBC
+                    if "PostgreSQL" in dbtype or "MySQL" in dbtype:
+                        self._bulkload = 'values'
+                    else:
+                        self._bulkload = 'executemany'
+                self._lgr.debug("Bulk load mode:%s", self._bulkload)
                 break
         if errmsg:
             raise BDMonException(errmsg)
 
+    def _sqlitetune(self, strg):
+        """ Set the SQLite pragmas for high insert rates, journal_mode is persisted in the DB file"""
+        if strg["sqlitewal"] == 'y':
+            mode = self._dbcn.execute('pragma journal_mode=wal').fetchone()[0]
+            if mode.lower() != 'wal':
+                self._lgr.warning('SQLite WAL journal not available, journal mode:%s', mode)
+            #Commits are synced at the checkpoints, a power loss may lose the last commits only
+            self._dbcn.execute('pragma synchronous=normal')
+        if strg["sqlitecache"]:
+            self._dbcn.execute('pragma cache_size=-%d' % strg["sqlitecache"])
+
     def execstmt(self):
         """ Execute the DB statements; cursor object can be iterated for the resultset"""
         try:
             self._lgr.debug("DB stmt: %s", self.stmt)
             self._lgr.debug("values: %s", self.values)
             if self.stmt.split()[0].lower() == 'insert':
-                if self.values:
+                if isinstance(self.values, RowBatch):
+                    self._inscolumns(self.stmt, self.values.columns())
+                elif self.values and self._bulkload == 'values':
+                    self._insvalues(self.stmt, list(chain.from_iterable(self.values)), len(self.values[0]))
+                elif self.values:
                     self.crsr.executemany(self.stmt, self.values)
                 else:
                     self.crsr.executemany(self.stmt)
@@ -84,11 +238,163 @@ class DbOps():
                 else:
                     self.crsr.execute(self.stmt)
         except (pyodbc.Error, sqlite3.Error) as err:
-            errmsg = 'BDM-DB-05: Unable to execute query.'
-            self._lgr.error(errmsg)
-            self._lgr.error(self.stmt)
-            self._lgr.error(str(err))
-            raise BDMonException(err)
+            self._execerror(err)
+
+    def _execerror(self, err):
+        """ Log the error of the statement and raise it"""
+        errmsg = 'BDM-DB-05: Unable to execute query.'
+        self._lgr.error(errmsg)
+        self._lgr.error(self.stmt)
+        self._lgr.error(str(err))
+        raise BDMonException(err)
+
+    def _valueschunk(self, rowtmpl):
+        """ Rows per multi-row VALUES statement, below the row and bind parameter limits of the database"""
+        return max(min(_VALUESROWS, self._valuesparams // max(rowtmpl.count('?'), 1)), 1)
+
+    def _insvalues(self, stmt, params, width):
+        """ Insert the parameters of the rows, width per row, with multi-row VALUES statements
+        chunked by the bind parameter limit; executemany is used once a statement was too large for the
+        database, a data error e.g. unique constraint is raised"""
+        if stmt in self._valuesfail:
+            self.crsr.executemany(stmt, [tuple(params[pos:pos + width])
+                                         for pos in range(0, len(params), width)])
+            return
+        idx = stmt.lower().rindex('values')
+        rowtmpl = stmt[idx + len('values'):].strip()
+        chunk = self._valueschunk(rowtmpl)
+        nrows = len(params) // width
+        for pos in range(0, nrows, chunk):
+            part = min(chunk, nrows - pos)
+            try:
+                mstmt = self._valuestmts[(stmt, part)]
+            except KeyError:
+                mstmt = stmt[:idx] + 'values ' + ', '.join([rowtmpl] * part)
+                self._valuestmts[(stmt, part)] = mstmt
+            try:
+                if self._savepoint:
+                    self.crsr.execute('savepoint bdmon_values')
+                self.crsr.execute(mstmt, params[pos * width:(pos + part) * width])
+                if self._savepoint:
+                    self.crsr.execute('release savepoint bdmon_values')
+            except (pyodbc.Error, sqlite3.Error) as err:
+                if isdbdown(err):
+                    raise
+                if self._savepoint:
+                    #The transaction is usable again, the rows inserted before are kept
+                    self.crsr.execute('rollback to savepoint bdmon_values')
+                if not _toolarge(err):
+                    raise
+                #The rows not inserted are sent with executemany
+                self._lgr.warning('Multi-row insert failed, using executemany: %s; %s', stmt, err)
+                self._valuesfail.add(stmt)
+                self._insvalues(stmt, params[pos * width:], width)
+                return
+
+    def _inscolumns(self, stmt, columns):
+        """ Insert equal length columns; the row tuples are built for executemany only"""
+        if not columns or not len(columns[0]):
+            return
+        if self._bulkload == 'values':
+            self._insvalues(stmt, _flat(columns), len(columns))
+        elif self.dbtype.lower() == '{sqlite}':
+            self.crsr.executemany(stmt, zip(*columns))
+        else:
+            self.crsr.executemany(stmt, list(zip(*columns)))
+
+    def bulkload(self, stmt, columns):
+        """ Insert column batches, a sequence of equal length columns in the order of the
+        statement parameters; uses the bulk load mode of the database, not committed"""
+        self.stmt = stmt
+        self.values = columns
+        try:
+            self._lgr.debug("DB stmt: %s", self.stmt)
+            self._inscolumns(stmt, columns)
+        except (pyodbc.Error, sqlite3.Error) as err:
+            self._execerror(err)
+        finally:
+            self.stmt = ''
+            self.values = ''
+
+    def bufferstmt(self):
+        """ Buffer the insert statement values, a list of rows or a RowBatch; the buffered rows of all
+        statements are written and committed together once batchrows or batchbytes is reached, or on flush"""
+        self._buf.setdefault(self.stmt, []).append(self.values)
+        self._bufrows += len(self.values)
+        if isinstance(self.values, RowBatch):
+            self._bufbytes += self.values.nbytes()
+        else:
+            self._bufbytes += sum(_rowsize(row) for row in self.values)
+        if self._bufrows >= self._batchrows or self._bufbytes >= self._batchbytes:
+            self.flush()
+
+    def flush(self):
+        """ Write the buffered inserts and commit, a single transaction per flush
+        With a spool, the inserts are spooled when the database is unavailable
+        Returns False when the inserts are spooled and the spool discarded them, e.g. spool full"""
+        stmt, values = self.stmt, self.values
+        rows = self._bufrows
+        self._lgr.info("Flush rows:%d, bytes:%d", rows, self._bufbytes)
+        try:
+            if rows and self._spooling():
+                return self._spoolbuf()
+            try:
+                for bstmt, batches in self._buf.items():
+                    self.bulkload(bstmt, self._columns(batches))
+                self.commit()
+            except BDMonException as err:
+                if self.spool is None or not isdbdown(err):
+                    raise
+                self._downsince = monotonic()
+                self._lgr.warning('BDM-SP-01: Database unavailable, inserts spooled for %s seconds: %s',
+                                  self._strg["spoolretry"], err)
+                spooled = self._spoolbuf()
+                self.rollback()
+                return spooled
+        finally:
+            self.discard()
+            self.stmt, self.values = stmt, values
+        if rows:
+            self.stats['dbFlushes'] += 1
+            self.stats['dbRowsWritten'] += rows
+        return True
+
+    def _spooling(self):
+        """ Function to tell if the inserts are spooled, the database was unavailable less than
+        spoolretry seconds ago; the connection is renewed after spoolretry seconds"""
+        if self._downsince is None:
+            return False
+        if monotonic() - self._downsince < self._strg["spoolretry"]:
+            return True
+        self.close()
+        try:
+            self._connect(1, 0)
+        except BDMonException:
+            self._downsince = monotonic()
+            return True
+        self._lgr.info('Database connection renewed, spooling ended')
+        self._downsince = None
+        return False
+
+    @staticmethod
+    def _columns(batches):
+        """ Function to get the columns of the buffered batches of a statement, lists of rows or RowBatch"""
+        return [list(chain.from_iterable(cols)) for cols in
+                zip(*(batch.columns() if isinstance(batch, RowBatch) else list(zip(*batch))
+                      for batch in batches if len(batch)))]
+
+    def _spoolbuf(self):
+        """ Spool the buffered inserts, returns False when the spool discarded them"""
+        rows = dict((bstmt, list(chain.from_iterable(batches))) for bstmt, batches in self._buf.items())
+        nrows = self.spool.write(rows)
+        self.stats['dbRowsSpooled'] = self.stats.get('dbRowsSpooled', 0) + nrows
+        return nrows == self._bufrows
+
+    def discard(self):
+        """ Drop the buffered inserts"""
+        self._buf = {}
+        self._bufrows = 0
+        self._bufbytes = 0
 
     def commitclose(self):
         """ Commit all cursor transactions and close the db connection """
@@ -98,9 +404,15 @@ class DbOps():
     def commit(self):
         """ Commit the cursor transaction"""
         try:
-            self.crsr.commit()
-        except AttributeError: #sqlite3
-            self._dbcn.commit()
+            try:
+                self.crsr.commit()
+            except AttributeError: #sqlite3
+                self._dbcn.commit()
+        except (pyodbc.Error, sqlite3.Error) as err:
+            errmsg = 'BDM-DB-06: Unable to commit transaction.'
+            self._lgr.error(errmsg)
+            self._lgr.error(str(err))
+            raise BDMonException(err)
 
     def rollbackclose(self):
         """ Rollback all cursor transactions and close the db connection """
@@ -108,12 +420,22 @@ class DbOps():
         self._dbcn.close()
 
     def rollback(self):
-        """ Rollback the cursor transaction"""
+        """ Rollback the cursor transaction, buffered inserts included"""
+        self.discard()
         try:
-            self.crsr.rollback()
-        except AttributeError: #sqlite3
-            self._dbcn.rollback()
+            try:
+                self.crsr.rollback()
+            except AttributeError: #sqlite3
+                self._dbcn.rollback()
+        except (pyodbc.Error, sqlite3.Error) as err:
+            if self._downsince is None:
+                raise
+            #Connection lost, the inserts are spooled
+            self._lgr.debug('Rollback error: %s', err)
 
     def close(self):
         """Close the db connection """
-        self._dbcn.close()
+        try:
+            self._dbcn.close()
+        except (pyodbc.Error, sqlite3.Error) as err: #e.g. connection lost
+            self._lgr.warning('Unable to close the DB connection: %s', err)
@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" dbrollup module
+Metrics rollup: aggregates the metrics tables into 1 minute, 1 hour and 1 day buckets,
+min/max/avg/last/count per host and metric, for the dashboards of long time ranges
+Each run processes only the rows collected since the watermark of the table and level
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+from bdutils.coreutils import BDMonException, getlgr, getrollupdetails
+from bdutils.dbops import DbOps
+
+__all__ = ['rollup_metrics']
+
+#Metrics table: host column, columns joined with ':' as the modelerType of the rollup
+_SOURCES = {'t_node_metrics': ('hostnode', ('appname', 'appcomponent')),
+            't_hdfs_nn_metrics': ('namenode', ('modelerType',)),
+            't_hdfs_dn_metrics': ('datanode', ('modelerType',)),
+            't_yarn_rm_metrics': ('rmnode', ('modelerType',)),
+            't_yarn_nm_metrics': ('nmnode', ('modelerType',)),
+            't_hmaster_metrics': ('masternode', ('modelerType',)),
+            't_hbase_rs_metrics': ('rsnode', ('modelerType',)),
+            't_hive_metrics': ('hs2node', ('modelerType',)),
+            't_zk_metrics': ('zknode', ()),
+            't_bdmon_metrics': ('bdmonhost', ())}
+#Rollup level, the level aggregated and the rows aggregated per transaction
+_LEVELS = (('1m', '', timedelta(minutes=15)),
+           ('1h', '1m', timedelta(hours=6)),
+           ('1d', '1h', timedelta(days=1)))
+_TSFORMATS = ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S')
+
+
+def _tstamp(value):
+    """Function to get the datetime of a timestamp column, SQLite returns the text"""
+    if isinstance(value, datetime):
+        return value
+    for fmt in _TSFORMATS:
+        try:
+            return datetime.strptime(value[:26], fmt)
+        except ValueError:
+            pass
+    raise ValueError('Invalid timestamp: %s' % value)
+
+def _bucket(tstamp, level):
+    """Function to get the start of the bucket of a timestamp"""
+    if level == '1m':
+        return tstamp.replace(second=0, microsecond=0)
+    if level == '1h':
+        return tstamp.replace(minute=0, second=0, microsecond=0)
+    return tstamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class _Rollup():
+    """ Incremental aggregation of a metrics table, the raw rows into the 1m buckets
+    and each rollup level into the next one """
+    _insstmt = ('insert into t_rollup_%s (srctbl, hostnode, modelerType, metricname, minvalue, '
+                'maxvalue, avgvalue, lastvalue, cnt, collection_ts) values(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+
+    def __init__(self, lgr, dbo):
+        self._lgr = lgr
+        self._dbo = dbo
+        self.mtrx = {'error':0, 'rollupRowsRead':0, 'rollupRowsWritten':0}
+
+    def _query(self, stmt, values=''):
+        """Function to run a query, returns all the rows"""
+        self._dbo.stmt = stmt
+        self._dbo.values = values
+        self._dbo.execstmt()
+        return self._dbo.crsr.fetchall()
+
+    def _select(self, tbl, lower):
+        """Function to get the query of the rows to aggregate, with a uniform column order
+        host, modelerType parts, metricname, min, max, sum, count, last, collection_ts"""
+        if lower:
+            return ('select hostnode, modelerType, null, metricname, minvalue, maxvalue, avgvalue*cnt, cnt, '
+                    "lastvalue, collection_ts from t_rollup_%s where srctbl = '%s' "
+                    'and collection_ts >= ? and collection_ts < ?' % (lower, tbl))
+        host, mtype = _SOURCES[tbl]
+        return ('select %s, %s, metricname, numvalue, numvalue, numvalue, 1, numvalue, collection_ts '
+                'from %s where collection_ts >= ? and collection_ts < ? and numvalue is not null'
+                % (host, ', '.join((mtype + ('null', 'null'))[:2]), tbl))
+
+    def _watermark(self, tbl, level, lower):
+        """Function to get the start of the first bucket not aggregated, None if no rows yet"""
+        rows = self._query('select last_ts from t_rollup_watermark where srctbl = ? and rlevel = ?',
+                           (tbl, level))
+        if rows and rows[0][0] is not None:
+            return _tstamp(rows[0][0])
+        return self._first(tbl, level, lower, datetime(1970, 1, 1))
+
+    def _first(self, tbl, level, lower, after):
+        """Function to get the bucket of the first row collected after a timestamp, None if no rows"""
+        if lower:
+            rows = self._query('select min(collection_ts) from t_rollup_%s where srctbl = ? '
+                               'and collection_ts >= ?' % lower, (tbl, after))
+        else:
+            rows = self._query('select min(collection_ts) from %s where collection_ts >= ?' % tbl, (after,))
+        if not rows or rows[0][0] is None:
+            return None
+        return _bucket(_tstamp(rows[0][0]), level)
+
+    def _set_watermark(self, tbl, level, last_ts):
+        """Function to save the start of the first bucket not aggregated, committed with the buckets"""
+        self._dbo.stmt = 'update t_rollup_watermark set last_ts=?, updated_ts=? where srctbl=? and rlevel=?'
+        self._dbo.values = (last_ts, datetime.now(), tbl, level)
+        self._dbo.execstmt()
+        if self._dbo.crsr.rowcount < 1:
+            self._dbo.stmt = ('insert into t_rollup_watermark (srctbl, rlevel, last_ts, updated_ts) '
+                              'values(?, ?, ?, ?)')
+            self._dbo.values = [(tbl, level, last_ts, datetime.now())]
+            self._dbo.execstmt()
+
+    def _aggregate(self, tbl, level, lower, start, end):
+        """Function to aggregate the rows of a time window, returns the rollup rows"""
+        self._dbo.stmt = self._select(tbl, lower)
+        self._dbo.values = (start, end)
+        self._dbo.execstmt()
+        buckets = {}
+        nrows = 0
+        for row in self._dbo.crsr:
+            nrows += 1
+            tstamp = _tstamp(row[9])
+            mtype = ':'.join(str(col) for col in row[1:3] if col is not None)
+            key = (row[0], mtype, row[3], _bucket(tstamp, level))
+            agg = buckets.get(key)
+            if agg is None:
+                #min, max, sum, count, last collection_ts, last value
+                buckets[key] = [row[4], row[5], row[6], row[7], tstamp, row[8]]
+                continue
+            agg[0] = min(agg[0], row[4])
+            agg[1] = max(agg[1], row[5])
+            agg[2] += row[6]
+            agg[3] += row[7]
+            if tstamp >= agg[4]:
+                agg[4] = tstamp
+                agg[5] = row[8]
+        self.mtrx['rollupRowsRead'] += nrows
+        return [(tbl, key[0], key[1], key[2], agg[0], agg[1], agg[2] / agg[3], agg[5], agg[3], key[3])
+                for key, agg in buckets.items()]
+
+    def rollup(self, tbl, level, lower, window, cutoff):
+        """Function to aggregate the complete buckets since the watermark, a transaction per window
+        Returns the watermark i.e. the buckets of the next level are complete before it"""
+        start = self._watermark(tbl, level, lower)
+        if start is None:
+            return None
+        cutoff = _bucket(cutoff, level)
+        while start < cutoff:
+            end = min(start + window, cutoff)
+            rows = self._aggregate(tbl, level, lower, start, end)
+            if rows:
+                self._dbo.stmt = self._insstmt % level
+                self._dbo.values = rows
+                self._dbo.execstmt()
+                self.mtrx['rollupRowsWritten'] += len(rows)
+            self._lgr.debug('Rollup %s %s: %s to %s, %s rows', tbl, level, start, end, len(rows))
+            start = end
+            if not rows:
+                #Skip the windows without rows e.g. collection stopped
+                start = max(min(self._first(tbl, level, lower, end) or cutoff, cutoff), end)
+            self._set_watermark(tbl, level, start)
+            self._dbo.commit()
+        return start
+
+
+def _rollup(lgr, tables=None):
+    """Function to aggregate the metrics tables into the rollup tables"""
+    rlp = getrollupdetails(lgr)
+    tables = [tbl for tbl in tables or rlp["tables"] or sorted(_SOURCES) if tbl in _SOURCES]
+    stime = datetime.now()
+    dbo = DbOps(lgr)
+    try:
+        rlu = _Rollup(lgr, dbo)
+        for tbl in tables:
+            #Rows may be written a little after their collection_ts e.g. buffered inserts
+            cutoff = stime - timedelta(seconds=rlp["lag"])
+            try:
+                for level, lower, window in _LEVELS:
+                    cutoff = rlu.rollup(tbl, level, lower, window, cutoff)
+                    if cutoff is None:
+                        break
+            except BDMonException as err:
+                lgr.error('BDM-RL-01: Unable to aggregate table: %s', tbl)
+                lgr.error(err)
+                dbo.rollback()
+                rlu.mtrx['error'] += 1
+        etime = datetime.now()
+        rlu.mtrx['rollupTime'] = (etime - stime).total_seconds()
+        lgr.info('Rollup done:%s', rlu.mtrx)
+        #BDMonhost, metricname, numvalue, collection_ts
+        dbo.values = [(os.uname()[1], key, val, etime) for key, val in rlu.mtrx.items()]
+        dbo.stmt = ('insert into t_bdmon_metrics '
+                    '(bdmonhost, metricname, numvalue, collection_ts) '
+                    'values(?, ?, ?, ?)')
+        dbo.execstmt()
+        dbo.commit()
+    finally:
+        dbo.close()
+    return rlu.mtrx['error']
+
+def rollup_metrics(tables=None, logidentifier='', logmode=30):
+    """ Aggregate the metrics tables into the rollup tables t_rollup_1m, t_rollup_1h, t_rollup_1d
+    Parameters
+    -----------
+    tables : tuple or list
+        List of tables (default: the tables of [ROLLUP] config section, or all metrics tables)
+    logidentifier : Unique log file name (default: '')
+    logmode : Log level(default: 30) i.e. WARNING
+        Valid values: DEBUG, INFO, WARNING, ERROR, CRITICAL
+
+    Returns
+    -------
+    Exit code : integer
+        0: All the tables aggregated
+        1: Error when processing
+
+    Usage
+    -------
+    To aggregate the rows collected since the last run e.g. from a cron job every 5 minutes
+        e.g. rollup_metrics()
+    To aggregate specific tables
+        e.g. rollup_metrics(('t_hdfs_dn_metrics',))
+    """
+    if logmode not in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
+        logmode = 'INFO'
+    lgr = getlgr(logmode, str(logidentifier))
+    try:
+        errors = _rollup(lgr, tables)
+    except BDMonException as err:
+        lgr.error('BDM-RL-00: Unable to aggregate the metrics')
+        lgr.error(err)
+        sys.exit(1)
+    sys.exit(1 if errors else 0)
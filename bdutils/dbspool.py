@@ -0,0 +1,284 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" dbspool module
+Durable on-disk spool of the inserts not written while the database is unavailable or lagging
+Each batch is an append-only gzip JSON segment file, replayed in order once the database is back
+The segment id is inserted to t_spool_segments with the rows, a segment is never loaded twice
+"""
+import os
+import gzip
+import json
+import threading
+from datetime import datetime
+from time import monotonic
+
+from bdutils.coreutils import BDMonException
+from bdutils.dbops import DbOps, isdbdown
+
+__all__ = ['DbSpool', 'SpoolReplayer']
+
+_SUFFIX = '.json.gz'
+#Suffix of the pending segments, not replayed until published: process id, tag
+_PENDING = '.pending-%s-%s'
+_TSFORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
+
+def _alive(pid):
+    """Function to check if a process is running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _tstamp(value):
+    """Function to get the datetime of a spooled timestamp"""
+    for fmt in _TSFORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError('Invalid timestamp: %s' % value)
+
+
+class DbSpool():
+    """ Spool directory of the insert batches, a segment file per batch
+    Segment names start with the time spooled, segments are replayed in the order spooled """
+    def __init__(self, lgr, path, maxmb=1024):
+        self._lgr = lgr
+        self._path = path
+        self._maxbytes = maxmb * 1048576
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._prefix = '%s-%s' % (os.uname()[1], os.getpid())
+        os.makedirs(self._path, exist_ok=True)
+        self._dropstale()
+        self._bytes = sum(os.path.getsize(os.path.join(self._path, sgmt)) for sgmt in self.segments())
+        self._lgr.info('Spool directory:%s, %s segments', self._path, len(self.segments()))
+
+    def _dropstale(self):
+        """Function to delete the pending segments of the processes stopped, their rows were not committed"""
+        for fle in os.listdir(self._path):
+            pos = fle.find(_SUFFIX + '.pending-')
+            if pos < 0:
+                continue
+            try:
+                pid = int(fle[pos + len(_SUFFIX + '.pending-'):].split('-')[0])
+            except ValueError:
+                continue
+            if not _alive(pid):
+                self._lgr.warning('Pending spool segment %s of a stopped process deleted', fle)
+                os.remove(os.path.join(self._path, fle))
+
+    def segments(self):
+        """Function to get the segment files, in the order spooled"""
+        return sorted(fle for fle in os.listdir(self._path) if fle.endswith(_SUFFIX))
+
+    def write(self, batch, tag=''):
+        """Function to spool a batch of inserts {statement: rows}, returns the rows spooled
+        Datetime columns are saved in the ISO format, the columns are kept with the rows
+        With a tag, the segment is pending i.e. not replayed, until the tag is published"""
+        stmts = []
+        nrows = 0
+        for stmt, rows in batch.items():
+            if not rows:
+                continue
+            tscols = sorted(set(idx for row in rows for idx, val in enumerate(row)
+                                if isinstance(val, datetime)))
+            if tscols:
+                rows = [[val.isoformat() if isinstance(val, datetime) else val for val in row]
+                        for row in rows]
+            stmts.append((stmt, tscols, rows))
+            nrows += len(rows)
+        if not nrows:
+            return 0
+        with self._lock:
+            self._seq += 1
+            sgmtid = '%s-%s-%d' % (datetime.now().strftime('%Y%m%d%H%M%S%f'), self._prefix, self._seq)
+        data = gzip.compress(json.dumps({'id':sgmtid, 'stmts':stmts}, separators=(',', ':')).encode())
+        with self._lock:
+            if self._bytes + len(data) > self._maxbytes:
+                self._lgr.error('BDM-SP-02: Spool directory full, %s rows discarded', nrows)
+                return 0
+            self._bytes += len(data)
+        fname = os.path.join(self._path, sgmtid + _SUFFIX)
+        if tag:
+            fname += _PENDING % (os.getpid(), tag)
+        try:
+            #A segment is complete once renamed, partial files are never replayed
+            with open(fname + '.tmp', 'wb') as fle:
+                fle.write(data)
+                fle.flush()
+                os.fsync(fle.fileno())
+            os.replace(fname + '.tmp', fname)
+        except OSError as err:
+            with self._lock:
+                self._bytes -= len(data)
+            self._lgr.error('BDM-SP-03: Unable to write spool segment %s, %s rows discarded: %s',
+                            fname, nrows, err)
+            return 0
+        self._lgr.debug('Spooled %s rows to %s', nrows, fname)
+        return nrows
+
+    def _pending(self, tag):
+        """Function to get the pending segment files of a tag, of this process"""
+        sfx = _SUFFIX + _PENDING % (os.getpid(), tag)
+        return sorted(fle for fle in os.listdir(self._path) if fle.endswith(sfx))
+
+    def publish(self, tag):
+        """Function to make the pending segments of a tag replayable e.g. the rows of an app committed"""
+        for fle in self._pending(tag):
+            os.replace(os.path.join(self._path, fle),
+                       os.path.join(self._path, fle[:fle.index(_SUFFIX) + len(_SUFFIX)]))
+
+    def drop(self, tag):
+        """Function to delete the pending segments of a tag e.g. the rows of an app rolled back
+        Returns the segments deleted"""
+        sgmts = self._pending(tag)
+        for fle in sgmts:
+            self.remove(fle)
+        return len(sgmts)
+
+    def read(self, sgmt):
+        """Function to read a segment, returns the segment id and the list of (statement, rows)"""
+        with gzip.open(os.path.join(self._path, sgmt), 'rt') as fle:
+            data = json.load(fle)
+        stmts = []
+        for stmt, tscols, rows in data['stmts']:
+            for row in rows:
+                for idx in tscols:
+                    if row[idx] is not None:
+                        row[idx] = _tstamp(row[idx])
+            stmts.append((stmt, rows))
+        return data['id'], stmts
+
+    def remove(self, sgmt, suffix=''):
+        """Function to delete a segment replayed, or to rename it with the suffix"""
+        fname = os.path.join(self._path, sgmt)
+        size = os.path.getsize(fname)
+        if suffix:
+            os.replace(fname, fname + suffix)
+        else:
+            os.remove(fname)
+        with self._lock:
+            self._bytes -= size
+
+    def replay(self, dbo, stop=None):
+        """Function to load the segments in order, a transaction per segment
+        Segments already in t_spool_segments are deleted; the pass ends when the database is down
+        Returns the segments and rows replayed"""
+        mtrx = {'spoolSegmentsReplayed':0, 'spoolRowsReplayed':0}
+        for sgmt in self.segments():
+            if stop is not None and stop.is_set():
+                break
+            try:
+                sgmtid, stmts = self.read(sgmt)
+            except (OSError, EOFError, ValueError, KeyError, IndexError, TypeError) as err:
+                self._lgr.error('BDM-SP-04: Invalid spool segment %s, renamed .bad: %s', sgmt, err)
+                self.remove(sgmt, '.bad')
+                continue
+            try:
+                dbo.stmt = 'select segment_id from t_spool_segments where segment_id = ?'
+                dbo.values = (sgmtid,)
+                dbo.execstmt()
+                if dbo.crsr.fetchall():
+                    #Loaded before the segment file was deleted
+                    self._lgr.info('Spool segment %s already loaded', sgmtid)
+                    self.remove(sgmt)
+                    continue
+                nrows = 0
+                for dbo.stmt, dbo.values in stmts:
+                    dbo.execstmt()
+                    nrows += len(dbo.values)
+                dbo.stmt = ('insert into t_spool_segments (segment_id, bdmonhost, rowcnt, replayed_ts) '
+                            'values(?, ?, ?, ?)')
+                dbo.values = [(sgmtid, os.uname()[1], nrows, datetime.now())]
+                dbo.execstmt()
+                dbo.commit()
+            except BDMonException as err:
+                dbo.rollback()
+                if isdbdown(err):
+                    self._lgr.warning('Database unavailable, spool replay stopped: %s', err)
+                    break
+                self._lgr.error('BDM-SP-05: Unable to load spool segment %s, renamed .bad: %s', sgmt, err)
+                self.remove(sgmt, '.bad')
+                continue
+            self.remove(sgmt)
+            mtrx['spoolSegmentsReplayed'] += 1
+            mtrx['spoolRowsReplayed'] += nrows
+            self._lgr.info('Spool segment %s loaded, %s rows', sgmtid, nrows)
+        return mtrx
+
+
+class SpoolReplayer():
+    """ Thread loading the spooled segments with its own DbOps, a pass every interval seconds
+    Stopped by stop(), after the segment being loaded """
+    def __init__(self, lgr, spool, interval=60):
+        self._lgr = lgr
+        self._spool = spool
+        self._interval = interval
+        self._stop = threading.Event()
+        self._dbo = None
+        self._thrd = threading.Thread(target=self._run, name='bdmon-spool-replay')
+        self._thrd.daemon = True
+        self._thrd.start()
+
+    def _connect(self):
+        """Function to get the DB connection of the replays, None while the database is down"""
+        if self._dbo is None:
+            try:
+                self._dbo = DbOps(self._lgr)
+            except BDMonException as err:
+                self._lgr.warning('Database unavailable, spool replay postponed: %s', err)
+        return self._dbo
+
+    def _pass(self):
+        """Function to load the spooled segments, the replay metrics are inserted to t_bdmon_metrics"""
+        if not self._spool.segments() or self._connect() is None:
+            return
+        stime = monotonic()
+        mtrx = self._spool.replay(self._dbo, self._stop)
+        if not mtrx['spoolSegmentsReplayed']:
+            #The connection is renewed on the next pass, e.g. database restarted
+            self._dbo.close()
+            self._dbo = None
+            return
+        mtrx['spoolReplayTime'] = monotonic() - stime
+        self._lgr.info('Spool replay done:%s', mtrx)
+        etime = datetime.now()
+        self._dbo.stmt = ('insert into t_bdmon_metrics '
+                          '(bdmonhost, metricname, numvalue, collection_ts) '
+                          'values(?, ?, ?, ?)')
+        self._dbo.values = [(os.uname()[1], key, val, etime) for key, val in mtrx.items()]
+        try:
+            self._dbo.execstmt()
+            self._dbo.commit()
+        except BDMonException as err:
+            self._dbo.rollback()
+            self._lgr.warning('Unable to insert the spool replay metrics: %s', err)
+
+    def _run(self):
+        """Replay thread"""
+        while not self._stop.is_set():
+            try:
+                self._pass()
+            except OSError as err:
+                self._lgr.error('BDM-SP-06: Spool replay error: %s', err)
+            self._stop.wait(self._interval)
+        if self._dbo is not None:
+            self._dbo.close()
+
+    def stop(self):
+        """Function to stop the replays, waits for the segment being loaded"""
+        self._stop.set()
+        self._thrd.join(self._interval)
+        if self._thrd.is_alive():
+            #e.g. waiting for the database connection, the segment is loaded again on the next run
+            self._lgr.warning('Spool replay not stopped in %s seconds', self._interval)
+
@@ -99,3 +99,9 @@ Insert into t_coll_metrics (appname, appcomponent, modelerType, is_active) value
 Insert into t_coll_metrics (appname, appcomponent, modelerType, is_active) values('yarn', 'nm', 'RpcActivityFor', 'N');
 Insert into t_coll_metrics (appname, appcomponent, modelerType, is_active) values('yarn', 'nm', 'UgiMetrics', 'N');
 Insert into t_coll_metrics (appname, appcomponent, modelerType, is_active) values('yarn', 'nm', 'MetricsSystem,sub=Stats', 'N');
+
+-- Counters i.e. monotonic attributes, also stored as per second rates <attribute>PerSec, * wildcards allowed
+Update t_coll_metrics set counters = 'GcCount*,GcTimeMillis*' where modelerType = 'JvmMetrics';
+Update t_coll_metrics set counters = 'RpcProcessingTimeNumOps,RpcQueueTimeNumOps,ReceivedBytes,SentBytes' where modelerType like 'RpcActivityFor%';
+Update t_coll_metrics set counters = 'BytesRead,BytesWritten,BlocksRead,BlocksWritten' where modelerType = 'DataNodeActivity-';
+Update t_coll_metrics set counters = '*-Collection,*-CollectionTime' where modelerType = 'sun.management.GarbageCollectorImpl';
@@ -0,0 +1,187 @@
+-- Normalized storage, [STORAGE] layout = normalized in bdmon.ini
+-- Execute after bdmon_mssql.sql on a new database, host and metric names are stored once in
+-- t_hosts and t_metric_names, the metrics tables keep the integer ids only.
+-- The metrics tables are replaced by views of the same name and columns, for the grafana dashboards
+DROP TABLE t_node_metrics;
+DROP TABLE t_hdfs_nn_metrics;
+DROP TABLE t_hdfs_dn_metrics;
+DROP TABLE t_yarn_rm_metrics;
+DROP TABLE t_yarn_nm_metrics;
+DROP TABLE t_hmaster_metrics;
+DROP TABLE t_hbase_rs_metrics;
+DROP TABLE t_hive_metrics;
+
+CREATE TABLE t_hosts
+(
+  id int identity,
+  hostname varchar(64),
+  CONSTRAINT t_hosts_pkey PRIMARY KEY (id),
+  CONSTRAINT cons_hosts_uniq UNIQUE (hostname)
+);
+
+-- modelerType is empty for the node OS metrics
+CREATE TABLE t_metric_names
+(
+  id int identity,
+  modelerType varchar(64),
+  metricname varchar(128),
+  CONSTRAINT t_metric_names_pkey PRIMARY KEY (id),
+  CONSTRAINT cons_metric_names_uniq UNIQUE (modelerType, metricname)
+);
+
+CREATE TABLE t_node_metrics_norm
+(
+  id int identity,
+  host_id integer,
+  appname varchar(16),
+  appcomponent varchar(16),
+  metric_id integer,
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_node_norm_pkey PRIMARY KEY (id)
+);
+Create index ind_node_norm_ts on t_node_metrics_norm(collection_ts);
+Create index ind_node_norm_hm on t_node_metrics_norm(host_id, metric_id);
+
+CREATE TABLE t_hdfs_nn_metrics_norm
+(
+  id int identity,
+  host_id integer,
+  is_active character(1) default 'N',
+  metric_id integer,
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_hdfs_nn_norm_pkey PRIMARY KEY (id)
+);
+Create index ind_hdfs_nn_norm_ts on t_hdfs_nn_metrics_norm(collection_ts);
+Create index ind_hdfs_nn_norm_hm on t_hdfs_nn_metrics_norm(host_id, metric_id);
+
+CREATE TABLE t_hdfs_dn_metrics_norm
+(
+  id int identity,
+  host_id integer,
+  metric_id integer,
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_hdfs_dn_norm_pkey PRIMARY KEY (id)
+);
+Create index ind_hdfs_dn_norm_ts on t_hdfs_dn_metrics_norm(collection_ts);
+Create index ind_hdfs_dn_norm_hm on t_hdfs_dn_metrics_norm(host_id, metric_id);
+
+CREATE TABLE t_yarn_rm_metrics_norm
+(
+  id int identity,
+  host_id integer,
+  metric_id integer,
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_yarn_rm_norm_pkey PRIMARY KEY (id)
+);
+Create index ind_yarn_rm_norm_ts on t_yarn_rm_metrics_norm(collection_ts);
+Create index ind_yarn_rm_norm_hm on t_yarn_rm_metrics_norm(host_id, metric_id);
+
+CREATE TABLE t_yarn_nm_metrics_norm
+(
+  id int identity,
+  host_id integer,
+  metric_id integer,
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_yarn_nm_norm_pkey PRIMARY KEY (id)
+);
+Create index ind_yarn_nm_norm_ts on t_yarn_nm_metrics_norm(collection_ts);
+Create index ind_yarn_nm_norm_hm on t_yarn_nm_metrics_norm(host_id, metric_id);
+
+CREATE TABLE t_hmaster_metrics_norm
+(
+  id int identity,
+  host_id integer,
+  is_active character(1) default 'N',
+  metric_id integer,
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_hmaster_norm_pkey PRIMARY KEY (id)
+);
+Create index ind_hmaster_norm_ts on t_hmaster_metrics_norm(collection_ts);
+Create index ind_hmaster_norm_hm on t_hmaster_metrics_norm(host_id, metric_id);
+
+CREATE TABLE t_hbase_rs_metrics_norm
+(
+  id int identity,
+  host_id integer,
+  metric_id integer,
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_hbase_rs_norm_pkey PRIMARY KEY (id)
+);
+Create index ind_hbase_rs_norm_ts on t_hbase_rs_metrics_norm(collection_ts);
+Create index ind_hbase_rs_norm_hm on t_hbase_rs_metrics_norm(host_id, metric_id);
+
+CREATE TABLE t_hive_metrics_norm
+(
+  id int identity,
+  host_id integer,
+  metric_id integer,
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_hive_norm_pkey PRIMARY KEY (id)
+);
+Create index ind_hive_norm_ts on t_hive_metrics_norm(collection_ts);
+Create index ind_hive_norm_hm on t_hive_metrics_norm(host_id, metric_id);
+
+GO
+CREATE VIEW t_node_metrics AS
+SELECT n.id, h.hostname as hostnode, n.appname, n.appcomponent, m.metricname, n.numvalue, n.collection_ts
+FROM t_node_metrics_norm n
+JOIN t_hosts h ON h.id = n.host_id
+JOIN t_metric_names m ON m.id = n.metric_id;
+
+GO
+CREATE VIEW t_hdfs_nn_metrics AS
+SELECT n.id, h.hostname as namenode, n.is_active, m.modelerType, m.metricname, n.numvalue, n.collection_ts
+FROM t_hdfs_nn_metrics_norm n
+JOIN t_hosts h ON h.id = n.host_id
+JOIN t_metric_names m ON m.id = n.metric_id;
+
+GO
+CREATE VIEW t_hdfs_dn_metrics AS
+SELECT n.id, h.hostname as datanode, m.modelerType, m.metricname, n.numvalue, n.collection_ts
+FROM t_hdfs_dn_metrics_norm n
+JOIN t_hosts h ON h.id = n.host_id
+JOIN t_metric_names m ON m.id = n.metric_id;
+
+GO
+CREATE VIEW t_yarn_rm_metrics AS
+SELECT n.id, h.hostname as rmnode, m.modelerType, m.metricname, n.numvalue, n.collection_ts
+FROM t_yarn_rm_metrics_norm n
+JOIN t_hosts h ON h.id = n.host_id
+JOIN t_metric_names m ON m.id = n.metric_id;
+
+GO
+CREATE VIEW t_yarn_nm_metrics AS
+SELECT n.id, h.hostname as nmnode, m.modelerType, m.metricname, n.numvalue, n.collection_ts
+FROM t_yarn_nm_metrics_norm n
+JOIN t_hosts h ON h.id = n.host_id
+JOIN t_metric_names m ON m.id = n.metric_id;
+
+GO
+CREATE VIEW t_hmaster_metrics AS
+SELECT n.id, h.hostname as masternode, n.is_active, m.modelerType, m.metricname, n.numvalue, n.collection_ts
+FROM t_hmaster_metrics_norm n
+JOIN t_hosts h ON h.id = n.host_id
+JOIN t_metric_names m ON m.id = n.metric_id;
+
+GO
+CREATE VIEW t_hbase_rs_metrics AS
+SELECT n.id, h.hostname as rsnode, m.modelerType, m.metricname, n.numvalue, n.collection_ts
+FROM t_hbase_rs_metrics_norm n
+JOIN t_hosts h ON h.id = n.host_id
+JOIN t_metric_names m ON m.id = n.metric_id;
+
+GO
+CREATE VIEW t_hive_metrics AS
+SELECT n.id, h.hostname as hs2node, m.modelerType, m.metricname, n.numvalue, n.collection_ts
+FROM t_hive_metrics_norm n
+JOIN t_hosts h ON h.id = n.host_id
+JOIN t_metric_names m ON m.id = n.metric_id;
+GO
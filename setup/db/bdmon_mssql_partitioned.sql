@@ -0,0 +1,198 @@
+-- Time partitioned metrics tables, SQL Server 2016 or later
+-- Execute after bdmon_mssql.sql on a new database, the metrics tables are recreated on a partition
+-- function pf_<table> and scheme ps_<table> by range of collection_ts, starting with a single partition.
+-- Partitions are created ahead and dropped once expired by bdutils.dbmaint.maintain_db, see [RETENTION]
+DROP TABLE t_node_metrics;
+DROP TABLE t_hdfs_nn_metrics;
+DROP TABLE t_hdfs_dn_metrics;
+DROP TABLE t_yarn_rm_metrics;
+DROP TABLE t_yarn_nm_metrics;
+DROP TABLE t_hmaster_metrics;
+DROP TABLE t_hbase_rs_metrics;
+DROP TABLE t_hbase_tbl_metrics;
+DROP TABLE t_hive_metrics;
+DROP TABLE t_zk_conn_metrics;
+DROP TABLE t_zk_metrics;
+DROP TABLE t_bdmon_metrics;
+
+CREATE PARTITION FUNCTION pf_t_node_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_node_metrics AS PARTITION pf_t_node_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_node_metrics
+(
+  id int identity,
+  hostnode varchar(64),
+  appname   varchar(16),
+  appcomponent varchar(16),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_host_app_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_node_metrics (collection_ts);
+Create index ind_node_ts_hn on t_node_metrics(collection_ts, hostnode);
+Create index ind_node_anc_mt on t_node_metrics(appname, appcomponent);
+
+CREATE PARTITION FUNCTION pf_t_hdfs_nn_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_hdfs_nn_metrics AS PARTITION pf_t_hdfs_nn_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_hdfs_nn_metrics
+(
+  id int identity,
+  namenode varchar(64),
+  is_active    character(1) default 'N',
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_hdfs_nn_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_hdfs_nn_metrics (collection_ts);
+Create index ind_t_hdfs_nn_ts on t_hdfs_nn_metrics(collection_ts);
+Create index ind_t_hdfs_mt_ts on t_hdfs_nn_metrics(modelerType);
+
+CREATE PARTITION FUNCTION pf_t_hdfs_dn_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_hdfs_dn_metrics AS PARTITION pf_t_hdfs_dn_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_hdfs_dn_metrics
+(
+  id int identity,
+  datanode varchar(64),
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_hdfs_dn_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_hdfs_dn_metrics (collection_ts);
+Create index ind_hdfs_dn_ts on t_hdfs_dn_metrics(collection_ts);
+Create index ind_hdfs_mt_ts on t_hdfs_dn_metrics(modelerType);
+
+CREATE PARTITION FUNCTION pf_t_yarn_rm_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_yarn_rm_metrics AS PARTITION pf_t_yarn_rm_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_yarn_rm_metrics
+(
+  id int identity,
+  rmnode varchar(64),
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_yarn_rm_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_yarn_rm_metrics (collection_ts);
+Create index ind_t_yarn_rm_ts on t_yarn_rm_metrics(collection_ts);
+Create index ind_t_yarn_mt_ts on t_yarn_rm_metrics(modelerType);
+
+CREATE PARTITION FUNCTION pf_t_yarn_nm_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_yarn_nm_metrics AS PARTITION pf_t_yarn_nm_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_yarn_nm_metrics
+(
+  id int identity,
+  nmnode varchar(64),
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_yarn_nm_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_yarn_nm_metrics (collection_ts);
+Create index ind_yarn_nm_ts on t_yarn_nm_metrics(collection_ts);
+Create index ind_yarn_mt_ts on t_yarn_nm_metrics(modelerType);
+
+CREATE PARTITION FUNCTION pf_t_hmaster_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_hmaster_metrics AS PARTITION pf_t_hmaster_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_hmaster_metrics
+(
+  id int identity,
+  masternode varchar(64),
+  is_active    character(1) default 'N',
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_hmaster_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_hmaster_metrics (collection_ts);
+Create index ind_hmaster_ts on t_hmaster_metrics(collection_ts);
+Create index ind_hmaster_mt on t_hmaster_metrics(modelerType);
+
+CREATE PARTITION FUNCTION pf_t_hbase_rs_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_hbase_rs_metrics AS PARTITION pf_t_hbase_rs_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_hbase_rs_metrics
+(
+  id int identity,
+  rsnode varchar(64),
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_hbase_rs_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_hbase_rs_metrics (collection_ts);
+Create index ind_hbase_rs_ts on t_hbase_rs_metrics(collection_ts);
+Create index ind_hbase_rs_mt on t_hbase_rs_metrics(modelerType);
+
+CREATE PARTITION FUNCTION pf_t_hbase_tbl_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_hbase_tbl_metrics AS PARTITION pf_t_hbase_tbl_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_hbase_tbl_metrics
+(
+  id int identity,
+  namespace varchar(64),
+  tblname   varchar(64),
+  regionid   varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_hbase_tbl_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_hbase_tbl_metrics (collection_ts);
+Create index ind_hbase_tbl_tbl_mn on t_hbase_tbl_metrics(tblname, metricname);
+Create index ind_hbase_tbl_tbl_ts on t_hbase_tbl_metrics(collection_ts);
+
+CREATE PARTITION FUNCTION pf_t_hive_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_hive_metrics AS PARTITION pf_t_hive_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_hive_metrics
+(
+  id int identity,
+  hs2node varchar(64),
+  modelerType varchar(64),
+  metricname varchar(128),
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_hive_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_hive_metrics (collection_ts);
+Create index ind_hive_ts on t_hive_metrics(collection_ts);
+Create index ind_hive_mt on t_hive_metrics(modelerType);
+
+CREATE PARTITION FUNCTION pf_t_zk_conn_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_zk_conn_metrics AS PARTITION pf_t_zk_conn_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_zk_conn_metrics
+(
+  id int identity,
+  zknode varchar(64),
+  client_hostnode varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_zk_conn_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_zk_conn_metrics (collection_ts);
+Create index ind_zk_conn_ts on t_zk_conn_metrics(collection_ts);
+Create index ind_zk_conn_ts_hn on t_zk_conn_metrics(collection_ts, zknode);
+
+CREATE PARTITION FUNCTION pf_t_zk_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_zk_metrics AS PARTITION pf_t_zk_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_zk_metrics
+(
+  id int identity,
+  zknode varchar(64),
+  zk_mode character(1) default 's',
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts datetime,
+  CONSTRAINT t_zk_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_zk_metrics (collection_ts);
+Create index ind_zk_hst_mn on t_zk_metrics(zknode, metricname);
+Create index ind_zk_ts on t_zk_metrics(collection_ts);
+
+CREATE PARTITION FUNCTION pf_t_bdmon_metrics (datetime) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_t_bdmon_metrics AS PARTITION pf_t_bdmon_metrics ALL TO ([PRIMARY]);
+CREATE TABLE t_bdmon_metrics
+(
+  id int identity,
+  bdmonhost varchar(64),
+  metricname varchar(64),
+  numvalue    float, 
+  collection_ts datetime,
+  CONSTRAINT t_bdmon_pkey PRIMARY KEY (id, collection_ts)
+) ON ps_t_bdmon_metrics (collection_ts);
+Create index ind_bdmon_ts on t_bdmon_metrics(collection_ts);
@@ -0,0 +1,164 @@
+-- Bean snapshot storage, [STORAGE] layout = snapshot in bdmon.ini
+-- Execute after bdmon_mysql.sql on a new database (MySQL 8.0.17 or later), each bean is stored as one row
+-- with its numeric attributes in the metrics JSON column, instead of a row per attribute.
+-- The metrics tables are replaced by views of the same name and columns, for the grafana dashboards
+DROP TABLE t_node_metrics;
+DROP TABLE t_hdfs_nn_metrics;
+DROP TABLE t_hdfs_dn_metrics;
+DROP TABLE t_yarn_rm_metrics;
+DROP TABLE t_yarn_nm_metrics;
+DROP TABLE t_hmaster_metrics;
+DROP TABLE t_hbase_rs_metrics;
+DROP TABLE t_hive_metrics;
+
+CREATE TABLE t_node_metrics_snap
+(
+  id serial NOT NULL,
+  hostnode varchar(64),
+  appname varchar(16),
+  appcomponent varchar(16),
+  collection_ts datetime,
+  metrics json,
+  CONSTRAINT t_node_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_node_snap_ts on t_node_metrics_snap(collection_ts, hostnode);
+
+CREATE TABLE t_hdfs_nn_metrics_snap
+(
+  id serial NOT NULL,
+  namenode varchar(64),
+  is_active character(1) default 'N',
+  modelerType varchar(64),
+  collection_ts datetime,
+  metrics json,
+  heap_used float AS (metrics->>'$.MemHeapUsedM') VIRTUAL,
+  CONSTRAINT t_hdfs_nn_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_hdfs_nn_snap_ts on t_hdfs_nn_metrics_snap(collection_ts, namenode);
+Create index ind_hdfs_nn_snap_mt on t_hdfs_nn_metrics_snap(modelerType);
+Create index ind_hdfs_nn_snap_heap on t_hdfs_nn_metrics_snap(namenode, heap_used);
+
+CREATE TABLE t_hdfs_dn_metrics_snap
+(
+  id serial NOT NULL,
+  datanode varchar(64),
+  modelerType varchar(64),
+  collection_ts datetime,
+  metrics json,
+  heap_used float AS (metrics->>'$.MemHeapUsedM') VIRTUAL,
+  CONSTRAINT t_hdfs_dn_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_hdfs_dn_snap_ts on t_hdfs_dn_metrics_snap(collection_ts, datanode);
+Create index ind_hdfs_dn_snap_mt on t_hdfs_dn_metrics_snap(modelerType);
+Create index ind_hdfs_dn_snap_heap on t_hdfs_dn_metrics_snap(datanode, heap_used);
+
+CREATE TABLE t_yarn_rm_metrics_snap
+(
+  id serial NOT NULL,
+  rmnode varchar(64),
+  modelerType varchar(64),
+  collection_ts datetime,
+  metrics json,
+  heap_used float AS (metrics->>'$.MemHeapUsedM') VIRTUAL,
+  CONSTRAINT t_yarn_rm_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_yarn_rm_snap_ts on t_yarn_rm_metrics_snap(collection_ts, rmnode);
+Create index ind_yarn_rm_snap_mt on t_yarn_rm_metrics_snap(modelerType);
+Create index ind_yarn_rm_snap_heap on t_yarn_rm_metrics_snap(rmnode, heap_used);
+
+CREATE TABLE t_yarn_nm_metrics_snap
+(
+  id serial NOT NULL,
+  nmnode varchar(64),
+  modelerType varchar(64),
+  collection_ts datetime,
+  metrics json,
+  heap_used float AS (metrics->>'$.MemHeapUsedM') VIRTUAL,
+  CONSTRAINT t_yarn_nm_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_yarn_nm_snap_ts on t_yarn_nm_metrics_snap(collection_ts, nmnode);
+Create index ind_yarn_nm_snap_mt on t_yarn_nm_metrics_snap(modelerType);
+Create index ind_yarn_nm_snap_heap on t_yarn_nm_metrics_snap(nmnode, heap_used);
+
+CREATE TABLE t_hmaster_metrics_snap
+(
+  id serial NOT NULL,
+  masternode varchar(64),
+  is_active character(1) default 'N',
+  modelerType varchar(64),
+  collection_ts datetime,
+  metrics json,
+  heap_used float AS (metrics->>'$.MemHeapUsedM') VIRTUAL,
+  CONSTRAINT t_hmaster_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_hmaster_snap_ts on t_hmaster_metrics_snap(collection_ts, masternode);
+Create index ind_hmaster_snap_mt on t_hmaster_metrics_snap(modelerType);
+Create index ind_hmaster_snap_heap on t_hmaster_metrics_snap(masternode, heap_used);
+
+CREATE TABLE t_hbase_rs_metrics_snap
+(
+  id serial NOT NULL,
+  rsnode varchar(64),
+  modelerType varchar(64),
+  collection_ts datetime,
+  metrics json,
+  heap_used float AS (metrics->>'$.MemHeapUsedM') VIRTUAL,
+  CONSTRAINT t_hbase_rs_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_hbase_rs_snap_ts on t_hbase_rs_metrics_snap(collection_ts, rsnode);
+Create index ind_hbase_rs_snap_mt on t_hbase_rs_metrics_snap(modelerType);
+Create index ind_hbase_rs_snap_heap on t_hbase_rs_metrics_snap(rsnode, heap_used);
+
+CREATE TABLE t_hive_metrics_snap
+(
+  id serial NOT NULL,
+  hs2node varchar(64),
+  modelerType varchar(64),
+  collection_ts datetime,
+  metrics json,
+  heap_used float AS (metrics->>'$.MemHeapUsedM') VIRTUAL,
+  CONSTRAINT t_hive_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_hive_snap_ts on t_hive_metrics_snap(collection_ts, hs2node);
+Create index ind_hive_snap_mt on t_hive_metrics_snap(modelerType);
+Create index ind_hive_snap_heap on t_hive_metrics_snap(hs2node, heap_used);
+
+CREATE VIEW t_node_metrics AS
+SELECT s.id, s.hostnode, s.appname, s.appcomponent, k.metricname, CAST(JSON_EXTRACT(s.metrics, CONCAT('$."', k.metricname, '"')) AS DOUBLE) AS numvalue, s.collection_ts
+FROM t_node_metrics_snap s,
+JSON_TABLE(JSON_KEYS(s.metrics), '$[*]' COLUMNS (metricname varchar(128) PATH '$')) k;
+
+CREATE VIEW t_hdfs_nn_metrics AS
+SELECT s.id, s.namenode, s.is_active, s.modelerType, k.metricname, CAST(JSON_EXTRACT(s.metrics, CONCAT('$."', k.metricname, '"')) AS DOUBLE) AS numvalue, s.collection_ts
+FROM t_hdfs_nn_metrics_snap s,
+JSON_TABLE(JSON_KEYS(s.metrics), '$[*]' COLUMNS (metricname varchar(128) PATH '$')) k;
+
+CREATE VIEW t_hdfs_dn_metrics AS
+SELECT s.id, s.datanode, s.modelerType, k.metricname, CAST(JSON_EXTRACT(s.metrics, CONCAT('$."', k.metricname, '"')) AS DOUBLE) AS numvalue, s.collection_ts
+FROM t_hdfs_dn_metrics_snap s,
+JSON_TABLE(JSON_KEYS(s.metrics), '$[*]' COLUMNS (metricname varchar(128) PATH '$')) k;
+
+CREATE VIEW t_yarn_rm_metrics AS
+SELECT s.id, s.rmnode, s.modelerType, k.metricname, CAST(JSON_EXTRACT(s.metrics, CONCAT('$."', k.metricname, '"')) AS DOUBLE) AS numvalue, s.collection_ts
+FROM t_yarn_rm_metrics_snap s,
+JSON_TABLE(JSON_KEYS(s.metrics), '$[*]' COLUMNS (metricname varchar(128) PATH '$')) k;
+
+CREATE VIEW t_yarn_nm_metrics AS
+SELECT s.id, s.nmnode, s.modelerType, k.metricname, CAST(JSON_EXTRACT(s.metrics, CONCAT('$."', k.metricname, '"')) AS DOUBLE) AS numvalue, s.collection_ts
+FROM t_yarn_nm_metrics_snap s,
+JSON_TABLE(JSON_KEYS(s.metrics), '$[*]' COLUMNS (metricname varchar(128) PATH '$')) k;
+
+CREATE VIEW t_hmaster_metrics AS
+SELECT s.id, s.masternode, s.is_active, s.modelerType, k.metricname, CAST(JSON_EXTRACT(s.metrics, CONCAT('$."', k.metricname, '"')) AS DOUBLE) AS numvalue, s.collection_ts
+FROM t_hmaster_metrics_snap s,
+JSON_TABLE(JSON_KEYS(s.metrics), '$[*]' COLUMNS (metricname varchar(128) PATH '$')) k;
+
+CREATE VIEW t_hbase_rs_metrics AS
+SELECT s.id, s.rsnode, s.modelerType, k.metricname, CAST(JSON_EXTRACT(s.metrics, CONCAT('$."', k.metricname, '"')) AS DOUBLE) AS numvalue, s.collection_ts
+FROM t_hbase_rs_metrics_snap s,
+JSON_TABLE(JSON_KEYS(s.metrics), '$[*]' COLUMNS (metricname varchar(128) PATH '$')) k;
+
+CREATE VIEW t_hive_metrics AS
+SELECT s.id, s.hs2node, s.modelerType, k.metricname, CAST(JSON_EXTRACT(s.metrics, CONCAT('$."', k.metricname, '"')) AS DOUBLE) AS numvalue, s.collection_ts
+FROM t_hive_metrics_snap s,
+JSON_TABLE(JSON_KEYS(s.metrics), '$[*]' COLUMNS (metricname varchar(128) PATH '$')) k;
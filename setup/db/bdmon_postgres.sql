@@ -7,6 +7,7 @@ CREATE TABLE t_coll_metrics
   modelerType  varchar(64),
   mtypename  varchar(64),
   is_active char(1) default 'N',
+  counters varchar(1024),
   CONSTRAINT t_coll_metrics_pkey PRIMARY KEY (id),
   CONSTRAINT cons_coll_metrics_uniq UNIQUE(appname, appcomponent, modelerType, mtypename)
 );
@@ -175,6 +176,18 @@ Create table t_spark_apps
 Create index ind_sprk_app_ts on t_spark_apps(start_ts);
 
 
+-- Start time of the last application captured, per Spark History Server
+Create table t_spark_watermark
+(
+  id serial NOT NULL,
+  shshost varchar(64),
+  last_start_ts timestamp without time zone,
+  last_start_ts_str varchar(64),
+  updated_ts timestamp without time zone,
+  CONSTRAINT t_sprk_wmark_pkey PRIMARY KEY (id),
+  CONSTRAINT cons_spark_wmark_uniq UNIQUE (shshost)
+);
+
 Create table t_spark_executors
 (
   id serial NOT NULL,
@@ -209,3 +222,79 @@ Create table t_bdmon_metrics
   CONSTRAINT t_bdmon_pkey PRIMARY KEY (id)
 );
 Create index ind_bdmon_ts on t_bdmon_metrics(collection_ts);
+
+Create table t_rollup_1m
+(
+  id serial NOT NULL,
+  srctbl varchar(32),
+  hostnode varchar(64),
+  modelerType varchar(64),
+  metricname varchar(64),
+  minvalue    float,
+  maxvalue    float,
+  avgvalue    float,
+  lastvalue    float,
+  cnt integer,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_rollup_1m_pkey PRIMARY KEY (id)
+);
+Create index ind_rollup_1m_ts on t_rollup_1m(collection_ts);
+Create index ind_rollup_1m_hn on t_rollup_1m(srctbl, hostnode, collection_ts);
+
+Create table t_rollup_1h
+(
+  id serial NOT NULL,
+  srctbl varchar(32),
+  hostnode varchar(64),
+  modelerType varchar(64),
+  metricname varchar(64),
+  minvalue    float,
+  maxvalue    float,
+  avgvalue    float,
+  lastvalue    float,
+  cnt integer,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_rollup_1h_pkey PRIMARY KEY (id)
+);
+Create index ind_rollup_1h_ts on t_rollup_1h(collection_ts);
+Create index ind_rollup_1h_hn on t_rollup_1h(srctbl, hostnode, collection_ts);
+
+Create table t_rollup_1d
+(
+  id serial NOT NULL,
+  srctbl varchar(32),
+  hostnode varchar(64),
+  modelerType varchar(64),
+  metricname varchar(64),
+  minvalue    float,
+  maxvalue    float,
+  avgvalue    float,
+  lastvalue    float,
+  cnt integer,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_rollup_1d_pkey PRIMARY KEY (id)
+);
+Create index ind_rollup_1d_ts on t_rollup_1d(collection_ts);
+Create index ind_rollup_1d_hn on t_rollup_1d(srctbl, hostnode, collection_ts);
+
+Create table t_rollup_watermark
+(
+  id serial NOT NULL,
+  srctbl varchar(32),
+  rlevel varchar(8),
+  last_ts timestamp without time zone,
+  updated_ts timestamp without time zone,
+  CONSTRAINT t_rollup_wmark_pkey PRIMARY KEY (id),
+  CONSTRAINT cons_rollup_wmark_uniq UNIQUE (srctbl, rlevel)
+);
+
+Create table t_spool_segments
+(
+  id serial NOT NULL,
+  segment_id varchar(128),
+  bdmonhost varchar(256),
+  rowcnt integer,
+  replayed_ts timestamp without time zone,
+  CONSTRAINT t_spool_segments_pkey PRIMARY KEY (id),
+  CONSTRAINT cons_spool_segments_uniq UNIQUE (segment_id)
+);
@@ -0,0 +1,186 @@
+-- Time partitioned metrics tables, PostgreSQL 11 or later
+-- Execute after bdmon_postgres.sql on a new database, the metrics tables are recreated partitioned
+-- by range of collection_ts. Rows outside the created partitions go to the <table>_pdefault partition.
+-- Partitions are created ahead and dropped once expired by bdutils.dbmaint.maintain_db, see [RETENTION]
+DROP TABLE t_node_metrics;
+DROP TABLE t_hdfs_nn_metrics;
+DROP TABLE t_hdfs_dn_metrics;
+DROP TABLE t_yarn_rm_metrics;
+DROP TABLE t_yarn_nm_metrics;
+DROP TABLE t_hmaster_metrics;
+DROP TABLE t_hbase_rs_metrics;
+DROP TABLE t_hbase_tbl_metrics;
+DROP TABLE t_hive_metrics;
+DROP TABLE t_zk_conn_metrics;
+DROP TABLE t_zk_metrics;
+DROP TABLE t_bdmon_metrics;
+
+CREATE TABLE t_node_metrics
+(
+  id serial NOT NULL,
+  hostnode varchar(64),
+  appname   varchar(16),
+  appcomponent varchar(16),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_host_app_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_node_metrics_pdefault PARTITION OF t_node_metrics DEFAULT;
+Create index ind_node_ts_hn on t_node_metrics(collection_ts, hostnode);
+Create index ind_node_anc_mt on t_node_metrics(appname, appcomponent);
+
+CREATE TABLE t_hdfs_nn_metrics
+(
+  id serial NOT NULL,
+  namenode varchar(64),
+  is_active    char(1) default 'N',
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_hdfs_nn_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_hdfs_nn_metrics_pdefault PARTITION OF t_hdfs_nn_metrics DEFAULT;
+Create index ind_t_hdfs_nn_ts on t_hdfs_nn_metrics(collection_ts);
+Create index ind_t_hdfs_mt_ts on t_hdfs_nn_metrics(modelerType);
+
+CREATE TABLE t_hdfs_dn_metrics
+(
+  id serial NOT NULL,
+  datanode varchar(64),
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_hdfs_dn_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_hdfs_dn_metrics_pdefault PARTITION OF t_hdfs_dn_metrics DEFAULT;
+Create index ind_hdfs_dn_ts on t_hdfs_dn_metrics(collection_ts);
+Create index ind_hdfs_mt_ts on t_hdfs_dn_metrics(modelerType);
+
+CREATE TABLE t_yarn_rm_metrics
+(
+  id serial NOT NULL,
+  rmnode varchar(64),
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_yarn_rm_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_yarn_rm_metrics_pdefault PARTITION OF t_yarn_rm_metrics DEFAULT;
+Create index ind_t_yarn_rm_ts on t_yarn_rm_metrics(collection_ts);
+Create index ind_t_yarn_mt_ts on t_yarn_rm_metrics(modelerType);
+
+CREATE TABLE t_yarn_nm_metrics
+(
+  id serial NOT NULL,
+  nmnode varchar(64),
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_yarn_nm_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_yarn_nm_metrics_pdefault PARTITION OF t_yarn_nm_metrics DEFAULT;
+Create index ind_yarn_nm_ts on t_yarn_nm_metrics(collection_ts);
+Create index ind_yarn_mt_ts on t_yarn_nm_metrics(modelerType);
+
+CREATE TABLE t_hmaster_metrics
+(
+  id serial NOT NULL,
+  masternode varchar(64),
+  is_active    char(1) default 'N',
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_hmaster_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_hmaster_metrics_pdefault PARTITION OF t_hmaster_metrics DEFAULT;
+Create index ind_hmaster_ts on t_hmaster_metrics(collection_ts);
+Create index ind_hmaster_mt on t_hmaster_metrics(modelerType);
+
+CREATE TABLE t_hbase_rs_metrics
+(
+  id serial NOT NULL,
+  rsnode varchar(64),
+  modelerType varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_hbase_rs_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_hbase_rs_metrics_pdefault PARTITION OF t_hbase_rs_metrics DEFAULT;
+Create index ind_hbase_rs_ts on t_hbase_rs_metrics(collection_ts);
+Create index ind_hbase_rs_mt on t_hbase_rs_metrics(modelerType);
+
+CREATE TABLE t_hbase_tbl_metrics
+(
+  id serial NOT NULL,
+  namespace varchar(64),
+  tblname   varchar(64),
+  regionid   varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_hbase_tbl_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_hbase_tbl_metrics_pdefault PARTITION OF t_hbase_tbl_metrics DEFAULT;
+Create index ind_hbase_tbl_tbl_mn on t_hbase_tbl_metrics(tblname, metricname);
+Create index ind_hbase_tbl_tbl_ts on t_hbase_tbl_metrics(collection_ts);
+
+CREATE TABLE t_hive_metrics
+(
+  id serial NOT NULL,
+  hs2node varchar(64),
+  modelerType varchar(64),
+  metricname varchar(128),
+  numvalue    float,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_hive_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_hive_metrics_pdefault PARTITION OF t_hive_metrics DEFAULT;
+Create index ind_hive_ts on t_hive_metrics(collection_ts);
+Create index ind_hive_mt on t_hive_metrics(modelerType);
+
+CREATE TABLE t_zk_conn_metrics
+(
+  id serial NOT NULL,
+  zknode varchar(64),
+  client_hostnode varchar(64),
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_zk_conn_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_zk_conn_metrics_pdefault PARTITION OF t_zk_conn_metrics DEFAULT;
+Create index ind_zk_conn_ts on t_zk_conn_metrics(collection_ts);
+Create index ind_zk_conn_ts_hn on t_zk_conn_metrics(collection_ts, zknode);
+
+CREATE TABLE t_zk_metrics
+(
+  id serial NOT NULL,
+  zknode varchar(64),
+  zk_mode char(1) default 's',
+  metricname varchar(64),
+  numvalue    float,
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_zk_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_zk_metrics_pdefault PARTITION OF t_zk_metrics DEFAULT;
+Create index ind_zk_hst_mn on t_zk_metrics(zknode, metricname);
+Create index ind_zk_ts on t_zk_metrics(collection_ts);
+
+CREATE TABLE t_bdmon_metrics
+(
+  id serial NOT NULL,
+  bdmonhost varchar(64),
+  metricname varchar(64),
+  numvalue    float, 
+  collection_ts timestamp without time zone,
+  CONSTRAINT t_bdmon_pkey PRIMARY KEY (id, collection_ts)
+) PARTITION BY RANGE (collection_ts);
+CREATE TABLE t_bdmon_metrics_pdefault PARTITION OF t_bdmon_metrics DEFAULT;
+Create index ind_bdmon_ts on t_bdmon_metrics(collection_ts);
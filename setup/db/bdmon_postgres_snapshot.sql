@@ -0,0 +1,149 @@
+-- Bean snapshot storage, [STORAGE] layout = snapshot in bdmon.ini
+-- Execute after bdmon_postgres.sql on a new database, each bean is stored as one row
+-- with its numeric attributes in the metrics JSON column, instead of a row per attribute.
+-- The metrics tables are replaced by views of the same name and columns, for the grafana dashboards
+DROP TABLE t_node_metrics;
+DROP TABLE t_hdfs_nn_metrics;
+DROP TABLE t_hdfs_dn_metrics;
+DROP TABLE t_yarn_rm_metrics;
+DROP TABLE t_yarn_nm_metrics;
+DROP TABLE t_hmaster_metrics;
+DROP TABLE t_hbase_rs_metrics;
+DROP TABLE t_hive_metrics;
+
+CREATE TABLE t_node_metrics_snap
+(
+  id serial NOT NULL,
+  hostnode varchar(64),
+  appname varchar(16),
+  appcomponent varchar(16),
+  collection_ts timestamp without time zone,
+  metrics jsonb,
+  CONSTRAINT t_node_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_node_snap_ts on t_node_metrics_snap(collection_ts, hostnode);
+
+CREATE TABLE t_hdfs_nn_metrics_snap
+(
+  id serial NOT NULL,
+  namenode varchar(64),
+  is_active character(1) default 'N',
+  modelerType varchar(64),
+  collection_ts timestamp without time zone,
+  metrics jsonb,
+  CONSTRAINT t_hdfs_nn_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_hdfs_nn_snap_ts on t_hdfs_nn_metrics_snap(collection_ts, namenode);
+Create index ind_hdfs_nn_snap_mt on t_hdfs_nn_metrics_snap(modelerType);
+Create index ind_hdfs_nn_snap_heap on t_hdfs_nn_metrics_snap(namenode, ((metrics->>'MemHeapUsedM')::float)) where modelerType = 'JvmMetrics';
+
+CREATE TABLE t_hdfs_dn_metrics_snap
+(
+  id serial NOT NULL,
+  datanode varchar(64),
+  modelerType varchar(64),
+  collection_ts timestamp without time zone,
+  metrics jsonb,
+  CONSTRAINT t_hdfs_dn_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_hdfs_dn_snap_ts on t_hdfs_dn_metrics_snap(collection_ts, datanode);
+Create index ind_hdfs_dn_snap_mt on t_hdfs_dn_metrics_snap(modelerType);
+Create index ind_hdfs_dn_snap_heap on t_hdfs_dn_metrics_snap(datanode, ((metrics->>'MemHeapUsedM')::float)) where modelerType = 'JvmMetrics';
+
+CREATE TABLE t_yarn_rm_metrics_snap
+(
+  id serial NOT NULL,
+  rmnode varchar(64),
+  modelerType varchar(64),
+  collection_ts timestamp without time zone,
+  metrics jsonb,
+  CONSTRAINT t_yarn_rm_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_yarn_rm_snap_ts on t_yarn_rm_metrics_snap(collection_ts, rmnode);
+Create index ind_yarn_rm_snap_mt on t_yarn_rm_metrics_snap(modelerType);
+Create index ind_yarn_rm_snap_heap on t_yarn_rm_metrics_snap(rmnode, ((metrics->>'MemHeapUsedM')::float)) where modelerType = 'JvmMetrics';
+
+CREATE TABLE t_yarn_nm_metrics_snap
+(
+  id serial NOT NULL,
+  nmnode varchar(64),
+  modelerType varchar(64),
+  collection_ts timestamp without time zone,
+  metrics jsonb,
+  CONSTRAINT t_yarn_nm_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_yarn_nm_snap_ts on t_yarn_nm_metrics_snap(collection_ts, nmnode);
+Create index ind_yarn_nm_snap_mt on t_yarn_nm_metrics_snap(modelerType);
+Create index ind_yarn_nm_snap_heap on t_yarn_nm_metrics_snap(nmnode, ((metrics->>'MemHeapUsedM')::float)) where modelerType = 'JvmMetrics';
+
+CREATE TABLE t_hmaster_metrics_snap
+(
+  id serial NOT NULL,
+  masternode varchar(64),
+  is_active character(1) default 'N',
+  modelerType varchar(64),
+  collection_ts timestamp without time zone,
+  metrics jsonb,
+  CONSTRAINT t_hmaster_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_hmaster_snap_ts on t_hmaster_metrics_snap(collection_ts, masternode);
+Create index ind_hmaster_snap_mt on t_hmaster_metrics_snap(modelerType);
+Create index ind_hmaster_snap_heap on t_hmaster_metrics_snap(masternode, ((metrics->>'MemHeapUsedM')::float)) where modelerType = 'JvmMetrics';
+
+CREATE TABLE t_hbase_rs_metrics_snap
+(
+  id serial NOT NULL,
+  rsnode varchar(64),
+  modelerType varchar(64),
+  collection_ts timestamp without time zone,
+  metrics jsonb,
+  CONSTRAINT t_hbase_rs_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_hbase_rs_snap_ts on t_hbase_rs_metrics_snap(collection_ts, rsnode);
+Create index ind_hbase_rs_snap_mt on t_hbase_rs_metrics_snap(modelerType);
+Create index ind_hbase_rs_snap_heap on t_hbase_rs_metrics_snap(rsnode, ((metrics->>'MemHeapUsedM')::float)) where modelerType = 'JvmMetrics';
+
+CREATE TABLE t_hive_metrics_snap
+(
+  id serial NOT NULL,
+  hs2node varchar(64),
+  modelerType varchar(64),
+  collection_ts timestamp without time zone,
+  metrics jsonb,
+  CONSTRAINT t_hive_snap_pkey PRIMARY KEY (id)
+);
+Create index ind_hive_snap_ts on t_hive_metrics_snap(collection_ts, hs2node);
+Create index ind_hive_snap_mt on t_hive_metrics_snap(modelerType);
+Create index ind_hive_snap_heap on t_hive_metrics_snap(hs2node, ((metrics->>'MemHeapUsedM')::float)) where modelerType = 'JvmMetrics';
+
+CREATE VIEW t_node_metrics AS
+SELECT s.id, s.hostnode, s.appname, s.appcomponent, j.key AS metricname, j.value::float AS numvalue, s.collection_ts
+FROM t_node_metrics_snap s, jsonb_each_text(s.metrics) j;
+
+CREATE VIEW t_hdfs_nn_metrics AS
+SELECT s.id, s.namenode, s.is_active, s.modelerType, j.key AS metricname, j.value::float AS numvalue, s.collection_ts
+FROM t_hdfs_nn_metrics_snap s, jsonb_each_text(s.metrics) j;
+
+CREATE VIEW t_hdfs_dn_metrics AS
+SELECT s.id, s.datanode, s.modelerType, j.key AS metricname, j.value::float AS numvalue, s.collection_ts
+FROM t_hdfs_dn_metrics_snap s, jsonb_each_text(s.metrics) j;
+
+CREATE VIEW t_yarn_rm_metrics AS
+SELECT s.id, s.rmnode, s.modelerType, j.key AS metricname, j.value::float AS numvalue, s.collection_ts
+FROM t_yarn_rm_metrics_snap s, jsonb_each_text(s.metrics) j;
+
+CREATE VIEW t_yarn_nm_metrics AS
+SELECT s.id, s.nmnode, s.modelerType, j.key AS metricname, j.value::float AS numvalue, s.collection_ts
+FROM t_yarn_nm_metrics_snap s, jsonb_each_text(s.metrics) j;
+
+CREATE VIEW t_hmaster_metrics AS
+SELECT s.id, s.masternode, s.is_active, s.modelerType, j.key AS metricname, j.value::float AS numvalue, s.collection_ts
+FROM t_hmaster_metrics_snap s, jsonb_each_text(s.metrics) j;
+
+CREATE VIEW t_hbase_rs_metrics AS
+SELECT s.id, s.rsnode, s.modelerType, j.key AS metricname, j.value::float AS numvalue, s.collection_ts
+FROM t_hbase_rs_metrics_snap s, jsonb_each_text(s.metrics) j;
+
+CREATE VIEW t_hive_metrics AS
+SELECT s.id, s.hs2node, s.modelerType, j.key AS metricname, j.value::float AS numvalue, s.collection_ts
+FROM t_hive_metrics_snap s, jsonb_each_text(s.metrics) j;
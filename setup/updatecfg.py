@@ -136,7 +136,7 @@ def upd_cfg():
         lgr.info('SQLite DB Connection ready')
         bdmon_tbls = {'t_coll_metrics': '''create table t_coll_metrics
                                         (appname text, appcomponent text,
-                                        modelerType  text, mtypename  text, is_active text)
+                                        modelerType  text, mtypename  text, is_active text, counters text)
                                         ''',
                       't_node_metrics': '''create table t_node_metrics
                                         (hostnode text, appname   text, appcomponent text,
@@ -186,6 +186,10 @@ def upd_cfg():
                                         (shshost text, app_id text, appname text,
                                          start_ts text, sparkuser text, start_ts_str text, time_taken real)
                                         ''',
+                      't_spark_watermark': '''create table t_spark_watermark
+                                        (shshost text unique, last_start_ts text,
+                                         last_start_ts_str text, updated_ts text)
+                                        ''',
                       't_spark_executors': '''create table t_spark_executors
                                         (app_id text, sprkhost text,
                                          metricname text, numvalue real, execution_ts text)
@@ -197,6 +201,29 @@ def upd_cfg():
                       't_bdmon_metrics': '''create table t_bdmon_metrics
                                         (bdmonhost text,
                                          metricname text, numvalue real, collection_ts text)
+                                        ''',
+                      't_rollup_1m': '''create table t_rollup_1m
+                                        (srctbl text, hostnode text, modelerType text, metricname text,
+                                         minvalue real, maxvalue real, avgvalue real, lastvalue real,
+                                         cnt integer, collection_ts text)
+                                        ''',
+                      't_rollup_1h': '''create table t_rollup_1h
+                                        (srctbl text, hostnode text, modelerType text, metricname text,
+                                         minvalue real, maxvalue real, avgvalue real, lastvalue real,
+                                         cnt integer, collection_ts text)
+                                        ''',
+                      't_rollup_1d': '''create table t_rollup_1d
+                                        (srctbl text, hostnode text, modelerType text, metricname text,
+                                         minvalue real, maxvalue real, avgvalue real, lastvalue real,
+                                         cnt integer, collection_ts text)
+                                        ''',
+                      't_rollup_watermark': '''create table t_rollup_watermark
+                                        (srctbl text, rlevel text, last_ts text, updated_ts text,
+                                         unique (srctbl, rlevel))
+                                        ''',
+                      't_spool_segments': '''create table t_spool_segments
+                                        (segment_id text, bdmonhost text, rowcnt integer, replayed_ts text,
+                                         unique (segment_id))
                                         '''
                       }
         for tbl, stmt in bdmon_tbls.items():
@@ -310,6 +337,14 @@ def upd_cfg():
                       ('hive', 'hs2', 'com.codahale.metrics.JmxReporter$JmxTimer', 'metrics:name=api_TezSubmitToRunningDag', 'N'),
                       ('hive', 'hs2', 'com.codahale.metrics.JmxReporter$JmxTimer', 'metrics:name=api_RemoveTempOrDuplicateFiles', 'N')]
         dbo.execstmt()
+        #Counters i.e. monotonic attributes, also stored as per second rates <attribute>PerSec
+        dbo.stmt = "update t_coll_metrics set counters = ? where modelerType like ?"
+        for values in (('GcCount*,GcTimeMillis*', 'JvmMetrics'),
+                       ('RpcProcessingTimeNumOps,RpcQueueTimeNumOps,ReceivedBytes,SentBytes', 'RpcActivityFor%'),
+                       ('BytesRead,BytesWritten,BlocksRead,BlocksWritten', 'DataNodeActivity-'),
+                       ('*-Collection,*-CollectionTime', 'sun.management.GarbageCollectorImpl')):
+            dbo.values = values
+            dbo.execstmt()
         dbo.commitclose()
         print("SQLite Database setup complete")
         print("\n** Make sure to update the configuration file for each service before capturing metrics **")
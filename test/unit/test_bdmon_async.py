@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; asyncio collection engine tests
+"""
+import sys
+from os import path
+import unittest
+from unittest import mock
+import logging
+import threading
+import asyncio
+from time import sleep
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.bdengine import _BDMAsyncProcess
+
+class TestAsync(unittest.TestCase):
+    """ Unit test for the asyncio engine, the GETs bounded as the thread pool engine"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        #Event loop of the caller, e.g. an application embedding bdmon
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.getmtrx = _BDMAsyncProcess(self.lgr, mock.Mock(), {}, inflight=8)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.maxrunning = 0
+
+    def tearDown(self):
+        self.getmtrx.close()
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def _fetch(self, key, app_host_port, uripath=None, qrys=None, keep=None):
+        """ A GET taking some time, the GETs running counted """
+        with self.lock:
+            self.running += 1
+            self.maxrunning = max(self.maxrunning, self.running)
+        sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return (key, {'uri': uripath}, None)
+
+    def test_workers(self):
+        """ At most workers GETs at a time, all the results yielded """
+        reqs = [(idx, 'dn%d:9864' % idx, '/jmx') for idx in range(6)]
+        with mock.patch.object(self.getmtrx, '_fetch', self._fetch):
+            results = list(self.getmtrx._fetch_many(reqs, 2))
+            self.assertEqual(sorted(key for key, _, _ in results), list(range(6)))
+            self.assertEqual(self.maxrunning, 2)
+            self.maxrunning = 0
+            list(self.getmtrx._fetch_many(reqs, 6))
+            self.assertGreater(self.maxrunning, 2)
+
+    def test_event_loop(self):
+        """ The event loop of the thread is left as is, before and after close """
+        self.assertIs(asyncio.get_event_loop(), self.loop)
+        self.getmtrx.close()
+        self.assertIs(asyncio.get_event_loop(), self.loop)
+        self.assertFalse(self.loop.is_closed())
+        self.getmtrx = mock.Mock()
+
+if __name__ == '__main__':
+    unittest.main()
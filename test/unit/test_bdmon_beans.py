@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; streamed jmx response parsing tests
+"""
+import sys
+from os import path
+import unittest
+import json
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.bdengine import _iter_beans, _BDMProcess
+
+_BEANS = [{"name": "Hadoop:service=NameNode,name=JvmMetrics", "modelerType": "JvmMetrics", "GcCount": 5},
+          {"name": "Hadoop:service=NameNode,name=NameNodeInfo", "modelerType": "NameNodeInfo",
+           "LiveNodes": "{\"dn1:1\":{\"infoAddr\":\"dn1:50075\"}}", "Tags": ["a", "b]"]},
+          {"name": "q", "modelerType": "Q\\\"uoted{", "Text": "end\\", "Nested": {"x": [1, {"y": "}"}]}},
+          {"name": "u", "modelerType": "été", "Value": 1.5}]
+
+def _chunks(text, size):
+    """ Text split in chunks of size characters """
+    return [text[pos:pos + size] for pos in range(0, len(text), size)]
+
+
+class _Response():
+    """ Streamed response of the requests library, bytes chunks """
+    def __init__(self, text, size, encoding='utf-8'):
+        self.encoding = encoding
+        self._data = text.encode('utf-8')
+        self._size = size
+
+    def iter_content(self, _):
+        return iter(_chunks(self._data, self._size))
+
+
+class TestBeans(unittest.TestCase):
+    """ Unit test for the jmx responses read one bean at a time"""
+    def setUp(self):
+        self.text = json.dumps({"beans": _BEANS}, ensure_ascii=False)
+
+    def test_iter_beans(self):
+        """ The beans are split whatever the chunk boundaries, escaped characters included """
+        for size in (1, 2, 3, 7, 64, len(self.text)):
+            beans = [json.loads(raw) for raw in _iter_beans(_chunks(self.text, size))]
+            self.assertEqual(beans, _BEANS, 'chunk size %d' % size)
+
+    def test_iter_beans_truncated(self):
+        """ A truncated response is an error, the beans before it are yielded """
+        beans = []
+        with self.assertRaises(ValueError):
+            for raw in _iter_beans(_chunks(self.text[:-30], 5)):
+                beans.append(json.loads(raw))
+        self.assertEqual(beans, _BEANS[:3])
+        with self.assertRaises(ValueError):
+            list(_iter_beans(_chunks('{"beans" : [{"name": "x\\"}]}', 4)))
+        with self.assertRaises(ValueError):
+            list(_iter_beans([]))
+
+    def test_read_beans(self):
+        """ Only the beans kept are decoded, by their modelerType unescaped """
+        mtypes = []
+        def keep(mtype, raw):
+            mtypes.append(mtype)
+            return mtype != 'JvmMetrics'
+        for size in (1, 5, 65536):
+            mtypes.clear()
+            dct = _BDMProcess._read_beans(None, _Response(self.text, size), keep)
+            self.assertEqual(dct, {"beans": _BEANS[1:]})
+            self.assertEqual(mtypes, ['JvmMetrics', 'NameNodeInfo', 'Q\\"uoted{', 'été'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; config parsing tests
+"""
+import sys
+from os import path
+import unittest
+import logging
+import tempfile
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils import coreutils
+
+class TestConfig(unittest.TestCase):
+    """ Unit test for the config sections, an invalid option keeps its default"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cfg = coreutils._CFG
+
+    def tearDown(self):
+        coreutils._CFG = self.cfg
+        self.tmpdir.cleanup()
+
+    def _config(self, text):
+        """ Use a config file of the text """
+        cfgfl = path.join(self.tmpdir.name, 'bdmon.ini')
+        with open(cfgfl, 'w') as fle:
+            fle.write(text)
+        coreutils._CFG = coreutils._ConfigSnapshot(cfgfl)
+
+    def test_hdfs_invalid(self):
+        """ An invalid dnworkers is logged, the options after it are kept """
+        self._config('[HDFS]\ndnworkers = four\nuripath = /jmx2\ndatanodes = dn1,dn2\n')
+        with self.assertLogs(self.lgr, 'WARNING') as logs:
+            hdfs = coreutils.gethdfsdetails(self.lgr)
+        self.assertEqual(hdfs["dnworkers"], 1)
+        self.assertEqual(hdfs["uripath"], '/jmx2')
+        self.assertEqual(hdfs["datanodes"], 'dn1,dn2')
+        self.assertIn('dnworkers = four', logs.output[0])
+
+    def test_yarn_valid(self):
+        """ A valid nmworkers is kept """
+        self._config('[YARN]\nnmworkers = 0\nnmport = 8043\n')
+        yarn = coreutils.getyarndetails(self.lgr)
+        self.assertEqual((yarn["nmworkers"], yarn["nmport"]), (1, '8043'))
+
+    def test_spark_invalid(self):
+        """ An invalid appworkers or maxapps keeps its default """
+        self._config('[SPARK]\nappworkers = 4x\nmaxapps = -\nmtrxdate = 2020-01-01\n')
+        with self.assertLogs(self.lgr, 'WARNING') as logs:
+            spk = coreutils.getsparkdetails(self.lgr)
+        self.assertEqual((spk["appworkers"], spk["maxapps"]), (1, 0))
+        self.assertEqual(spk["mtrxdate"], '2020-01-01')
+        self.assertEqual(len(logs.output), 2)
+
+    def test_engine_invalid(self):
+        """ An invalid timeout or backoff keeps its default, the engine mode is kept """
+        self._config('[ENGINE]\ntimeout = 1,5\nbackoff = 5x\nmaxbackoff = 10m\nmode = async\n')
+        with self.assertLogs(self.lgr, 'WARNING'):
+            eng = coreutils.getenginedetails(self.lgr)
+        self.assertEqual((eng["timeout"], eng["backoff"]), (1.0, 30))
+        self.assertEqual((eng["maxbackoff"], eng["mode"]), (600, 'async'))
+
+    def test_storage_invalid(self):
+        """ An invalid batchrows keeps its default, the storage options after it are kept """
+        self._config('[STORAGE]\nbatchrows = 5k\nwriters = 2\nlayout = normalized\n')
+        with self.assertLogs(self.lgr, 'WARNING'):
+            strg = coreutils.getstoragedetails(self.lgr)
+        self.assertEqual((strg["batchrows"], strg["writers"]), (5000, 2))
+        self.assertEqual(strg["layout"], 'normalized')
+
+    def test_schedule_invalid(self):
+        """ An invalid app interval is the interval of the other apps """
+        self._config('[SCHEDULE]\nhdfs = 5min\ninterval = 2m\nyarn = 30s\n')
+        with self.assertLogs(self.lgr, 'WARNING'):
+            sched = coreutils.getscheduledetails(self.lgr)
+        self.assertEqual(sched, {'interval':120, 'hdfs':120, 'yarn':30})
+
+    def test_retention_invalid(self):
+        """ An invalid table retention is the default retention """
+        self._config('[RETENTION]\nt_node_metrics = 7d\ndefault = 30\nt_zk_metrics = 5\nperiod = month\n')
+        with self.assertLogs(self.lgr, 'WARNING'):
+            rtn = coreutils.getretentiondetails(self.lgr)
+        self.assertEqual(rtn["tables"], {'t_node_metrics':30, 't_zk_metrics':5})
+        self.assertEqual(rtn["period"], 'month')
+
+    def test_rollup_invalid(self):
+        """ An invalid lag keeps its default, the tables are kept """
+        self._config('[ROLLUP]\nlag = 2 hours\ntables = t_zk_metrics, t_node_metrics\n')
+        with self.assertLogs(self.lgr, 'WARNING'):
+            rlp = coreutils.getrollupdetails(self.lgr)
+        self.assertEqual(rlp, {'lag':120, 'tables':['t_zk_metrics', 't_node_metrics']})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; counter rates tests
+"""
+import sys
+from os import path
+import unittest
+import logging
+import tempfile
+from datetime import datetime, timedelta
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.dbops import RowBatch
+from bdutils.bdengine import _CounterRates, _counterpattern
+
+_GCTYPE = 'sun.management.GarbageCollectorImpl'
+
+class TestCounterRates(unittest.TestCase):
+    """ Unit test for the per second rates of the counters"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cltime = datetime(2020, 1, 1)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _rates(self, counters, mtype, pattern, mode='both'):
+        """ Counter rates of an app, the patterns seeded in the counters column """
+        return _CounterRates(self.lgr, path.join(self.tmpdir.name, 'counters.json'),
+                             {counters:[(mtype, _counterpattern(pattern))]}, mode)
+
+    def _hive_gc(self, cnt, msecs, tdelta):
+        """ HS2 rows of a GarbageCollector bean, named as the hive collection does """
+        batch = RowBatch(('hs2node1',), self.cltime + timedelta(seconds=tdelta), 2)
+        batch.add(_GCTYPE, 'G1YoungGeneration-Collection', cnt)
+        batch.add(_GCTYPE, 'G1YoungGeneration-CollectionTime', msecs)
+        batch.add(_GCTYPE, 'G1YoungGeneration', 1)
+        return batch
+
+    def test_hive_gc_rates(self):
+        """ Two samples of the seeded hive GarbageCollector counters give PerSec rates """
+        crts = self._rates(('hive', 'hs2'), _GCTYPE, '*-Collection,*-CollectionTime')
+        rows = crts.rates('hive_hs2', self._hive_gc(10, 500, 0), ('hive', 'hs2'), 1, 2)
+        self.assertEqual(len(rows), 3)
+        crts.commit()
+        rows = crts.rates('hive_hs2', self._hive_gc(30, 1500, 10), ('hive', 'hs2'), 1, 2)
+        self.assertIsInstance(rows, RowBatch)
+        rates = {row[2]:row[3] for row in rows if row[2].endswith('PerSec')}
+        self.assertEqual(rates, {'G1YoungGeneration-CollectionPerSec':2.0,
+                                 'G1YoungGeneration-CollectionTimePerSec':100.0})
+        self.assertEqual(len(rows), 5)
+
+    def _jvm(self, gccount, tdelta, crts):
+        """ Rates of a NameNode JvmMetrics sample, committed """
+        rows = [('nn1', 'Y', 'JvmMetrics', 'GcCount', gccount, self.cltime + timedelta(seconds=tdelta)),
+                ('nn1', 'Y', 'JvmMetrics', 'MemHeapUsedM', 10.0, self.cltime + timedelta(seconds=tdelta))]
+        rows = crts.rates('hdfs_namenode', rows, ('hdfs', 'namenode'), 2, 3)
+        crts.commit()
+        return [(row[3], row[4]) for row in rows]
+
+    def test_reset(self):
+        """ A counter lower than its previous sample was reset, it is counted from 0 """
+        crts = self._rates(('hdfs', 'namenode'), 'JvmMetrics', 'GcCount*')
+        self.assertEqual(self._jvm(100, 0, crts), [('GcCount', 100), ('MemHeapUsedM', 10.0)])
+        self.assertEqual(self._jvm(160, 30, crts),
+                         [('GcCount', 160), ('GcCountPerSec', 2.0), ('MemHeapUsedM', 10.0)])
+        self.assertEqual(self._jvm(20, 40, crts),
+                         [('GcCount', 20), ('GcCountPerSec', 2.0), ('MemHeapUsedM', 10.0)])
+        self.assertEqual(crts.stats(), {'counterResets':1})
+
+    def test_rate_mode(self):
+        """ In rate mode the counter rows are replaced by their rates, a sample not newer is skipped """
+        crts = self._rates(('hdfs', 'namenode'), 'JvmMetrics', 'GcCount*', 'rate')
+        self.assertEqual(self._jvm(100, 0, crts), [('MemHeapUsedM', 10.0)])
+        self.assertEqual(self._jvm(110, 0, crts), [('MemHeapUsedM', 10.0)])
+        self.assertEqual(self._jvm(130, 10, crts), [('GcCountPerSec', 2.0), ('MemHeapUsedM', 10.0)])
+
+    def test_discard(self):
+        """ The samples of rows rolled back are not the previous samples """
+        crts = self._rates(('hdfs', 'namenode'), 'JvmMetrics', 'GcCount*')
+        self._jvm(100, 0, crts)
+        rows = [('nn1', 'Y', 'JvmMetrics', 'GcCount', 900, self.cltime + timedelta(seconds=5))]
+        crts.rates('hdfs_namenode', rows, ('hdfs', 'namenode'), 2, 3)
+        crts.discard()
+        self.assertEqual(self._jvm(200, 10, crts)[1], ('GcCountPerSec', 10.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -95,6 +95,9 @@ class TestSetup(unittest.TestCase):
         self.dbo.stmt = "Select shshost, app_id, appname, start_ts, start_ts_str,sparkuser, time_taken from t_spark_apps"
         self.dbo.execstmt()
         self.assertIsNotNone(self.dbo.crsr)
+        self.dbo.stmt = "Select shshost, last_start_ts, last_start_ts_str, updated_ts from t_spark_watermark"
+        self.dbo.execstmt()
+        self.assertIsNotNone(self.dbo.crsr)
         self.dbo.stmt = "Select app_id, sprkhost, metricname, numvalue, execution_ts from t_spark_executors"
         self.dbo.execstmt()
         self.assertIsNotNone(self.dbo.crsr)
@@ -102,6 +105,49 @@ class TestSetup(unittest.TestCase):
         self.dbo.execstmt()
         self.assertIsNotNone(self.dbo.crsr)
 
+    def test_normalized_tbls(self):
+        """ Checks the normalized storage tables exists, if configured """
+        if getstoragedetails(self.lgr)["layout"] != 'normalized':
+            self.skipTest("Storage layout is not normalized")
+        self.lgr.critical("Checking normalized storage tables")
+        self.dbo.stmt = "Select id, hostname from t_hosts"
+        self.dbo.execstmt()
+        self.assertIsNotNone(self.dbo.crsr)
+        self.dbo.stmt = "Select id, modelerType, metricname from t_metric_names"
+        self.dbo.execstmt()
+        self.assertIsNotNone(self.dbo.crsr)
+
+    def test_snapshot_tbls(self):
+        """ Checks the bean snapshot storage tables exists, if configured """
+        if getstoragedetails(self.lgr)["layout"] != 'snapshot':
+            self.skipTest("Storage layout is not snapshot")
+        self.lgr.critical("Checking bean snapshot storage tables")
+        self.dbo.stmt = "Select hostnode, appname, appcomponent, collection_ts, metrics from t_node_metrics_snap"
+        self.dbo.execstmt()
+        self.assertIsNotNone(self.dbo.crsr)
+        self.dbo.stmt = "Select datanode, modelerType, collection_ts, metrics from t_hdfs_dn_metrics_snap"
+        self.dbo.execstmt()
+        self.assertIsNotNone(self.dbo.crsr)
+
+    def test_rollup_tbls(self):
+        """ Checks the rollup tables exists """
+        self.lgr.critical("Checking rollup tables")
+        for tbl in ('t_rollup_1m', 't_rollup_1h', 't_rollup_1d'):
+            self.dbo.stmt = ("Select srctbl, hostnode, modelerType, metricname, minvalue, maxvalue, "
+                             "avgvalue, lastvalue, cnt, collection_ts from %s" % tbl)
+            self.dbo.execstmt()
+            self.assertIsNotNone(self.dbo.crsr)
+        self.dbo.stmt = "Select srctbl, rlevel, last_ts, updated_ts from t_rollup_watermark"
+        self.dbo.execstmt()
+        self.assertIsNotNone(self.dbo.crsr)
+
+    def test_spool_tbls(self):
+        """ Checks the spool replay table exists """
+        self.lgr.critical("Checking spool replay table")
+        self.dbo.stmt = "Select segment_id, bdmonhost, rowcnt, replayed_ts from t_spool_segments"
+        self.dbo.execstmt()
+        self.assertIsNotNone(self.dbo.crsr)
+
     def test_bdmon_tbls(self):
         """ Checks self metrics collection tables exists """
         self.lgr.critical("Checking bdmon metrics collection tables")
@@ -112,7 +158,7 @@ class TestSetup(unittest.TestCase):
 if __name__ == '__main__':
     #Get to the base directory by traversing 3 times
     sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
-    from bdutils.coreutils import getlgr
+    from bdutils.coreutils import getlgr, getstoragedetails
     from bdutils.dbops import DbOps
 
     unittest.main()
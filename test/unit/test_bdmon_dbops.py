@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; DbOps insert tests with a SQLite database file
+"""
+import sys
+from os import path
+import unittest
+import logging
+import tempfile
+import sqlite3
+from datetime import datetime
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.coreutils import BDMonException
+from bdutils.dbops import DbOps, _DBVALUESPARAMS, _rowsize
+
+_STMT = ('insert into t_node_metrics (hostnode, appname, appcomponent, metricname, numvalue, collection_ts) '
+         'values(?, ?, ?, ?, ?, ?)')
+
+class _Cursor():
+    """ Cursor recording the statements run, the statements without parameters as is
+    execute fails with the error set for the inserts after skip inserts, errors times (-1: always) """
+    def __init__(self, crsr):
+        self._crsr = crsr
+        self.error = None
+        self.skip = 0
+        self.errors = -1
+        self.calls = []
+
+    def execute(self, stmt, params=()):
+        self.calls.append(('execute', len(params)) if params else (stmt,))
+        if self.error is not None and self.errors and stmt.startswith('insert'):
+            if self.skip:
+                self.skip -= 1
+                return self._crsr.execute(stmt, params)
+            self.errors -= 1
+            raise self.error
+        return self._crsr.execute(stmt, params)
+
+    def executemany(self, stmt, rows):
+        rows = list(rows)
+        self.calls.append(('executemany', len(rows)))
+        return self._crsr.executemany(stmt, rows)
+
+    def __getattr__(self, name):
+        return getattr(self._crsr, name)
+
+
+class TestDbOps(unittest.TestCase):
+    """ Unit test for the DbOps inserts"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dbfile = dbfile = path.join(self.tmpdir.name, 'bdmon.sqlite')
+        dbcn = sqlite3.connect(dbfile)
+        dbcn.execute('create table t_node_metrics (hostnode text, appname text, appcomponent text, '
+                     'metricname text, numvalue real, collection_ts timestamp)')
+        dbcn.close()
+        self.dbo = DbOps(self.lgr, 'driver={SQLite};server=' + dbfile)
+        self.dbo.crsr = _Cursor(self.dbo.crsr)
+
+    def tearDown(self):
+        self.dbo.close()
+        self.tmpdir.cleanup()
+
+    def _rows(self, cnt):
+        """ Insert rows of t_node_metrics """
+        cltime = datetime.now()
+        return [('host%d' % idx, 'hdfs', 'datanode', 'metric', idx, cltime) for idx in range(cnt)]
+
+    def _count(self):
+        """ Rows inserted """
+        self.dbo.stmt = 'select count(*) from t_node_metrics'
+        self.dbo.values = ''
+        self.dbo.execstmt()
+        return self.dbo.crsr.fetchall()[0][0]
+
+    def test_values_chunks(self):
+        """ Multi-row inserts stay below the SQL Server parameter and row limits """
+        self.dbo._bulkload = 'values'
+        self.dbo._valuesparams = _DBVALUESPARAMS['sql server']
+        self.assertEqual(self.dbo._valueschunk('(?, ?, ?, ?, ?, ?)'), 349)
+        self.assertEqual(self.dbo._valueschunk('(?)'), 1000)
+        self.dbo.stmt = _STMT
+        self.dbo.values = self._rows(349 * 2 + 1)
+        self.dbo.execstmt()
+        self.assertEqual(self.dbo.crsr.calls, [('execute', 349 * 6), ('execute', 349 * 6), ('execute', 6)])
+        self.assertEqual(self._count(), 349 * 2 + 1)
+
+    def test_values_fallback(self):
+        """ A multi-row insert failing is inserted with executemany, then the statement too """
+        self.dbo._bulkload = 'values'
+        self.dbo.crsr.error = sqlite3.OperationalError('too many SQL variables')
+        self.dbo.stmt = _STMT
+        self.dbo.values = self._rows(10)
+        self.dbo.execstmt()
+        self.dbo.values = self._rows(5)
+        self.dbo.execstmt()
+        self.assertEqual(self.dbo.crsr.calls, [('execute', 60), ('executemany', 10), ('executemany', 5)])
+        self.dbo.crsr.error = None
+        self.assertEqual(self._count(), 15)
+
+    def test_values_dataerror(self):
+        """ A data error is raised, the statement is still inserted with multi-row inserts """
+        self.dbo._bulkload = 'values'
+        self.dbo.crsr.error = sqlite3.IntegrityError('UNIQUE constraint failed: t_node_metrics.hostnode')
+        self.dbo.crsr.errors = 1
+        self.dbo.stmt = _STMT
+        self.dbo.values = self._rows(10)
+        self.assertRaises(BDMonException, self.dbo.execstmt)
+        self.dbo.values = self._rows(5)
+        self.dbo.execstmt()
+        self.assertEqual(self.dbo.crsr.calls, [('execute', 60), ('execute', 30)])
+        self.assertEqual(self.dbo._valuesfail, set())
+
+    def test_values_savepoint(self):
+        """ Multi-row inserts in a savepoint, rolled back before the executemany of the rows not inserted """
+        self.dbo._bulkload = 'values'
+        self.dbo._savepoint = True
+        self.dbo._valuesparams = 30
+        self.dbo.crsr.execute('begin')
+        self.dbo.crsr.error = sqlite3.OperationalError('too many SQL variables')
+        self.dbo.crsr.skip = 1
+        self.dbo.stmt = _STMT
+        self.dbo.values = self._rows(8)
+        self.dbo.execstmt()
+        self.assertEqual(self.dbo.crsr.calls[1:], [('savepoint bdmon_values',), ('execute', 30),
+                                                   ('release savepoint bdmon_values',),
+                                                   ('savepoint bdmon_values',), ('execute', 18),
+                                                   ('rollback to savepoint bdmon_values',), ('executemany', 3)])
+        self.dbo.commit()
+        self.assertEqual(self._committed(), 8)
+
+    def test_values_dbdown(self):
+        """ A database unavailable is raised, without executemany """
+        self.dbo._bulkload = 'values'
+        self.dbo.crsr.error = sqlite3.OperationalError('database is locked')
+        self.dbo.stmt = _STMT
+        self.dbo.values = self._rows(10)
+        self.assertRaises(BDMonException, self.dbo.execstmt)
+        self.assertEqual(self.dbo.crsr.calls, [('execute', 60)])
+
+    def _committed(self):
+        """ Rows committed, read with another connection """
+        dbcn = sqlite3.connect(self.dbfile)
+        try:
+            return dbcn.execute('select count(*) from t_node_metrics').fetchone()[0]
+        finally:
+            dbcn.close()
+
+    def _buffer(self, rows):
+        """ Buffer insert rows """
+        self.dbo.stmt = _STMT
+        self.dbo.values = rows
+        self.dbo.bufferstmt()
+
+    def test_batchrows(self):
+        """ The buffered rows are committed once batchrows is reached """
+        self.dbo._batchrows = 10
+        self._buffer(self._rows(6))
+        self.assertEqual(self._committed(), 0)
+        self._buffer(self._rows(4))
+        self.assertEqual(self._committed(), 10)
+        self._buffer(self._rows(3))
+        self.assertEqual(self._committed(), 10)
+        self.assertTrue(self.dbo.flush())
+        self.assertEqual(self._committed(), 13)
+        self.assertEqual(self.dbo.stats, {'dbFlushes':2, 'dbRowsWritten':13})
+        #The statement of the caller is kept
+        self.assertEqual(self.dbo.stmt, _STMT)
+
+    def test_batchbytes(self):
+        """ The buffered rows are committed once batchbytes is reached """
+        rows = self._rows(5)
+        self.dbo._batchbytes = sum(_rowsize(row) for row in rows) + 1
+        self._buffer(rows)
+        self.assertEqual(self._committed(), 0)
+        self._buffer(self._rows(1))
+        self.assertEqual(self._committed(), 6)
+
+    def test_rollback(self):
+        """ The rows buffered are dropped by a rollback, flush writes nothing """
+        self._buffer(self._rows(5))
+        self.dbo.rollback()
+        self.assertTrue(self.dbo.flush())
+        self.assertEqual(self._committed(), 0)
+        self.assertEqual(self.dbo.stats, {'dbFlushes':0, 'dbRowsWritten':0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; thread pool engine requests tests
+"""
+import sys
+from os import path
+import unittest
+from unittest import mock
+import logging
+import threading
+from time import sleep
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.bdengine import _BDMProcess
+
+class TestFetch(unittest.TestCase):
+    """ Unit test for the GETs run by a thread pool"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.getmtrx = _BDMProcess(self.lgr, mock.Mock(), {})
+        self.lock = threading.Lock()
+        self.fetched = []
+
+    def tearDown(self):
+        self.getmtrx.close()
+
+    def _fetch(self, key, app_host_port, uripath=None, qrys=None, keep=None):
+        """ A GET taking some time """
+        sleep(0.05)
+        with self.lock:
+            self.fetched.append(key)
+        return (key, {'uri': uripath}, None)
+
+    def test_all(self):
+        """ All the results are yielded """
+        reqs = [(idx, 'dn%d:9864' % idx, '/jmx') for idx in range(6)]
+        with mock.patch.object(self.getmtrx, '_fetch', self._fetch):
+            results = list(self.getmtrx._fetch_many(reqs, 2))
+        self.assertEqual(sorted(key for key, _, _ in results), list(range(6)))
+
+    def test_stopped(self):
+        """ The requests not started are cancelled once the consumer stops """
+        reqs = [(idx, 'dn%d:9864' % idx, '/jmx') for idx in range(40)]
+        with mock.patch.object(self.getmtrx, '_fetch', self._fetch):
+            gen = self.getmtrx._fetch_many(reqs, 2)
+            next(gen)
+            gen.close()
+        #The requests running when stopped are completed
+        self.assertLessEqual(len(self.fetched), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; endpoints circuit breaker tests
+"""
+import sys
+from os import path
+import unittest
+from unittest import mock
+import logging
+import tempfile
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.bdengine import _HostHealth
+
+_HOST = 'dn1:50075'
+
+class TestHostHealth(unittest.TestCase):
+    """ Unit test for the endpoints skipped after a failure, with an exponential backoff"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.now = 1000.0
+        self.epoch = 1500000000.0
+        for name, clock in (('monotonic', lambda: self.now), ('time', lambda: self.epoch + self.now)):
+            patcher = mock.patch('bdutils.bdengine.' + name, clock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.health = _HostHealth(self.lgr, timeout=1.0, maxtimeout=5.0, backoff=30, maxbackoff=100)
+
+    def test_breaker(self):
+        """ A failed endpoint is skipped until its backoff expires, then probed once """
+        self.assertTrue(self.health.allow(_HOST))
+        self.health.failure(_HOST)
+        self.assertFalse(self.health.allow(_HOST))
+        self.now += 29
+        self.assertFalse(self.health.allow(_HOST))
+        self.now += 1
+        self.assertTrue(self.health.allow(_HOST))
+        #The probe is in progress
+        self.assertFalse(self.health.allow(_HOST))
+        self.health.success(_HOST, 0.01)
+        self.assertTrue(self.health.allow(_HOST))
+        self.assertTrue(self.health.allow(_HOST))
+        self.assertEqual(self.health.mtrx, {'hostsSkipped':3, 'hostsProbed':1})
+        self.assertTrue(self.health.allow('dn2:50075'))
+
+    def test_backoff(self):
+        """ The backoff doubles on each consecutive failure, up to maxbackoff """
+        waits = []
+        for _ in range(4):
+            self.health.failure(_HOST)
+            start = self.now
+            while not self.health.allow(_HOST):
+                self.now += 1
+            waits.append(self.now - start)
+        self.assertEqual(waits, [30, 60, 100, 100])
+
+    def test_timeouts(self):
+        """ The timeouts follow the latencies of the endpoint, within timeout and maxtimeout """
+        self.assertEqual(self.health.timeouts(_HOST), (1.0, 1.0))
+        for _ in range(10):
+            self.health.success(_HOST, 0.1)
+        conn, read = self.health.timeouts(_HOST)
+        self.assertAlmostEqual(conn, 0.3)
+        self.assertEqual(read, 0.5)
+        self.health.success(_HOST, 3.0)
+        self.assertEqual(self.health.timeouts(_HOST)[1], 5.0)
+
+    def test_release(self):
+        """ A probe ended by an unexpected error is made again """
+        self.health.failure(_HOST)
+        self.now += 30
+        self.assertTrue(self.health.allow(_HOST))
+        self.health.release(_HOST)
+        self.assertTrue(self.health.allow(_HOST))
+        self.assertEqual(self.health.mtrx, {'hostsSkipped':0, 'hostsProbed':2})
+
+    def test_persisted(self):
+        """ The failed endpoints are skipped by the next runs until their backoff expires """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            hpath = path.join(tmpdir, 'hosthealth.json')
+            health = _HostHealth(self.lgr, backoff=30, maxbackoff=100, path=hpath)
+            health.failure(_HOST)
+            health.failure('dn2:50075')
+            health.success('dn2:50075', 0.01)
+            health.close()
+            #Next run, another process: its monotonic clock differs
+            self.now = 10.0
+            self.epoch += 1000.0 - 10.0 + 20
+            health = _HostHealth(self.lgr, backoff=30, maxbackoff=100, path=hpath)
+            self.assertFalse(health.allow(_HOST))
+            self.assertTrue(health.allow('dn2:50075'))
+            self.now += 10
+            self.assertTrue(health.allow(_HOST))
+            health.failure(_HOST)
+            self.now += 59
+            self.assertFalse(health.allow(_HOST))
+            self.now += 1
+            self.assertTrue(health.allow(_HOST))
+
+if __name__ == '__main__':
+    unittest.main()
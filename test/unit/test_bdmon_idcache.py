@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; normalized storage ids tests with a SQLite database file
+"""
+import sys
+from os import path
+import unittest
+from unittest import mock
+import logging
+import tempfile
+import sqlite3
+from datetime import datetime
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.dbops import DbOps
+from bdutils.bdengine import _IdCache
+
+class TestIdCache(unittest.TestCase):
+    """ Unit test for the host and metric names replaced with their ids"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dbfile = path.join(self.tmpdir.name, 'bdmon.sqlite')
+        dbcn = sqlite3.connect(self.dbfile)
+        dbcn.execute('create table t_hosts (id integer primary key, hostname text, unique (hostname))')
+        dbcn.execute('create table t_metric_names (id integer primary key, modelerType text, '
+                     'metricname text, unique (modelerType, metricname))')
+        dbcn.execute("insert into t_hosts (id, hostname) values(7, 'dn1')")
+        dbcn.commit()
+        dbcn.close()
+        self.cltime = datetime(2020, 1, 1)
+        self.cache = self._cache()
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def _cache(self):
+        """ _IdCache on the database file """
+        with mock.patch('bdutils.bdengine.DbOps',
+                        lambda lgr: DbOps(lgr, 'driver={SQLite};server=' + self.dbfile)):
+            return _IdCache(self.lgr)
+
+    def _query(self, stmt):
+        """ Rows committed, read with another connection """
+        dbcn = sqlite3.connect(self.dbfile)
+        try:
+            return dbcn.execute(stmt).fetchall()
+        finally:
+            dbcn.close()
+
+    def test_encode(self):
+        """ The names are replaced with their ids, the modelerType column is dropped """
+        rows = [('dn1', 'N', 'JvmMetrics', 'GcCount', 5, self.cltime),
+                ('dn2', 'N', 'JvmMetrics', 'GcCount', 6, self.cltime),
+                ('dn1', 'N', 'JvmMetrics', 'MemHeapUsedM', 10.5, self.cltime)]
+        encoded = self.cache.encode(rows, 0, 2, 3)
+        self.assertEqual(encoded, [(7, 'N', 1, 5, self.cltime), (8, 'N', 1, 6, self.cltime),
+                                   (7, 'N', 2, 10.5, self.cltime)])
+        self.assertEqual(self.cache.stats(), {'dimIdsAdded':3})
+        self.assertEqual(self.cache.stats(), {'dimIdsAdded':0})
+        self.assertEqual(self._query('select id, modelerType, metricname from t_metric_names order by id'),
+                         [(1, 'JvmMetrics', 'GcCount'), (2, 'JvmMetrics', 'MemHeapUsedM')])
+
+    def test_no_modelertype(self):
+        """ Rows without a modelerType column use an empty modelerType """
+        self.assertEqual(self.cache.encode([('zk1', 'latency', 1.0, self.cltime)], 0, None, 1),
+                         [(8, 1, 1.0, self.cltime)])
+        self.assertEqual(self._query('select modelerType, metricname from t_metric_names'), [('', 'latency')])
+
+    def test_added_meanwhile(self):
+        """ A name inserted by another bdmon process gets the id of the database """
+        self.cache.encode([('dn1', 'load', 1.0, self.cltime)], 0, None, 1)
+        other = self._cache()
+        try:
+            self.assertEqual(other.encode([('dn9', 'load', 1.0, self.cltime)], 0, None, 1),
+                             [(8, 1, 1.0, self.cltime)])
+            self.assertEqual(self.cache.encode([('dn9', 'load', 2.0, self.cltime)], 0, None, 1),
+                             [(8, 1, 2.0, self.cltime)])
+        finally:
+            other.close()
+        self.assertEqual(self._query('select count(*) from t_hosts'), [(2,)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; JMX servlet queries tests
+"""
+import sys
+from os import path
+import unittest
+from unittest import mock
+import logging
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.bdengine import _jmx_query, _MtrxMatcher, _BDMProcess
+
+_LIVENODES = 'Hadoop:service=NameNode,name=NameNodeInfo::LiveNodes'
+
+class TestJmxQuery(unittest.TestCase):
+    """ Unit test for the beans to collect fetched with ?qry= and ?get= queries"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        dct = {'hdfs': {'datanode': _MtrxMatcher([('JvmMetrics', ''), ('sun.management.O', ''),
+                                                  ('JvmMetrics', 'Hadoop:service=DataNode,name=JvmMetrics')]),
+                        'namenode': _MtrxMatcher([('FSNamesystem', ''), ('org.apache.Foo', '')])}}
+        self.getmtrx = _BDMProcess(self.lgr, mock.Mock(), dct)
+        self.getmtrx._jmxqry = True
+
+    def tearDown(self):
+        self.getmtrx.close()
+
+    def test_jmx_query(self):
+        """ The t_coll_metrics prefixes are translated to ObjectName patterns """
+        self.assertEqual(_jmx_query('JvmMetrics'), ('Hadoop:name=JvmMetrics*,*',))
+        self.assertEqual(_jmx_query('RegionServer,sub=Regions'), ('Hadoop:name=RegionServer,sub=Regions*,*',))
+        self.assertEqual(_jmx_query('QueueMetrics,'), ('Hadoop:name=QueueMetrics,*',))
+        self.assertEqual(_jmx_query('sun.management.O'), ('java.lang:type=OperatingSystem',))
+        self.assertEqual(_jmx_query('sun.management.GarbageCollectorImpl'),
+                         ('java.lang:type=GarbageCollector,*',))
+        self.assertEqual(_jmx_query('x', 'java.lang:type=GarbageCollector'),
+                         ('java.lang:type=GarbageCollector*,*',))
+
+    def test_jmx_query_none(self):
+        """ The beans that cannot be selected with a pattern are fetched with all the beans """
+        for mtype in ('', 'org.apache.Foo', 'a,b,c', 'RegionServer,Regions', 'bad/chars'):
+            self.assertIsNone(_jmx_query(mtype), mtype)
+
+    def test_jmx_queries(self):
+        """ A ?qry= URL per pattern, a ?get= URL per attribute, computed once per app component """
+        qrys = self.getmtrx._jmx_queries('hdfs', 'datanode', (_LIVENODES,))
+        self.assertEqual(qrys, ['/jmx?qry=Hadoop:name=JvmMetrics*,*',
+                                '/jmx?qry=Hadoop:service=DataNode,name=JvmMetrics*,*',
+                                '/jmx?get=Hadoop:service=NameNode,name=NameNodeInfo::LiveNodes',
+                                '/jmx?qry=java.lang:type=OperatingSystem'])
+        self.assertIs(self.getmtrx._jmx_queries('hdfs', 'datanode', (_LIVENODES,)), qrys)
+        self.assertEqual(len(self.getmtrx._jmx_queries('hdfs', 'datanode')), 3)
+
+    def test_jmx_queries_all(self):
+        """ All the beans are fetched when a bean has no pattern, or the queries are disabled """
+        self.assertIsNone(self.getmtrx._jmx_queries('hdfs', 'namenode'))
+        self.getmtrx._jmxqry = False
+        self.assertIsNone(self.getmtrx._jmx_queries('hdfs', 'datanode'))
+
+    def test_get_beans(self):
+        """ The beans of the queries are merged by name, in the order fetched """
+        resps = {'/jmx?qry=a': {"beans": [{"name": "JvmMetrics", "GcCount": 1},
+                                          {"name": "NameNodeInfo", "Total": 10}]},
+                 '/jmx?get=b': {"beans": [{"name": "NameNodeInfo", "LiveNodes": "{}"}]},
+                 '/jmx?qry=c': {}}
+        getmtrx = mock.Mock(side_effect=lambda node, uripath, keep: resps[uripath])
+        with mock.patch.object(self.getmtrx, '_get_metrics', getmtrx):
+            dct = self.getmtrx._get_beans('dn1:9864', ['/jmx?qry=a', '/jmx?get=b', '/jmx?qry=c'])
+        self.assertEqual(dct, {"beans": [{"name": "JvmMetrics", "GcCount": 1},
+                                         {"name": "NameNodeInfo", "Total": 10, "LiveNodes": "{}"}]})
+
+    def test_get_beans_all(self):
+        """ Without queries, all the beans are fetched with a single GET """
+        keep = mock.Mock()
+        getmtrx = mock.Mock(return_value={"beans": []})
+        with mock.patch.object(self.getmtrx, '_get_metrics', getmtrx):
+            self.assertEqual(self.getmtrx._get_beans('dn1:9864', None, keep), {"beans": []})
+        getmtrx.assert_called_once_with('dn1:9864', None, keep)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; last values tests, kept once the rows are committed
+"""
+import sys
+from os import path
+import unittest
+from unittest import mock
+import logging
+import tempfile
+from datetime import datetime
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.coreutils import BDMonException
+from bdutils.dbops import RowBatch
+from bdutils.bdengine import _Deadband, _DbWriters, _collect_apps
+
+_STMT = 'insert into t_node_metrics values(?, ?, ?, ?, ?, ?)'
+
+class _Dbo():
+    """ DbOps of the tests, flush fails with the error set """
+    def __init__(self, *args):
+        self.stmt = ''
+        self.values = ''
+        self.stats = {}
+        self.error = None
+        self.rows = []
+
+    def bufferstmt(self):
+        self.rows.extend(self.values)
+
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+        return True
+
+    def rollback(self):
+        self.rows = []
+
+    def close(self):
+        pass
+
+
+class _Collector():
+    """ Collector of the tests, an hdfs row per collection """
+    def __init__(self, dbo, deadband, writers=None):
+        self.mtrx = {'error':0}
+        self._dbo = dbo
+        self._deadband = deadband
+        self._writers = writers
+
+    def get_metrics_hdfs(self):
+        rows = self._deadband.filter('host_os', [('node1', 'hdfs', 'nn', 'load', 1.0, datetime.now())])
+        if self._writers is not None:
+            self._writers.put(_STMT, rows)
+
+    def close(self):
+        pass
+
+
+class TestLastValues(unittest.TestCase):
+    """ Unit test for the last values, kept once the rows of the app are committed"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.deadband = _Deadband(self.lgr, path.join(self.tmpdir.name, 'deadband.json'))
+        self.dbo = _Dbo()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _collect(self, wdbo=None):
+        """ Collect hdfs, with a writer thread when wdbo is set """
+        writers = None
+        if wdbo is not None:
+            with mock.patch('bdutils.bdengine.DbOps', return_value=wdbo):
+                writers = _DbWriters(self.lgr, 1)
+        _collect_apps(self.lgr, self.dbo, _Collector(self.dbo, self.deadband, writers), ['hdfs'],
+                      writers, [self.deadband])
+        if writers is not None:
+            writers.close()
+
+    def test_commit(self):
+        """ The values are kept once the rows are committed """
+        self._collect()
+        self.assertEqual(len(self.deadband._last), 1)
+
+    def test_writer_commit(self):
+        """ The values are kept once the writer committed the rows """
+        self._collect(_Dbo())
+        self.assertEqual(len(self.deadband._last), 1)
+        self.assertFalse(self.deadband._pending)
+
+    def test_writer_rollback(self):
+        """ The values are dropped when the writer rolled back the rows """
+        wdbo = _Dbo()
+        wdbo.error = BDMonException('insert failed')
+        self._collect(wdbo)
+        self.assertEqual(self.deadband._last, {})
+        self.assertFalse(self.deadband._pending)
+
+    def test_spool_discarded(self):
+        """ The values are dropped when the spool discarded the rows """
+        self.dbo.flush = lambda: False
+        self._collect()
+        self.assertEqual(self.deadband._last, {})
+
+
+class TestDeadband(unittest.TestCase):
+    """ Unit test for the change-only ingestion"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = path.join(self.tmpdir.name, 'deadband.json')
+        self.deadband = _Deadband(self.lgr, self.path, tolerance=0.1, heartbeat=3)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _filter(self, value):
+        """ Values written of a metric """
+        rows = [('node1', 'hdfs', 'nn', 'load', value, datetime.now())]
+        kept = [row[4] for row in self.deadband.filter('host_os', rows)]
+        self.deadband.commit()
+        return kept
+
+    def test_tolerance(self):
+        """ A value within the tolerance of the last value written is skipped """
+        self.assertEqual([self._filter(val) for val in (10.0, 10.5, 11.0, 11.2, 9.0)],
+                         [[10.0], [], [], [11.2], [9.0]])
+        self.assertEqual(self.deadband.stats(), {'deadbandRowsSkipped':2})
+        self.assertEqual(self.deadband.stats(), {'deadbandRowsSkipped':0})
+
+    def test_heartbeat(self):
+        """ A value is written after heartbeat - 1 collections skipped """
+        self.assertEqual([self._filter(10.0) for _ in range(7)], [[10.0], [], [], [10.0], [], [], [10.0]])
+
+    def test_rowbatch(self):
+        """ A RowBatch stays a RowBatch """
+        batch = RowBatch(('node1',), datetime.now())
+        batch.add('load', 1.0)
+        batch.add('heap', 5.0)
+        self.assertEqual(len(self.deadband.filter('hdfs_datanode', batch)), 2)
+        self.deadband.commit()
+        batch.nums[1] = 6.0
+        kept = self.deadband.filter('hdfs_datanode', batch)
+        self.assertIsInstance(kept, RowBatch)
+        self.assertEqual(list(kept), list(batch)[1:])
+
+    def test_persisted(self):
+        """ The values committed are kept across the runs, the values discarded are not """
+        self._filter(10.0)
+        self.deadband.filter('host_os', [('node2', 'hdfs', 'nn', 'load', 1.0, datetime.now())])
+        self.deadband.discard()
+        self.deadband.close()
+        deadband = _Deadband(self.lgr, self.path, tolerance=0.1, heartbeat=3)
+        self.assertEqual(len(deadband._last), 1)
+        rows = [('node1', 'hdfs', 'nn', 'load', 10.0, datetime.now())]
+        self.assertEqual(deadband.filter('host_os', rows), [])
+
+if __name__ == '__main__':
+    unittest.main()
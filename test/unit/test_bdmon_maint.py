@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; metrics retention tests, the statements of each database
+"""
+import sys
+from os import path
+import unittest
+from unittest import mock
+import logging
+import tempfile
+import sqlite3
+from datetime import datetime
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.dbops import DbOps
+from bdutils.dbmaint import _getmaint, _period_end, _period_name, _PURGEROWS
+
+_NOW = datetime(2020, 1, 10, 12, 30)
+_TBL = 't_zk_metrics'
+
+class _Now(datetime):
+    """ datetime of the retention run """
+    @classmethod
+    def now(cls, tz=None):
+        return _NOW
+
+
+class _Dbo():
+    """ DbOps of a database, the statements run recorded """
+    def __init__(self, dbtype, results=None, rowcounts=()):
+        self.dbtype = dbtype
+        self.stmt = ''
+        self.values = ''
+        self.stmts = []
+        self._results = results or {}
+        self._rowcounts = list(rowcounts)
+        self.crsr = mock.Mock()
+
+    def execstmt(self):
+        self.stmts.append((self.stmt, self.values) if self.values else self.stmt)
+        self.crsr.fetchall.return_value = next((rows for key, rows in self._results.items()
+                                                if key in self.stmt), [])
+        self.crsr.rowcount = self._rowcounts.pop(0) if self._rowcounts else 0
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class TestMaint(unittest.TestCase):
+    """ Unit test for the partitions created and dropped, the expired rows deleted"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.rtn = {'default':0, 'period':'day', 'ahead':1, 'sqliteparts':'n', 'tables':{}}
+        patcher = mock.patch('bdutils.dbmaint.datetime', _Now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_periods(self):
+        """ Period names and ends, the month end across the year """
+        self.assertEqual(_period_name(datetime(2019, 1, 16), 'day'), 'p20190116')
+        self.assertEqual(_period_name(datetime(2019, 1, 1), 'month'), 'p201901')
+        self.assertEqual(_period_end(datetime(2019, 12, 31), 'day'), datetime(2020, 1, 1))
+        self.assertEqual(_period_end(datetime(2019, 12, 1), 'month'), datetime(2020, 1, 1))
+
+    def test_purge(self):
+        """ Not partitioned, the rows before the cutoff are deleted a chunk at a time """
+        dbo = _Dbo('{Other}', rowcounts=(_PURGEROWS, 5))
+        maint = _getmaint(self.lgr, dbo, self.rtn)
+        maint.maintain(_TBL, 7)
+        cutoff = datetime(2020, 1, 3, 12, 30)
+        self.assertEqual(dbo.stmts, [('delete from t_zk_metrics where collection_ts < ?', (cutoff,))] * 2)
+        self.assertEqual(maint.mtrx['rowsPurged'], _PURGEROWS + 5)
+
+    def test_keep_forever(self):
+        """ No retention, nothing deleted """
+        dbo = _Dbo('{SQLite}')
+        _getmaint(self.lgr, dbo, self.rtn).maintain(_TBL, 0)
+        self.assertEqual(dbo.stmts, [])
+
+    def test_postgresql(self):
+        """ The partitions of the upcoming periods are created, the expired ones dropped """
+        parts = [('t_zk_metrics_p20200101',), ('t_zk_metrics_p20200102',), ('t_zk_metrics_p20200110',),
+                 ('t_zk_metrics_pdefault',)]
+        dbo = _Dbo('{PostgreSQL Unicode}', {'relkind': [('p',)], 'pg_inherits': parts})
+        maint = _getmaint(self.lgr, dbo, self.rtn)
+        maint.maintain(_TBL, 8)
+        self.assertEqual(dbo.stmts[2:], [
+            "create table t_zk_metrics_p20200111 partition of t_zk_metrics "
+            "for values from ('2020-01-11 00:00:00') to ('2020-01-12 00:00:00')",
+            'drop table t_zk_metrics_p20200101',
+            ('delete from t_zk_metrics_pdefault where ctid in (select ctid from t_zk_metrics_pdefault '
+             'where collection_ts < ? limit %d)' % _PURGEROWS, (datetime(2020, 1, 2, 12, 30),))])
+        self.assertEqual((maint.mtrx['partitionsCreated'], maint.mtrx['partitionsDropped']), (1, 1))
+
+    def test_postgresql_not_partitioned(self):
+        """ A table not partitioned is purged """
+        dbo = _Dbo('{PostgreSQL Unicode}', {'relkind': [('r',)]})
+        _getmaint(self.lgr, dbo, self.rtn).maintain(_TBL, 8)
+        self.assertEqual(dbo.stmts[1][0], 'delete from t_zk_metrics where ctid in (select ctid from '
+                                          't_zk_metrics where collection_ts < ? limit %d)' % _PURGEROWS)
+
+    def test_mysql(self):
+        """ The pmax partition is split for the upcoming periods, the expired partitions dropped """
+        dbo = _Dbo('{MySQL ODBC 8.0 Unicode Driver}', {'information_schema': [('p20200101',), ('pmax',)]})
+        self.rtn["period"] = 'month'
+        maint = _getmaint(self.lgr, dbo, self.rtn)
+        maint.maintain(_TBL, 31)
+        self.assertEqual(dbo.stmts[1:], [
+            "alter table t_zk_metrics reorganize partition pmax into (partition p202001 "
+            "values less than ('2020-02-01 00:00:00'), partition pmax values less than (MAXVALUE))",
+            "alter table t_zk_metrics reorganize partition pmax into (partition p202002 "
+            "values less than ('2020-03-01 00:00:00'), partition pmax values less than (MAXVALUE))"])
+        #The partition of December 2019 ends before the cutoff
+        dbo = _Dbo('{MySQL ODBC 8.0 Unicode Driver}', {'information_schema': [('p201912',), ('p202001',),
+                                                                             ('p202002',), ('pmax',)]})
+        _getmaint(self.lgr, dbo, self.rtn).maintain(_TBL, 9)
+        self.assertEqual(dbo.stmts[1:], ['alter table t_zk_metrics drop partition p201912'])
+
+    def test_sqlserver(self):
+        """ A boundary per period, the partitions before the cutoff truncated and merged """
+        bounds = [(datetime(2020, 1, 1),), (datetime(2020, 1, 10),), (datetime(2020, 1, 11),)]
+        dbo = _Dbo('{ODBC Driver 17 for SQL Server}', {'sys.partition_functions where': [(1,)],
+                                                       'partition_range_values': bounds})
+        _getmaint(self.lgr, dbo, self.rtn).maintain(_TBL, 5)
+        ddl = [stmt for stmt in dbo.stmts if isinstance(stmt, str)]
+        self.assertEqual(ddl, ['alter partition scheme ps_t_zk_metrics next used [PRIMARY]',
+                               "alter partition function pf_t_zk_metrics() split range ('2020-01-12')",
+                               'truncate table t_zk_metrics with (partitions (1))',
+                               "alter partition function pf_t_zk_metrics() merge range ('2020-01-01')"])
+
+
+class TestLiteMaint(unittest.TestCase):
+    """ Unit test for the SQLite table per period, with a SQLite database file"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.dbfile = path.join(self.tmpdir.name, 'bdmon.sqlite')
+        dbcn = sqlite3.connect(self.dbfile)
+        dbcn.execute('create table t_zk_metrics (zknode text, metricname text, numvalue real, '
+                     'collection_ts text)')
+        dbcn.executemany('insert into t_zk_metrics values(?, ?, ?, ?)',
+                         [('zk1', 'latency', 1.0, str(datetime(2020, 1, day, 10))) for day in (1, 9, 10)])
+        dbcn.commit()
+        dbcn.close()
+        self.dbo = DbOps(self.lgr, 'driver={SQLite};server=' + self.dbfile)
+        self.addCleanup(self.dbo.close)
+        self.rtn = {'default':0, 'period':'day', 'ahead':1, 'sqliteparts':'n', 'tables':{}}
+        patcher = mock.patch('bdutils.dbmaint.datetime', _Now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _query(self, stmt):
+        """ Rows committed, read with another connection """
+        dbcn = sqlite3.connect(self.dbfile)
+        try:
+            return dbcn.execute(stmt).fetchall()
+        finally:
+            dbcn.close()
+
+    def test_purge(self):
+        """ Without the table per period, the expired rows are deleted """
+        _getmaint(self.lgr, self.dbo, self.rtn).maintain(_TBL, 5)
+        self.assertEqual(self._query('select count(*) from t_zk_metrics'), [(2,)])
+
+    def test_parts(self):
+        """ The table becomes a view, inserts are routed to the period tables, the expired ones dropped """
+        self.rtn["sqliteparts"] = 'y'
+        maint = _getmaint(self.lgr, self.dbo, self.rtn)
+        maint.maintain(_TBL, 5)
+        self.assertEqual(self._query("select name from sqlite_master where type = 'table' order by name"),
+                         [('t_zk_metrics_p20200110',), ('t_zk_metrics_p20200111',),
+                          ('t_zk_metrics_pdefault',)])
+        self.assertEqual(self._query('select count(*) from t_zk_metrics'), [(2,)])
+        self.dbo.stmt = 'insert into t_zk_metrics values(?, ?, ?, ?)'
+        self.dbo.values = [('zk1', 'latency', 2.0, str(datetime(2020, 1, 11, 1)))]
+        self.dbo.execstmt()
+        self.dbo.commit()
+        self.assertEqual(self._query('select numvalue from t_zk_metrics_p20200111'), [(2.0,)])
+        self.assertEqual(maint.mtrx['partitionsCreated'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
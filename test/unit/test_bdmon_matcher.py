@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; t_coll_metrics modelerType matching tests
+"""
+import sys
+from os import path
+import unittest
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.bdengine import _MtrxMatcher
+
+_ENTRIES = [('RpcActivityFor', None),
+            ('sun.management.O', None),
+            ('JvmMetrics', None),
+            ('com.codahale.metrics.JmxReporter$JmxTimer', 'metrics:name=api_parse'),
+            ('com.codahale.metrics.JmxReporter$JmxTimer', 'metrics:name=api_TezBuildDag'),
+            ('com.codahale.metrics.JmxReporter$', None),
+            ('', 'java.lang:type=Memory')]
+
+class TestMatcher(unittest.TestCase):
+    """ Unit test for the modelerType prefix matching"""
+    def setUp(self):
+        self.mtchr = _MtrxMatcher(_ENTRIES)
+
+    def test_prefix(self):
+        """ An entry modelerType is a prefix of the bean modelerType """
+        self.assertEqual(self.mtchr.match('RpcActivityForPort8020'), _ENTRIES[0])
+        self.assertEqual(self.mtchr.match('sun.management.OperatingSystemImpl'), _ENTRIES[1])
+        self.assertEqual(self.mtchr.match('JvmMetrics'), _ENTRIES[2])
+        self.assertIsNone(self.mtchr.match('RpcActivity', 'Hadoop:service=NameNode,name=RpcActivity'))
+        self.assertIsNone(self.mtchr.match('UgiMetrics', 'Hadoop:service=NameNode,name=UgiMetrics'))
+
+    def test_mtypename(self):
+        """ With the bean name, the entry mtypename is empty or a prefix of it, in t_coll_metrics order """
+        timer = 'com.codahale.metrics.JmxReporter$JmxTimer'
+        self.assertEqual(self.mtchr.match(timer, 'metrics:name=api_TezBuildDag'), _ENTRIES[4])
+        self.assertEqual(self.mtchr.match(timer, 'metrics:name=api_parse'), _ENTRIES[3])
+        self.assertEqual(self.mtchr.match(timer, 'metrics:name=api_runTasks'), _ENTRIES[5])
+        self.assertEqual(self.mtchr.match('sun.management.MemoryImpl', 'java.lang:type=Memory'), _ENTRIES[6])
+        self.assertIsNone(self.mtchr.match('sun.management.ThreadImpl', 'java.lang:type=Threading'))
+
+    def test_cache(self):
+        """ The candidates of a modelerType are looked up once """
+        self.mtchr.match('RpcActivityForPort8020')
+        self.mtchr._idx.clear()
+        self.assertEqual(self.mtchr.match('RpcActivityForPort8020'), _ENTRIES[0])
+        self.assertEqual(len(self.mtchr), len(_ENTRIES))
+        self.assertEqual(list(self.mtchr), _ENTRIES)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; incremental rollup tests with a SQLite database file
+"""
+import sys
+from os import path
+import unittest
+import logging
+import tempfile
+import sqlite3
+from datetime import datetime, timedelta
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.dbops import DbOps
+from bdutils.dbrollup import _Rollup, _tstamp
+
+_TBL = 't_zk_metrics'
+_WINDOW = timedelta(minutes=15)
+
+class TestRollup(unittest.TestCase):
+    """ Unit test for the rollup, each row aggregated once since the watermark"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dbfile = path.join(self.tmpdir.name, 'bdmon.sqlite')
+        dbcn = sqlite3.connect(self.dbfile)
+        dbcn.execute('create table t_zk_metrics (zknode text, metricname text, numvalue real, '
+                     'collection_ts text)')
+        for level in ('1m', '1h'):
+            dbcn.execute('create table t_rollup_%s (srctbl text, hostnode text, modelerType text, '
+                         'metricname text, minvalue real, maxvalue real, avgvalue real, lastvalue real, '
+                         'cnt integer, collection_ts text)' % level)
+        dbcn.execute('create table t_rollup_watermark (srctbl text, rlevel text, last_ts text, '
+                     'updated_ts text, unique (srctbl, rlevel))')
+        dbcn.close()
+        self.dbo = DbOps(self.lgr, 'driver={SQLite};server=' + self.dbfile)
+        self.rlu = _Rollup(self.lgr, self.dbo)
+        self.start = datetime(2020, 1, 1, 10, 0)
+
+    def tearDown(self):
+        self.dbo.close()
+        self.tmpdir.cleanup()
+
+    def _insert(self, minutes, value=1.0):
+        """ A t_zk_metrics row per second offset, minutes after the start """
+        dbcn = sqlite3.connect(self.dbfile)
+        dbcn.executemany('insert into t_zk_metrics values(?, ?, ?, ?)',
+                         [('zk1', 'latency', value + idx,
+                           self.start + timedelta(minutes=minutes, seconds=sec))
+                          for idx, sec in enumerate((0, 20, 40))])
+        dbcn.commit()
+        dbcn.close()
+
+    def _query(self, stmt):
+        """ Rows committed, read with another connection """
+        dbcn = sqlite3.connect(self.dbfile)
+        try:
+            return dbcn.execute(stmt).fetchall()
+        finally:
+            dbcn.close()
+
+    def _watermark(self, level):
+        """ Watermark saved of the table and level """
+        rows = self._query("select last_ts from t_rollup_watermark where rlevel = '%s'" % level)
+        return _tstamp(rows[0][0])
+
+    def test_nothing(self):
+        """ No rows yet, no watermark """
+        self.assertIsNone(self.rlu.rollup(_TBL, '1m', '', _WINDOW, self.start))
+        self.assertEqual(self._query('select count(*) from t_rollup_watermark'), [(0,)])
+
+    def test_watermark(self):
+        """ The complete buckets are aggregated once, the watermark moves to the first incomplete one """
+        for minute in range(3):
+            self._insert(minute)
+        cutoff = self.start + timedelta(minutes=2, seconds=30)
+        self.assertEqual(self.rlu.rollup(_TBL, '1m', '', _WINDOW, cutoff), self.start + timedelta(minutes=2))
+        self.assertEqual(self._watermark('1m'), self.start + timedelta(minutes=2))
+        self.assertEqual(self._query('select hostnode, metricname, minvalue, maxvalue, avgvalue, lastvalue, '
+                                     'cnt from t_rollup_1m order by collection_ts'),
+                         [('zk1', 'latency', 1.0, 3.0, 2.0, 3.0, 3)] * 2)
+        #Run again, nothing more is complete
+        self.rlu.rollup(_TBL, '1m', '', _WINDOW, cutoff)
+        self.assertEqual(self._query('select count(*) from t_rollup_1m'), [(2,)])
+        #The next run aggregates only the buckets after the watermark
+        self._insert(3)
+        self.assertEqual(self.rlu.rollup(_TBL, '1m', '', _WINDOW, self.start + timedelta(minutes=5)),
+                         self.start + timedelta(minutes=5))
+        self.assertEqual(self._query('select count(*), sum(cnt) from t_rollup_1m'), [(4, 12)])
+        self.assertEqual(self.rlu.mtrx, {'error':0, 'rollupRowsRead':12, 'rollupRowsWritten':4})
+
+    def test_gap(self):
+        """ The windows without rows are skipped, up to the next row collected """
+        self._insert(0)
+        self._insert(180)
+        cutoff = self.start + timedelta(hours=4)
+        self.assertEqual(self.rlu.rollup(_TBL, '1m', '', _WINDOW, cutoff), cutoff)
+        self.assertEqual(self._query('select count(*) from t_rollup_1m'), [(2,)])
+        self.assertEqual(self._watermark('1m'), cutoff)
+
+    def test_levels(self):
+        """ The 1h buckets are aggregated from the 1m buckets before the 1m watermark """
+        for minute in (0, 30, 61):
+            self._insert(minute)
+        wmark = self.rlu.rollup(_TBL, '1m', '', _WINDOW, self.start + timedelta(hours=1, minutes=5))
+        self.assertEqual(self.rlu.rollup(_TBL, '1h', '1m', timedelta(hours=6), wmark),
+                         self.start + timedelta(hours=1))
+        self.assertEqual(self._query('select minvalue, maxvalue, avgvalue, lastvalue, cnt, collection_ts '
+                                     'from t_rollup_1h'), [(1.0, 3.0, 2.0, 3.0, 6, str(self.start))])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; columnar insert rows tests
+"""
+import sys
+from os import path
+import unittest
+from datetime import datetime
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.dbops import DbOps, RowBatch, _rowsize
+
+class TestRowBatch(unittest.TestCase):
+    """ Unit test for the RowBatch rows, shared values and interned strings"""
+    def setUp(self):
+        self.cltime = datetime(2020, 1, 1)
+        self.batch = RowBatch(('nn1', 'Y'), self.cltime, 2)
+        self.batch.add('JvmMetrics', 'GcCount', 5)
+        self.batch.add('JvmMetrics', 'MemHeapUsedM', 10.5)
+
+    def test_rows(self):
+        """ The rows are the shared values, the string columns, the value and the timestamp """
+        self.assertEqual(len(self.batch), 2)
+        self.assertEqual(list(self.batch), [('nn1', 'Y', 'JvmMetrics', 'GcCount', 5.0, self.cltime),
+                                            ('nn1', 'Y', 'JvmMetrics', 'MemHeapUsedM', 10.5, self.cltime)])
+        self.assertEqual([list(col) for col in self.batch.columns()],
+                         [['nn1', 'nn1'], ['Y', 'Y'], ['JvmMetrics', 'JvmMetrics'], ['GcCount', 'MemHeapUsedM'],
+                          [5.0, 10.5], [self.cltime, self.cltime]])
+        self.assertEqual(self.batch.nbytes(), sum(_rowsize(row) for row in self.batch))
+
+    def test_interned(self):
+        """ The string values are interned, a name is stored once for all the beans """
+        name = ''.join(['Gc', 'Count'])
+        self.assertIsNot(name, self.batch.strs[1][0])
+        batch = RowBatch(('nn2',), self.cltime)
+        batch.add(name, 1)
+        self.assertIs(batch.strs[0][0], self.batch.strs[1][0])
+
+    def test_append(self):
+        """ Rows appended to an empty batch keep the shared values and timestamp of the batch """
+        kept = self.batch.empty()
+        self.assertEqual((len(kept), kept.shared, kept.tstamp), (0, ('nn1', 'Y'), self.cltime))
+        for row in self.batch:
+            if row[3] != 'GcCount':
+                kept.append(row)
+        self.assertEqual(list(kept), list(self.batch)[1:])
+
+    def test_columns(self):
+        """ The columns of the buffered batches, RowBatch and lists of rows mixed """
+        rows = [('nn1', 'N', 'FSNamesystem', 'BlocksTotal', 7, self.cltime)]
+        self.assertEqual(DbOps._columns([self.batch, rows, self.batch.empty()]),
+                         [list(col) for col in zip(*(list(self.batch) + rows))])
+
+if __name__ == '__main__':
+    unittest.main()
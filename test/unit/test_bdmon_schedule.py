@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; daemon mode stop tests
+"""
+import sys
+import os
+from os import path
+import unittest
+from unittest import mock
+import logging
+import signal
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.bdengine import _DbWriters, _schedule_metrics
+
+_STMT = 'insert into t_node_metrics values(?, ?, ?, ?, ?, ?)'
+
+class _Dbo():
+    """ DbOps of the writer, the rows committed """
+    def __init__(self, *args):
+        self.stmt = ''
+        self.values = ''
+        self.stats = {}
+        self.rows = []
+        self.committed = []
+
+    def bufferstmt(self):
+        self.rows.extend(self.values)
+
+    def flush(self):
+        self.committed.extend(self.rows)
+        self.rows = []
+        return True
+
+    def rollback(self):
+        self.rows = []
+
+    def close(self):
+        pass
+
+
+class TestSchedule(unittest.TestCase):
+    """ Unit test for the daemon stopped by SIGTERM, the queued inserts are written"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.wdbo = _Dbo()
+        with mock.patch('bdutils.bdengine.DbOps', return_value=self.wdbo):
+            self.writers = _DbWriters(self.lgr, 1)
+        self.dbo = mock.Mock()
+        self.deadband = mock.Mock()
+        self.sessions = mock.Mock()
+        self.signals = 1
+        self.runs = 0
+        patches = {'getscheduledetails': mock.Mock(return_value={'interval': 60}),
+                   '_getdbo': mock.Mock(return_value=self.dbo),
+                   '_load_mtrx': mock.Mock(return_value={}),
+                   '_getspool': mock.Mock(return_value=(None, None)),
+                   '_getwriters': mock.Mock(return_value=self.writers),
+                   '_getdims': mock.Mock(return_value=None),
+                   '_getdeadband': mock.Mock(return_value=self.deadband),
+                   '_getcounters': mock.Mock(return_value=None),
+                   '_getsessions': mock.Mock(return_value=self.sessions),
+                   '_getengine': mock.Mock(return_value=mock.Mock(mtrx={})),
+                   '_collect_apps': self._collect_apps}
+        for name, value in patches.items():
+            patcher = mock.patch('bdutils.bdengine.' + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.handler = signal.getsignal(signal.SIGTERM)
+
+    def _collect_apps(self, lgr, dbo, getmtrx, applst, writers=None, lastvals=()):
+        """ A run queuing rows to the writer, SIGTERM received during the run """
+        self.runs += 1
+        writers.put(_STMT, [('node1', 'hdfs', 'nn', 'load', 1.0, None)])
+        for _ in range(self.signals):
+            os.kill(os.getpid(), signal.SIGTERM)
+        writers.put(_STMT, [('node1', 'hdfs', 'nn', 'heap', 2.0, None)])
+        writers.endapp('hdfs')
+
+    def _closed(self):
+        """ The queued rows are written, the resources closed and the SIGTERM handler restored """
+        self.assertEqual([row[3] for row in self.wdbo.committed], ['load', 'heap'])
+        self.sessions.close.assert_called_once_with()
+        self.deadband.close.assert_called_once_with()
+        self.dbo.close.assert_called_once_with()
+        self.assertIs(signal.getsignal(signal.SIGTERM), self.handler)
+
+    def test_sigterm(self):
+        """ The run in progress is completed, then the daemon stops """
+        _schedule_metrics(self.lgr, ['hdfs'])
+        self.assertEqual(self.runs, 1)
+        self._closed()
+
+    def test_sigterm_twice(self):
+        """ A second SIGTERM interrupts the run, the app interrupted is not committed partly """
+        self.signals = 2
+        with self.assertRaises(KeyboardInterrupt):
+            _schedule_metrics(self.lgr, ['hdfs'])
+        self.assertEqual(self.wdbo.committed, [])
+        self.sessions.close.assert_called_once_with()
+        self.deadband.close.assert_called_once_with()
+        self.assertIs(signal.getsignal(signal.SIGTERM), self.handler)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; bean snapshot rows tests
+"""
+import sys
+from os import path
+import unittest
+import json
+from datetime import datetime
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.bdengine import _bean_batch, _snapshot
+
+class TestSnapshot(unittest.TestCase):
+    """ Unit test for the metric rows merged into one JSON row per bean"""
+    def setUp(self):
+        self.cltime = datetime(2020, 1, 1)
+
+    def test_snapshot(self):
+        """ A row per bean, the metrics as a JSON object; integral floats are written as integers """
+        batch = _bean_batch(('dn1', 'JvmMetrics'), {'GcCount': 5, 'MemHeapUsedM': 10.5, 'tag.Host': 'dn1'},
+                            self.cltime)
+        rows = list(batch) + [('dn1', 'RpcActivity', 'CallQueueLength', 2, self.cltime)]
+        self.assertEqual(_snapshot(rows, 2, 3),
+                         [('dn1', 'JvmMetrics', self.cltime, '{"GcCount":5,"MemHeapUsedM":10.5}'),
+                          ('dn1', 'RpcActivity', self.cltime, '{"CallQueueLength":2}')])
+
+    def test_not_finite(self):
+        """ NaN and Infinity are not collected, the JSON is valid for the databases """
+        bean = {'a': 1, 'b': float('inf'), 'c': float('-inf'), 'd': float('nan'), 'e': True}
+        batch = _bean_batch(('dn1', 'JvmMetrics'), bean, self.cltime)
+        self.assertEqual([row[2] for row in batch], ['a', 'e'])
+        rows = [('dn1', 'JvmMetrics', 'a', 1.0, self.cltime),
+                ('dn1', 'JvmMetrics', 'b', float('inf'), self.cltime),
+                ('dn1', 'JvmMetrics', 'd', float('nan'), self.cltime)]
+        snap = _snapshot(rows, 2, 3)
+        self.assertEqual(snap, [('dn1', 'JvmMetrics', self.cltime, '{"a":1}')])
+        json.loads(snap[0][-1], parse_constant=self.fail)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; Spark History Server collection tests with a SQLite database file
+"""
+import sys
+from os import path
+import unittest
+from unittest import mock
+import logging
+import tempfile
+import sqlite3
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.dbops import DbOps
+from bdutils.bdengine import _BDMProcess, _DbWriters
+
+_SPARK = {'histsrvr':'shs1:18080,shs2:18080', 'proto':'http', 'uripath':'/api/v1', 'mtrxdate':'',
+          'kerberos':'n', 'appworkers':2, 'maxapps':0}
+
+def _app(appid):
+    """ Application of the History Server applications list """
+    return {"id": appid, "name": "job" + appid,
+            "attempts": [{"startTime": "2020-01-01T10:00:0%s.000GMT" % appid[-1], "sparkUser": "etl",
+                          "duration": 10}]}
+
+
+class TestSpark(unittest.TestCase):
+    """ Unit test for the Spark applications, each captured once"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dbfile = path.join(self.tmpdir.name, 'bdmon.sqlite')
+        dbcn = sqlite3.connect(self.dbfile)
+        dbcn.execute('create table t_spark_apps (shshost text, app_id text, appname text, start_ts text, '
+                     'sparkuser text, start_ts_str text, time_taken real, unique (app_id))')
+        dbcn.execute('create table t_spark_watermark (shshost text, last_start_ts text, '
+                     'last_start_ts_str text, updated_ts text, unique (shshost))')
+        dbcn.execute('create table t_spark_executors (app_id text, sprkhost text, metricname text, '
+                     'numvalue real, execution_ts text)')
+        dbcn.execute('create table t_spark_stages (app_id text, stageid integer, metricname text, '
+                     'numvalue real, launch_ts text)')
+        dbcn.close()
+        self.dbo = self._dbo()
+        #Applications listed by each History Server, shs2 lists app2 too
+        self.apps = {'shs1:18080': [_app('app1'), _app('app2')],
+                     'shs2:18080': [_app('app2'), _app('app3')]}
+        patcher = mock.patch('bdutils.bdengine.getsparkdetails', return_value=dict(_SPARK))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.dbo.close()
+        self.tmpdir.cleanup()
+
+    def _dbo(self):
+        """ DbOps on the database file """
+        return DbOps(self.lgr, 'driver={SQLite};server=' + self.dbfile)
+
+    def _get_metrics(self, node, uripath=None, keep=None):
+        """ Responses of the History Servers """
+        if '/applications/' not in uripath:
+            return self.apps[node]
+        if uripath.endswith('/executors'):
+            return [{"hostPort": "wrk1:7337", "addTime": "2020-01-01T10:00:10.000GMT", "totalCores": 4,
+                     "memoryMetrics": {"usedOnHeapStorageMemory": 100}}]
+        return [{"stageId": 1, "attemptId": 0, "submissionTime": "2020-01-01T10:00:11.000GMT",
+                 "numTasks": 8}]
+
+    def _collect(self, writers=None):
+        """ Collect the Spark applications """
+        getmtrx = _BDMProcess(self.lgr, self.dbo, {}, writers=writers)
+        with mock.patch.object(getmtrx, '_get_metrics', self._get_metrics):
+            getmtrx.get_metrics_spark()
+        getmtrx.close()
+        return getmtrx
+
+    def _query(self, stmt):
+        """ Rows committed, read with another connection """
+        dbcn = sqlite3.connect(self.dbfile)
+        try:
+            return dbcn.execute(stmt).fetchall()
+        finally:
+            dbcn.close()
+
+    def test_overlapping_apps(self):
+        """ An application listed by two History Servers is inserted once, the app is committed """
+        self._collect()
+        self.assertTrue(self.dbo.flush())
+        self.assertEqual(self._query('select shshost, app_id from t_spark_apps order by app_id'),
+                         [('shs1', 'app1'), ('shs1', 'app2'), ('shs2', 'app3')])
+        self.assertEqual(self._query('select count(distinct app_id) from t_spark_stages'), [(3,)])
+        self.assertEqual(self._query('select shshost, last_start_ts_str from t_spark_watermark '
+                                     'order by shshost'),
+                         [('shs1', '2020-01-01T10:00:02.000GMT'), ('shs2', '2020-01-01T10:00:03.000GMT')])
+        #The next run skips the applications captured
+        self._collect()
+        self.assertTrue(self.dbo.flush())
+        self.assertEqual(self._query('select count(*) from t_spark_apps'), [(3,)])
+
+    def test_workers_pooled(self):
+        """ The concurrent GETs to the History Server are limited to the connections pooled per host """
+        getmtrx = _BDMProcess(self.lgr, self.dbo, {})
+        fetch_many = getmtrx._fetch_many
+        workers = []
+        def _fetch_many(reqs, nworkers=1):
+            workers.append(nworkers)
+            return fetch_many(reqs, nworkers)
+        sprk = dict(_SPARK, appworkers=8)
+        with mock.patch.object(getmtrx, '_get_metrics', self._get_metrics), \
+             mock.patch.object(getmtrx, '_fetch_many', _fetch_many):
+            getmtrx._get_spark_appdetails('shs1:18080', sprk, ['app1'])
+            getmtrx._sessions.poolmaxsize = 32
+            getmtrx._get_spark_appdetails('shs1:18080', sprk, ['app2'])
+        getmtrx.close()
+        self.assertEqual(workers, [4, 16])
+
+    def _collect_writers(self):
+        """ Collect the Spark applications with a writer thread, returns the committed state of the app """
+        with mock.patch('bdutils.bdengine.DbOps', lambda lgr: self._dbo()):
+            writers = _DbWriters(self.lgr, 1)
+        ended = []
+        try:
+            self._collect(writers)
+            writers.endapp('spark', ended.append)
+            writers.drain()
+        finally:
+            writers.close()
+        return ended
+
+    def test_writers_watermark(self):
+        """ The watermark is written by the writer of the application rows, committed with them """
+        self.assertEqual(self._collect_writers(), [True])
+        self.assertEqual(self._query('select count(*) from t_spark_apps'), [(3,)])
+        self.assertEqual(self._query('select count(*) from t_spark_watermark'), [(2,)])
+
+    def test_writers_rollback(self):
+        """ The watermark does not move when the writer rolled back the application rows """
+        dbcn = sqlite3.connect(self.dbfile)
+        dbcn.execute('drop table t_spark_stages')
+        dbcn.close()
+        self.assertEqual(self._collect_writers(), [False])
+        self.assertEqual(self._query('select count(*) from t_spark_apps'), [(0,)])
+        self.assertEqual(self._query('select count(*) from t_spark_watermark'), [(0,)])
+
+if __name__ == '__main__':
+    unittest.main()
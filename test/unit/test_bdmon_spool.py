@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; spool and replay tests with a SQLite database file
+"""
+import sys
+import os
+from os import path
+import unittest
+from unittest import mock
+import logging
+import threading
+import tempfile
+import shutil
+import sqlite3
+from datetime import datetime
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.dbops import DbOps
+from bdutils.dbspool import DbSpool
+from bdutils.bdengine import _DbWriters
+
+_STMT = 'insert into t_zk_metrics (zknode, metricname, numvalue, collection_ts) values(?, ?, ?, ?)'
+
+class _Dbo():
+    """ DbOps of a writer blocked until released e.g. a slow database """
+    def __init__(self, *args):
+        self.stmt = ''
+        self.values = ''
+        self.stats = {}
+        self.spool = None
+        self.release = threading.Event()
+        self.commit = True
+
+    def bufferstmt(self):
+        self.release.wait(10)
+
+    def flush(self):
+        return self.commit
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestSpool(unittest.TestCase):
+    """ Unit test for the spooled inserts, replayed once"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dbfile = path.join(self.tmpdir.name, 'bdmon.sqlite')
+        dbcn = sqlite3.connect(self.dbfile)
+        dbcn.execute('create table t_zk_metrics (zknode text, metricname text, numvalue real, collection_ts text)')
+        dbcn.execute('create table t_spool_segments (segment_id text, bdmonhost text, rowcnt integer, '
+                     'replayed_ts text, unique (segment_id))')
+        dbcn.close()
+        self.spooldir = path.join(self.tmpdir.name, 'spool')
+        self.spool = DbSpool(self.lgr, self.spooldir)
+        self.dbo = DbOps(self.lgr, 'driver={SQLite};server=' + self.dbfile)
+        self.cltime = datetime(2020, 1, 1, 10, 30, 15, 250000)
+
+    def tearDown(self):
+        self.dbo.close()
+        self.tmpdir.cleanup()
+
+    def _rows(self, cnt):
+        """ Insert rows of t_zk_metrics """
+        return [('zk1', 'metric%d' % idx, idx, self.cltime) for idx in range(cnt)]
+
+    def _query(self, stmt):
+        """ Rows committed, read with another connection """
+        dbcn = sqlite3.connect(self.dbfile)
+        try:
+            return dbcn.execute(stmt).fetchall()
+        finally:
+            dbcn.close()
+
+    def test_write_read(self):
+        """ A batch is read back as spooled, timestamps included, segments in the order spooled """
+        self.assertEqual(self.spool.write({_STMT: self._rows(3), 'empty': []}), 3)
+        self.assertEqual(self.spool.write({_STMT: self._rows(1)}), 1)
+        sgmts = self.spool.segments()
+        self.assertEqual(len(sgmts), 2)
+        sgmtid, stmts = self.spool.read(sgmts[0])
+        self.assertTrue(sgmts[0].startswith(sgmtid))
+        self.assertEqual(stmts, [(_STMT, [list(row) for row in self._rows(3)])])
+        self.assertEqual(self.spool.read(sgmts[1])[1], [(_STMT, [list(row) for row in self._rows(1)])])
+
+    def test_replay(self):
+        """ The segments are loaded and deleted, a segment loaded before is not loaded again """
+        self.spool.write({_STMT: self._rows(3)})
+        sgmt = self.spool.segments()[0]
+        shutil.copy(path.join(self.spooldir, sgmt), self.tmpdir.name)
+        self.assertEqual(self.spool.replay(self.dbo), {'spoolSegmentsReplayed':1, 'spoolRowsReplayed':3})
+        self.assertEqual(self.spool.segments(), [])
+        #e.g. the segment file was not deleted, the process stopped after the commit
+        shutil.copy(path.join(self.tmpdir.name, sgmt), self.spooldir)
+        self.assertEqual(self.spool.replay(self.dbo), {'spoolSegmentsReplayed':0, 'spoolRowsReplayed':0})
+        self.assertEqual(self.spool.segments(), [])
+        self.assertEqual(self._query('select count(*) from t_zk_metrics'), [(3,)])
+        self.assertEqual(self._query('select rowcnt from t_spool_segments'), [(3,)])
+        self.assertEqual(self._query('select min(collection_ts) from t_zk_metrics'), [(str(self.cltime),)])
+
+    def test_bad_segment(self):
+        """ A segment not readable or not loadable is renamed .bad, the next ones are loaded """
+        self.spool.write({'insert into t_missing values(?)': [(1,)]})
+        self.spool.write({_STMT: self._rows(2)})
+        with open(path.join(self.spooldir, '0-truncated.json.gz'), 'wb') as fle:
+            fle.write(b'\x1f\x8b\x08')
+        self.assertEqual(self.spool.replay(self.dbo), {'spoolSegmentsReplayed':1, 'spoolRowsReplayed':2})
+        self.assertEqual(len([fle for fle in os.listdir(self.spooldir) if fle.endswith('.bad')]), 2)
+        self.assertEqual(self._query('select count(*) from t_zk_metrics'), [(2,)])
+
+    def test_dbdown(self):
+        """ The replay stops while the database is unavailable, the segments are kept """
+        self.spool.write({_STMT: self._rows(2)})
+        self.spool.write({_STMT: self._rows(1)})
+        lock = sqlite3.connect(self.dbfile, timeout=0)
+        lock.execute('begin exclusive')
+        dbo = DbOps(self.lgr, 'driver={SQLite};server=' + self.dbfile)
+        dbo._dbcn.execute('pragma busy_timeout=0')
+        try:
+            self.assertEqual(self.spool.replay(dbo), {'spoolSegmentsReplayed':0, 'spoolRowsReplayed':0})
+        finally:
+            lock.rollback()
+            lock.close()
+        self.assertEqual(len(self.spool.segments()), 2)
+        self.assertEqual(self.spool.replay(dbo), {'spoolSegmentsReplayed':2, 'spoolRowsReplayed':3})
+        dbo.close()
+
+    def test_pending(self):
+        """ A pending segment is replayed once published, deleted when dropped """
+        self.spool.write({_STMT: self._rows(2)}, '1')
+        self.spool.write({_STMT: self._rows(1)}, '2')
+        self.assertEqual(self.spool.segments(), [])
+        self.spool.publish('1')
+        self.assertEqual(self.spool.drop('2'), 1)
+        self.assertEqual(len(os.listdir(self.spooldir)), 1)
+        self.assertEqual(self.spool.replay(self.dbo), {'spoolSegmentsReplayed':1, 'spoolRowsReplayed':2})
+
+    def test_pending_stale(self):
+        """ The pending segments of a stopped process are deleted, not of the running ones """
+        self.spool.write({_STMT: self._rows(1)}, '1')
+        sgmt = os.listdir(self.spooldir)[0]
+        os.rename(path.join(self.spooldir, sgmt),
+                  path.join(self.spooldir, sgmt.replace('.pending-%d-' % os.getpid(), '.pending-0-')))
+        self.spool.write({_STMT: self._rows(1)}, '2')
+        with mock.patch('bdutils.dbspool._alive', lambda pid: pid != 0):
+            DbSpool(self.lgr, self.spooldir)
+        self.assertEqual(len(os.listdir(self.spooldir)), 1)
+        self.spool.publish('2')
+        self.assertEqual(len(self.spool.segments()), 1)
+
+    def _writers_full(self, commit):
+        """ Rows queued to a blocked writer, the batch spooled once its queue is full """
+        wdbo = _Dbo()
+        wdbo.commit = commit
+        with mock.patch('bdutils.bdengine.DbOps', return_value=wdbo):
+            writers = _DbWriters(self.lgr, 1, queuesize=1, spool=self.spool, spoolwait=0.01)
+        ended = []
+        try:
+            writers.put(_STMT, self._rows(1))
+            #The writer is blocked on the first batch, the second fills the queue
+            while writers._queues[0].qsize():
+                wdbo.release.wait(0.01)
+            writers.put(_STMT, self._rows(1))
+            writers.put(_STMT, self._rows(3))
+            self.assertEqual(self.spool.segments(), [])
+            wdbo.release.set()
+            writers.endapp('zk', ended.append)
+            mtrx = writers.drain()
+        finally:
+            wdbo.release.set()
+            writers.close()
+        self.assertEqual(mtrx['dbRowsSpooled'], 3)
+        return ended
+
+    def test_writers_committed(self):
+        """ The rows spooled while the writer queue was full are replayed once the app is committed """
+        self.assertEqual(self._writers_full(True), [True])
+        self.assertEqual(self.spool.replay(self.dbo), {'spoolSegmentsReplayed':1, 'spoolRowsReplayed':3})
+
+    def test_writers_rolledback(self):
+        """ The rows spooled while the writer queue was full are deleted when the app is rolled back """
+        self.assertEqual(self._writers_full(False), [False])
+        self.assertEqual(os.listdir(self.spooldir), [])
+
+    def test_full(self):
+        """ A batch is discarded once the spool directory is full """
+        spool = DbSpool(self.lgr, self.spooldir, maxmb=0)
+        self.assertEqual(spool.write({_STMT: self._rows(3)}), 0)
+        self.assertEqual(spool.segments(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; DB writer threads tests with a SQLite database file
+"""
+import sys
+from os import path
+import unittest
+from unittest import mock
+import logging
+import tempfile
+import sqlite3
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.dbops import DbOps
+from bdutils.bdengine import _DbWriters
+
+_STMT_A = 'insert into t_a (host, numvalue) values(?, ?)'
+_STMT_B = 'insert into t_b (host, numvalue) values(?, ?)'
+_STMT_MISSING = 'insert into t_missing (host, numvalue) values(?, ?)'
+
+class TestWriters(unittest.TestCase):
+    """ Unit test for the rows of an app committed or rolled back together by the writers"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.dbfile = path.join(self.tmpdir.name, 'bdmon.sqlite')
+        dbcn = sqlite3.connect(self.dbfile)
+        dbcn.execute('create table t_a (host text, numvalue real)')
+        dbcn.execute('create table t_b (host text, numvalue real)')
+        dbcn.close()
+        self.ended = []
+
+    def _writers(self, writers=1, batchrows=0):
+        """ Writers on the database file, batchrows rows buffered before a write if given """
+        def dbops(lgr):
+            dbo = DbOps(lgr, 'driver={SQLite};server=' + self.dbfile)
+            if batchrows:
+                dbo._batchrows = batchrows
+            return dbo
+        with mock.patch('bdutils.bdengine.DbOps', dbops):
+            wrtrs = _DbWriters(self.lgr, writers)
+        self.addCleanup(wrtrs.close)
+        return wrtrs
+
+    def _query(self, stmt):
+        """ Rows committed, read with another connection """
+        dbcn = sqlite3.connect(self.dbfile)
+        try:
+            return dbcn.execute(stmt).fetchall()
+        finally:
+            dbcn.close()
+
+    def test_commit(self):
+        """ The rows of an app are committed at its end, done is called once for all the writers """
+        wrtrs = self._writers(2)
+        wrtrs.put(_STMT_A, [('dn1', 1.0), ('dn2', 2.0)])
+        wrtrs.put(_STMT_B, [('nn1', 3.0)])
+        wrtrs.drain()
+        self.assertEqual(self._query('select count(*) from t_a'), [(0,)])
+        wrtrs.endapp('hdfs', self.ended.append)
+        mtrx = wrtrs.drain()
+        self.assertEqual(self.ended, [True])
+        self.assertEqual(self._query('select host, numvalue from t_a order by host'),
+                         [('dn1', 1.0), ('dn2', 2.0)])
+        self.assertEqual(self._query('select host, numvalue from t_b'), [('nn1', 3.0)])
+        self.assertEqual((mtrx['error'], mtrx['dbRowsWritten']), (0, 3))
+
+    def test_failed_rows(self):
+        """ A failed write rolls back the app, its next rows are dropped, the next app is committed """
+        wrtrs = self._writers(1, 3)
+        wrtrs.put(_STMT_A, [('dn1', 1.0), ('dn2', 2.0)])
+        #The batch threshold is reached, written with the rows buffered
+        wrtrs.put(_STMT_MISSING, [('dn3', 3.0)])
+        wrtrs.put(_STMT_A, [('dn4', 4.0)])
+        wrtrs.endapp('hdfs', self.ended.append)
+        self.assertEqual(wrtrs.drain()['error'], 1)
+        self.assertEqual(self.ended, [False])
+        self.assertEqual(self._query('select count(*) from t_a'), [(0,)])
+        wrtrs.put(_STMT_A, [('dn5', 5.0)])
+        wrtrs.endapp('hdfs', self.ended.append)
+        wrtrs.drain()
+        self.assertEqual(self.ended, [False, True])
+        self.assertEqual(self._query('select host from t_a'), [('dn5',)])
+
+    def test_failed_end(self):
+        """ A failed commit is reported to done, the rows of the next app are committed """
+        wrtrs = self._writers(2)
+        wrtrs.put(_STMT_MISSING, [('dn1', 1.0)])
+        wrtrs.endapp('hdfs', self.ended.append)
+        wrtrs.drain()
+        self.assertEqual(self.ended, [False])
+        wrtrs.put(_STMT_B, [('nn1', 1.0)])
+        wrtrs.endapp('hdfs')
+        wrtrs.drain()
+        self.assertEqual(self._query('select count(*) from t_b'), [(1,)])
+
+    def test_abort(self):
+        """ The rows of an aborted app are rolled back, not those of the next app """
+        wrtrs = self._writers(1)
+        wrtrs.put(_STMT_A, [('dn1', 1.0)])
+        wrtrs.abortapp('hdfs')
+        wrtrs.put(_STMT_A, [('dn2', 2.0)])
+        wrtrs.endapp('hdfs', self.ended.append)
+        wrtrs.drain()
+        self.assertEqual(self.ended, [True])
+        self.assertEqual(self._query('select host from t_a'), [('dn2',)])
+
+if __name__ == '__main__':
+    unittest.main()
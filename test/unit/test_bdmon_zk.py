@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2018  Yogesh Rajashekharaiah
+# All Rights Reserved
+
+""" Test module for bdmon; ZooKeeper four letter words responses parsing tests
+"""
+import sys
+from os import path
+import unittest
+from unittest import mock
+import logging
+from datetime import datetime
+
+#Get to the base directory by traversing 3 times
+sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
+from bdutils.bdengine import _BDMProcess
+
+#Responses captured from ZooKeeper 3.4.14
+_STAT = ('Zookeeper version: 3.4.14-4c25d480e66aadd371de8bd2fd8da255ac140bcf, built on 03/06/2019 16:18 GMT\n'
+         'Clients:\n'
+         ' /10.0.0.5:52066[1](queued=0,recved=120,sent=121)\n'
+         ' /10.0.0.5:52070[1](queued=1,recved=30,sent=30)\n'
+         ' /0:0:0:0:0:0:0:1:40120[0](queued=0,recved=1,sent=0)\n'
+         '\n'
+         'Latency min/avg/max: 0/0.5/16\n'
+         'Received: 151\n'
+         'Sent: 151\n'
+         'Connections: 3\n'
+         'Outstanding: 0\n'
+         'Zxid: 0x10000002f\n'
+         'Mode: follower\n'
+         'Node count: 42\n')
+_MNTR = ('zk_version\t3.4.14-4c25d480e66aadd371de8bd2fd8da255ac140bcf, built on 03/06/2019 16:18 GMT\n'
+         'zk_avg_latency\t0\n'
+         'zk_max_latency\t16\n'
+         'zk_packets_received\t151\n'
+         'zk_outstanding_requests\t0\n'
+         'zk_server_state\tleader\n'
+         'zk_znode_count\t42\n'
+         'zk_followers\t2\n')
+_CONS = (' /10.0.0.5:52066[1](queued=0,recved=120,sent=121,sid=0x1000a2c3b6c0001,lop=PING,'
+         'est=1561234567890,to=30000,lcxid=0x5,lzxid=0x10000002f,lresp=1561234599000,llat=0,minlat=0,'
+         'avglat=0,maxlat=2)\n'
+         ' /10.0.0.6:41002[1](queued=0,recved=7,sent=7,sid=0x1000a2c3b6c0002,lop=GETD,'
+         'est=1561234567999,to=40000,lcxid=0x1,lzxid=0x10000002e,lresp=1561234598000,llat=1,minlat=0,'
+         'avglat=1,maxlat=3)\n'
+         '\n')
+
+class TestZooKeeper(unittest.TestCase):
+    """ Unit test for the stat, mntr and cons responses split into rows"""
+    @classmethod
+    def setUpClass(cls):
+        #No log files, the logs folder is created by the setup
+        cls.lgr = logging.getLogger('utest')
+
+    def setUp(self):
+        self.rows = {}
+        dbo = mock.Mock()
+        dbo.bufferstmt.side_effect = lambda: self.rows.setdefault(dbo.stmt.split()[2], []).extend(dbo.values)
+        self.getmtrx = _BDMProcess(self.lgr, dbo, {})
+        self.getmtrx._host = 'zk1'
+        self.cltime = datetime(2020, 1, 1)
+
+    def tearDown(self):
+        self.getmtrx.close()
+
+    def _values(self, tbl, key=2):
+        """ {metricname: numvalue} of the rows of a table """
+        return dict((row[key], row[3]) for row in self.rows.get(tbl, ()))
+
+    def test_stat(self):
+        """ The server metrics and a row per client metric and connection """
+        self.getmtrx._ins_zk_stat(_STAT, self.cltime)
+        self.assertEqual(self._values('t_zk_metrics'),
+                         {'min_latency': 0.0, 'avg_latency': 0.5, 'max_latency': 16.0, 'Received': 151.0,
+                          'Sent': 151.0, 'Connections': 3.0, 'Outstanding': 0.0, 'Node count': 42.0})
+        self.assertEqual(set(row[1] for row in self.rows['t_zk_metrics']), {'f'})
+        self.assertEqual(self.rows['t_zk_conn_metrics'][:3],
+                         [('zk1', '10.0.0.5', 'queued', 0.0, self.cltime),
+                          ('zk1', '10.0.0.5', 'recved', 120.0, self.cltime),
+                          ('zk1', '10.0.0.5', 'sent', 121.0, self.cltime)])
+        self.assertEqual(len(self.rows['t_zk_conn_metrics']), 9)
+        self.assertEqual(self.rows['t_zk_conn_metrics'][-1][1], '0:0:0:0:0:0:0:1')
+        #Zxid and Mode are not numeric
+        self.assertEqual(self.getmtrx.mtrx['warning'], 2)
+
+    def test_stat_aggclients(self):
+        """ The client metrics are summed per client host, with the connections count """
+        self.getmtrx._ins_zk_stat(_STAT, self.cltime, True)
+        rows = [row[1:4] for row in self.rows['t_zk_conn_metrics']]
+        self.assertEqual(rows, [('10.0.0.5', 'connections', 2.0), ('10.0.0.5', 'queued', 1.0),
+                                ('10.0.0.5', 'recved', 150.0), ('10.0.0.5', 'sent', 151.0),
+                                ('0:0:0:0:0:0:0:1', 'connections', 1.0), ('0:0:0:0:0:0:0:1', 'queued', 0.0),
+                                ('0:0:0:0:0:0:0:1', 'recved', 1.0), ('0:0:0:0:0:0:0:1', 'sent', 0.0)])
+
+    def test_cons(self):
+        """ The numeric metrics of each connection, the session id and last operation ignored """
+        self.getmtrx._ins_zk_stat(_CONS, self.cltime)
+        self.assertNotIn('t_zk_metrics', self.rows)
+        conns = list(self.rows['t_zk_conn_metrics'])
+        self.assertEqual([row[2] for row in conns if row[1] == '10.0.0.6'],
+                         ['queued', 'recved', 'sent', 'est', 'to', 'lresp', 'llat', 'minlat', 'avglat',
+                          'maxlat'])
+        self.assertEqual(self._values('t_zk_conn_metrics')['to'], 40000.0)
+        self.getmtrx._ins_zk_stat(_CONS, self.cltime, True)
+        self.assertEqual([row[1:4] for row in self.rows['t_zk_conn_metrics'][len(conns):]
+                          if row[2] in ('connections', 'maxlat')],
+                         [('10.0.0.5', 'connections', 1.0), ('10.0.0.5', 'maxlat', 2.0),
+                          ('10.0.0.6', 'connections', 1.0), ('10.0.0.6', 'maxlat', 3.0)])
+
+    def test_stat_malformed(self):
+        """ Malformed lines are skipped, the other metrics are kept """
+        resp = ('Clients:\n'
+                ' /10.0.0.5:52066[1](queued=0,recved,sent=x)\n'
+                'Latency min/avg/max: 0/n/a\n'
+                'garbage\n'
+                'Received: many\n'
+                ': 5\n'
+                'Sent: 7\n')
+        self.getmtrx._ins_zk_stat(resp, self.cltime)
+        self.assertEqual(self._values('t_zk_metrics'), {'min_latency': 0.0, 'Sent': 7.0})
+        self.assertEqual(set(row[1] for row in self.rows['t_zk_metrics']), {''})
+        self.assertEqual(self._values('t_zk_conn_metrics'), {'queued': 0.0})
+
+    def test_mntr(self):
+        """ A row per numeric metric, the mode from the server state """
+        self.getmtrx._ins_zk_mntr(_MNTR, self.cltime)
+        self.assertEqual(self._values('t_zk_metrics'),
+                         {'zk_avg_latency': 0.0, 'zk_max_latency': 16.0, 'zk_packets_received': 151.0,
+                          'zk_outstanding_requests': 0.0, 'zk_znode_count': 42.0, 'zk_followers': 2.0})
+        self.assertEqual(set(row[1] for row in self.rows['t_zk_metrics']), {'l'})
+
+    def test_mntr_malformed(self):
+        """ Lines without a tab or a numeric value are skipped, standalone without a server state """
+        resp = 'zk_avg_latency 0\nzk_max_latency\tx\n\nzk_znode_count\t42\t\n'
+        self.getmtrx._ins_zk_mntr(resp, self.cltime)
+        self.assertEqual(self.rows['t_zk_metrics'], [('zk1', 's', 'zk_znode_count', 42.0, self.cltime)])
+
+if __name__ == '__main__':
+    unittest.main()